@@ -31,10 +31,17 @@ CREATE TABLE `batches` (
   `success_rate` decimal(5,2) DEFAULT 0.00,
   `status` varchar(20) DEFAULT 'pending' CHECK (`status` in ('pending','completed','partial')),
   `initiated_by` varchar(100) DEFAULT NULL,
+  `pending_count` int(11) NOT NULL DEFAULT 0,
+  `validated_count` int(11) NOT NULL DEFAULT 0,
+  `processing_count` int(11) NOT NULL DEFAULT 0,
+  `success_count` int(11) NOT NULL DEFAULT 0,
+  `failed_count` int(11) NOT NULL DEFAULT 0,
   `created_at` timestamp NULL DEFAULT current_timestamp(),
   `updated_at` timestamp NULL DEFAULT current_timestamp(),
   PRIMARY KEY (`id`),
-  UNIQUE KEY `batch_code` (`batch_code`)
+  UNIQUE KEY `batch_code` (`batch_code`),
+  KEY `idx_batches_created` (`created_at`,`id`),
+  KEY `idx_batches_status_created` (`status`,`created_at`,`id`)
 ) ENGINE=InnoDB AUTO_INCREMENT=5 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -63,6 +70,9 @@ CREATE TABLE `pensioners` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `unique_id` (`unique_id`),
   KEY `fk_pensioners_batch` (`batch_id`),
+  KEY `idx_pensioners_created` (`created_at`,`id`),
+  KEY `idx_pensioners_status_created` (`status`,`created_at`,`id`),
+  KEY `idx_pensioners_batch_created` (`batch_id`,`created_at`,`id`),
   CONSTRAINT `fk_pensioners_batch` FOREIGN KEY (`batch_id`) REFERENCES `batches` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB AUTO_INCREMENT=13 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
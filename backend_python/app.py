@@ -3,6 +3,8 @@ from flask_cors import CORS
 from config import Config
 from routes.routes import routes
 from cloudinary_config import config_cloudinary
+from ingestion_jobs import get_ingestion_jobs
+from receipt_uploads import get_upload_jobs
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -13,9 +15,18 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 # Charger la config Cloudinary, même sur Vercel
 config_cloudinary()  # <= TU DOIS LE METTRE HORS du if __name__ == '__main__'
 
+# Rendre au pool la connexion MySQL de chaque requête
+app.teardown_appcontext(Config.close_request_connection)
+
 # Enregistrer les routes d'authentification
 app.register_blueprint(routes, url_prefix='/')
 
+# Reprendre les imports CSV interrompus par un redémarrage
+get_ingestion_jobs()
+
+# Reprendre les envois de reçus vers Cloudinary interrompus (après config_cloudinary)
+get_upload_jobs()
+
 # En local uniquement, lancer le serveur
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,354 @@
+# batch_diff.py
+"""
+Import différentiel d'un fichier de paiement par rapport à un lot de
+référence, en général celui du mois précédent.
+
+Chaque ligne est identifiée par son unique_id (ou type_id-msisdn) et résumée
+par une empreinte 64 bits de son contenu (pandas.util.hash_pandas_object).
+La comparaison avec les empreintes du lot de référence classe les lignes du
+fichier en ajoutées, modifiées ou inchangées ; les lignes du lot absentes du
+fichier sont supprimées. Seules les lignes ajoutées ou modifiées sont
+validées (CsvValidator) ; les lignes inchangées sont recopiées telles quelles
+depuis le segment de référence, par plages d'octets contiguës.
+
+Seul le magasin de lots (sink "json") est écrit. Pour un lot de la table
+pensioners (sink "db"), la comparaison n'est faite qu'en simulation
+(`dry_run`) : unique_id y étant unique, un pensionné n'appartient qu'à un lot,
+et reprendre ses lignes dans un nouveau lot viderait le lot de référence et
+effacerait l'historique de ses paiements (home_transaction_id).
+
+Repassent aussi par la validation : les lignes inchangées mais refusées (ou
+avec un reçu) dans la référence, les clés absentes ou en double, et toutes
+les lignes si les colonnes ont changé. Le contrôle des doubles paiements
+(beneficiary_index.PaymentCheck) porte sur toutes les lignes.
+
+Les empreintes d'un lot du magasin sont calculées à la première comparaison
+puis gardées à côté de son segment (<segment>.fingerprints.npz) ; celles d'un
+lot produit par un import différentiel sont écrites aussitôt.
+"""
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from batch_store import get_store
+from beneficiary_index import identity_hashes, salt_keys
+from ingestion import build_participants, open_csv, read_csv_options
+from models.batch_model import Batch
+from models.pensioner_model import Pensioner
+from validation import CsvValidator, identity_columns, key_hashes
+
+FINGERPRINT_SUFFIX = ".fingerprints.npz"
+# Champs ajoutés par l'import à chaque participant (ingestion.build_participants)
+_PARTICIPANT_FIELDS = ("status", "receipt", "errors")
+# Forme comparée d'une ligne pour un lot de la table pensioners (ingestion.to_pensioner_row)
+_PENSIONER_FIELDS = ("unique_id", "first_name", "last_name", "type_id", "msisdn", "amount", "currency", "comment")
+_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+class DiffSinkError(Exception):
+    """Import différentiel demandé vers la table pensioners hors simulation (dry_run)."""
+
+
+def _row_hashes(frame):
+    """Empreinte du contenu de chaque ligne (valeurs dans l'ordre des colonnes)."""
+    if frame.empty:
+        return np.zeros(len(frame), dtype=np.uint64)
+    return pd.util.hash_pandas_object(frame, index=False, categorize=False).to_numpy()
+
+
+def _line_bounds(path):
+    """(débuts, fins) des lignes non vides d'un fichier JSONL, saut de ligne compris dans la fin."""
+    size = os.path.getsize(path)
+    data = np.memmap(path, dtype=np.uint8, mode="r") if size else np.empty(0, dtype=np.uint8)
+    ends = [np.flatnonzero(data[start:start + _BLOCK_BYTES] == 10) + start + 1 for start in range(0, size, _BLOCK_BYTES)]
+    ends = np.concatenate(ends) if ends else np.empty(0, dtype=np.int64)
+    if size and data[-1] != 10:
+        ends = np.append(ends, size)
+    starts = np.concatenate(([0], ends[:-1])).astype(np.int64)
+    keep = ends - starts > 1
+    return starts[keep], ends[keep].astype(np.int64)
+
+
+def _save(path, fingerprint):
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp.npz"
+    np.savez(temporary, columns=np.array(fingerprint["columns"], dtype=str),
+             **{name: value for name, value in fingerprint.items() if name != "columns"})
+    os.replace(temporary, path)
+
+
+def _load(path):
+    with np.load(path) as data:
+        fingerprint = {name: data[name] for name in data.files}
+    fingerprint["columns"] = fingerprint["columns"].tolist()
+    return fingerprint
+
+
+def _read_segment(path):
+    """Participants d'un segment en DataFrame : lecteur JSON de pyarrow, ou ligne à ligne si les types varient."""
+    try:
+        return pd.read_json(path, lines=True, engine="pyarrow", dtype_backend="pyarrow")
+    except (ImportError, ValueError):
+        with open(path, "r", encoding="utf-8") as f:
+            return pd.DataFrame.from_records([json.loads(line) for line in f if line.strip()])
+
+
+def store_fingerprint(store, batch_id):
+    """Empreintes d'un lot du magasin (calculées puis gardées à côté du segment), ou None si le lot n'existe pas.
+
+    Retourne {"columns", "keys", "present", "rows", "clonable", "starts", "ends"}.
+    """
+    path = store.segment_path(batch_id)
+    if path is None:
+        return None
+    cache = path + FINGERPRINT_SUFFIX
+    if os.path.exists(cache):
+        return _load(cache)
+
+    starts, ends = _line_bounds(path)
+    frame = _read_segment(path) if len(starts) else pd.DataFrame()
+    if len(frame) != len(starts):
+        raise ValueError(f"Segment illisible : {batch_id}")
+    columns = [str(column) for column in frame.columns if column not in _PARTICIPANT_FIELDS]
+    data = frame[columns].astype(object).astype(str).where(frame[columns].notna(), None) if columns else frame
+    # Recopiables : lignes valides, sans reçu et sans valeur manquante
+    clonable = np.ones(len(frame), dtype=bool)
+    clonable &= (frame["status"] == "valide").to_numpy(dtype=bool) if "status" in frame else False
+    if "receipt" in frame:
+        clonable &= frame["receipt"].isna().to_numpy(dtype=bool)
+    if columns:
+        clonable &= data.notna().all(axis=1).to_numpy(dtype=bool)
+    hashes, present = identity_hashes(data.fillna(""))
+    fingerprint = {"columns": columns, "keys": hashes[:, 0], "present": present[:, 0],
+                   "rows": _row_hashes(data.fillna("")), "clonable": clonable, "starts": starts, "ends": ends}
+    _save(cache, fingerprint)
+    return fingerprint
+
+
+def _pensioner_text(frame, unique_id):
+    """Lignes sous la forme de la table pensioners (ingestion.to_pensioner_row), en texte comparable."""
+    def column(*names):
+        for name in names:
+            if name in frame:
+                return frame[name].fillna("").astype(str).str.strip()
+        return pd.Series("", index=frame.index, dtype=object)
+
+    names = column("nom_complet").str.split(n=1, expand=True).reindex(columns=[0, 1]).fillna("")
+    first_name, last_name = column("first_name"), column("last_name")
+    amount = column("amount", "montant").str.replace(",", ".", regex=False)
+    numbers = pd.to_numeric(amount, errors="coerce")
+    currency = column("currency", "devise")
+    return pd.DataFrame({
+        "unique_id": unique_id.to_numpy(dtype=object),
+        "first_name": first_name.where(first_name != "", names[0]),
+        "last_name": last_name.where(last_name != "", names[1]),
+        "type_id": column("type_id"),
+        "msisdn": column("msisdn", "valeur_id"),
+        "amount": numbers.map("{:.2f}".format).where(numbers.notna(), amount),
+        "currency": currency.where(currency != "", "XOF"),
+        "comment": column("comment"),
+    }, columns=list(_PENSIONER_FIELDS), index=frame.index)
+
+
+def db_fingerprint(batch):
+    """Empreintes des pensionnés d'un lot de la table batches, dans la forme de _pensioner_text."""
+    rows = [tuple(getattr(pensioner, field) for field in _PENSIONER_FIELDS)
+            for pensioner in Batch.get_batch_with_pensioners(batch_id=batch.id) if isinstance(pensioner, Pensioner)]
+    frame = pd.DataFrame(rows, columns=list(_PENSIONER_FIELDS))
+    text = frame.astype(object).where(frame.notna(), "")
+    text = text.astype(str).apply(lambda values: values.str.strip())
+    if len(frame):
+        text["amount"] = frame["amount"].map(lambda amount: "" if amount is None else f"{amount:.2f}")
+    keys, present = key_hashes(text["unique_id"]) if len(frame) else (np.empty(0, np.uint64), np.empty(0, bool))
+    return {"columns": list(_PENSIONER_FIELDS), "keys": keys, "present": present, "rows": _row_hashes(text),
+            # Lignes validées à leur insertion (comparaison seulement : pas d'écriture différentielle en base)
+            "clonable": np.ones(len(frame), dtype=bool), "unique_ids": text["unique_id"].to_numpy(dtype=object)}
+
+
+def _sorted_keys(keys, present):
+    """Tri des clés : (ordre, clés triées, masque des clés renseignées et sans doublon, dans l'ordre d'origine)."""
+    order = np.argsort(keys, kind="stable")
+    ordered = keys[order]
+    repeated = np.zeros(len(keys), dtype=bool)
+    if len(keys) > 1:
+        same = ordered[1:] == ordered[:-1]
+        repeated[1:] |= same
+        repeated[:-1] |= same
+    unique = np.empty(len(keys), dtype=bool)
+    unique[order] = ~repeated
+    return order, ordered, unique & present
+
+
+def compare(new, reference):
+    """Compare les empreintes du fichier (`new`) à celles du lot de référence.
+
+    Retourne (position dans la référence de chaque ligne du fichier, -1 si
+    ajoutée ; masque des lignes modifiées ; masque des lignes inchangées ;
+    nombre de lignes supprimées). Une clé absente ou en double d'un côté ne
+    correspond à aucune ligne de l'autre : la ligne est comptée ajoutée.
+    Les deux côtés sont triés une fois : les recherches dichotomiques se font
+    dans l'ordre, sans accès aléatoires.
+    """
+    keys, present = new["keys"], new["present"]
+    ref_keys, ref_present = reference["keys"], reference["present"]
+    order, ordered, new_unique = _sorted_keys(keys, present)
+    ref_order, ref_ordered, ref_unique = _sorted_keys(ref_keys, ref_present)
+
+    ref_index = np.full(len(keys), -1, dtype=np.int64)
+    if len(ref_keys) and len(keys):
+        positions = np.searchsorted(ref_ordered, ordered).clip(max=len(ref_keys) - 1)
+        candidates = ref_order[positions]
+        hit = (ref_ordered[positions] == ordered) & new_unique[order] & ref_unique[candidates]
+        ref_index[order[hit]] = candidates[hit]
+    matched = ref_index >= 0
+    unchanged = matched.copy()
+    if new["columns"] != reference["columns"]:
+        unchanged[:] = False
+    else:
+        unchanged[matched] = new["rows"][matched] == reference["rows"][ref_index[matched]]
+
+    # Supprimées : lignes de la référence dont la clé n'est plus dans le fichier (ou sans clé)
+    kept = np.zeros(len(ref_keys), dtype=bool)
+    present_ordered = ordered[present[order]]
+    if len(present_ordered) and len(ref_keys):
+        positions = np.searchsorted(present_ordered, ref_ordered).clip(max=len(present_ordered) - 1)
+        kept[ref_order] = present_ordered[positions] == ref_ordered
+    removed = int(np.count_nonzero(~(ref_present & kept)))
+    return ref_index, matched & ~unchanged, unchanged, removed
+
+
+def read_upload(stream):
+    """Lit en entier le CSV binaire `stream`. Retourne (format détecté, DataFrame de texte)."""
+    csv_format, stream = open_csv(stream)
+    try:
+        frame = pd.read_csv(stream, dtype=str, keep_default_na=False, index_col=False, **read_csv_options(csv_format))
+    except pd.errors.EmptyDataError:
+        return csv_format, pd.DataFrame()
+    return csv_format, frame.fillna("")
+
+
+class BatchDiff:
+    """Fichier comparé à un lot de référence : classement des lignes, validation du seul delta, écriture du lot."""
+
+    def __init__(self, frame, reference, pensioner_form=False):
+        self.frame = frame
+        self.reference = reference
+        self.identity, self.identity_present = identity_hashes(frame)
+        self.fingerprint = {"columns": [str(column) for column in frame.columns], "keys": self.identity[:, 0],
+                            "present": self.identity_present[:, 0]}
+        if pensioner_form:
+            # Comparaison avec la table pensioners : lignes mises sous la forme de to_pensioner_row
+            unique_id = identity_columns(CsvValidator._text(frame))[2] if len(frame) else pd.Series(dtype=object)
+            if unique_id is None:
+                unique_id = pd.Series("", index=frame.index, dtype=object)
+            self.fingerprint.update(columns=list(_PENSIONER_FIELDS), rows=_row_hashes(_pensioner_text(frame, unique_id)))
+        else:
+            self.fingerprint["rows"] = _row_hashes(frame)
+        self.ref_index, self.changed, self.unchanged, self.removed = compare(self.fingerprint, reference)
+        # Lignes reprises sans validation : inchangées et recopiables dans la référence
+        self.clone = self.unchanged.copy()
+        self.clone[self.unchanged] = reference["clonable"][self.ref_index[self.unchanged]]
+        self.masks = None
+
+    def summary(self):
+        return {
+            "added": int(np.count_nonzero(self.ref_index < 0)),
+            "changed": int(np.count_nonzero(self.changed)),
+            "unchanged": int(np.count_nonzero(self.unchanged)),
+            "removed": self.removed,
+            "revalidated": int(len(self.frame) - np.count_nonzero(self.clone)),
+        }
+
+    def validate(self, payments=None):
+        """Masques d'erreurs de toutes les lignes : delta validé, lignes reprises valides, doubles paiements sur tout."""
+        masks = np.zeros(len(self.frame), dtype=np.uint8)
+        delta = ~self.clone
+        if delta.any():
+            masks[delta] = CsvValidator().validate(self.frame[delta])
+        if payments is not None:
+            masks = payments.apply(masks, *salt_keys(self.identity, self.identity_present, payments.period))
+        self.masks = masks
+        return masks
+
+    def write_segment(self, path, reference_path):
+        """Écrit le lot en JSONL dans `path`, en recopiant depuis `reference_path` les lignes reprises restées valides."""
+        copy = self.clone & (self.masks == 0)
+        serialized = np.flatnonzero(~copy)
+        lines = [json.dumps(participant, ensure_ascii=False) + "\n"
+                 for participant in build_participants(self.frame.iloc[serialized], self.masks[serialized].tolist())]
+
+        # Lignes consécutives dans le fichier et dans la référence : une seule copie par plage
+        starts, ends = self.reference["starts"], self.reference["ends"]
+        source = self.ref_index
+        follows = np.zeros(len(copy), dtype=bool)
+        if copy.any():
+            follows[1:] = copy[1:] & copy[:-1] & (starts[source[1:]] == ends[source[:-1]])
+        run_starts = np.flatnonzero(copy & ~follows)
+        run_ends = np.flatnonzero(copy & ~np.append(follows[1:], False))
+
+        events = sorted([(position, "line", index) for index, position in enumerate(serialized.tolist())] +
+                        [(first, "run", last) for first, last in zip(run_starts.tolist(), run_ends.tolist())])
+        size = os.path.getsize(reference_path)
+        with open(reference_path, "rb") as reference, open(path, "wb") as out:
+            data = np.memmap(reference, dtype=np.uint8, mode="r") if size else None
+            for position, kind, value in events:
+                if kind == "line":
+                    out.write(lines[value].encode("utf-8"))
+                else:
+                    out.write(data[starts[source[position]]:ends[source[value]]].tobytes())
+            out.flush()
+            os.fsync(out.fileno())
+
+    def store_fingerprint(self, path):
+        """Empreintes du lot écrit dans `path`, gardées pour le prochain import différentiel."""
+        starts, ends = _line_bounds(path)
+        _save(path + FINGERPRINT_SUFFIX, dict(self.fingerprint, clonable=self.masks == 0, starts=starts, ends=ends))
+
+
+def ingest_diff(stream, sink, reference, payments=None, dry_run=False):
+    """Import différentiel du CSV binaire `stream` contre le lot `reference`.
+
+    `sink` : "json" (reference = batchId du magasin) ou "db" (reference =
+    batch_code de la table batches, avec `dry_run` seulement). Retourne
+    (format, résumé de la comparaison, statistiques, résultat du lot) ;
+    résultat None pour un fichier vide ou avec `dry_run` (comparaison et
+    validation seulement). Lève LookupError si le lot de référence n'existe
+    pas, DiffSinkError pour sink "db" sans `dry_run`.
+    """
+    if sink == "db" and not dry_run:
+        raise DiffSinkError("L'import différentiel n'écrit que dans le magasin de lots (sink=json) ; "
+                            "contre un lot de la base, seule la simulation (dry_run) est possible")
+    store = get_store() if sink == "json" else None
+    if sink == "json":
+        fingerprint = store_fingerprint(store, reference)
+    else:
+        reference_batch = Batch.get_by_batch_code(reference)
+        fingerprint = db_fingerprint(reference_batch) if reference_batch else None
+    if fingerprint is None:
+        raise LookupError(f"Lot de référence introuvable : {reference}")
+
+    csv_format, frame = read_upload(stream)
+    diff = BatchDiff(frame, fingerprint, pensioner_form=sink == "db")
+    masks = diff.validate(payments)
+    refused = int(np.count_nonzero(masks))
+    stats = {"total": len(masks), "valid": len(masks) - refused, "refused": refused}
+    if dry_run or frame.empty:
+        return csv_format, diff.summary(), stats, None
+
+    path = os.path.join(store.segments_dir, f".tmp-{uuid.uuid4().hex}")
+    try:
+        diff.write_segment(path, store.segment_path(reference))
+        entry = store.add_segment(path, stats["total"], stats["valid"], reference=reference)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    segment_path = store.segment_path(entry["batchId"])
+    diff.store_fingerprint(segment_path)
+    return csv_format, diff.summary(), stats, {
+        "batchId": entry["batchId"],
+        "participants_added": entry["participants"],
+        "total_batches": entry["total_batches"],
+        "file_saved": segment_path
+    }
@@ -0,0 +1,320 @@
+# batch_store.py
+"""
+Stockage des lots importés depuis les CSV, en remplacement du fichier unique
+data.json.
+
+Organisation du répertoire (Config.BATCH_STORE_DIR) :
+- segments/<batchId>.jsonl : un participant JSON par ligne, écrit une fois.
+  Un segment réécrit (URL des reçus, receipt_uploads.py) prend un nouveau
+  nom <batchId>-<suffixe>.jsonl, enregistré dans l'index (replace_segment) ;
+- segments/<batchId>.jsonl.fingerprints.npz : empreintes des lignes d'un lot
+  pour l'import différentiel (batch_diff.py), créées à la première comparaison ;
+- summaries/<batchId>.pdf : récapitulatif PDF d'un lot (batch_summary.py),
+  dont le chemin est enregistré dans summary_pdf ;
+- index.jsonl : journal en ajout seul, une ligne de métadonnées par lot
+  (batchId, date, segment, nombre de participants, summary_pdf...). Une ligne
+  plus récente pour le même batchId remplace la précédente ;
+- .lock : verrou de fichier (fcntl.flock) pris pour chaque écriture dans l'index.
+
+Ajouter un lot coûte O(taille du lot) ; lire un lot ne lit que son segment.
+L'index est gardé en mémoire et relu de façon incrémentale (seules les lignes
+ajoutées depuis la dernière lecture sont analysées). Pour la pagination, la
+position de chaque ligne d'un segment (par statut) est calculée à la première
+lecture du lot et gardée dans un petit cache LRU.
+"""
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from array import array
+from contextlib import contextmanager
+from datetime import datetime
+
+from cache import ReadThroughCache
+from config import Config
+
+_UNSAFE_SEGMENT_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+# Clé "status" d'un participant sérialisé : les guillemets d'une valeur seraient échappés
+_STATUS_KEY = b'"status": "'
+
+
+def _index_lines(path):
+    """Positions des lignes d'un segment : {None: toutes, statut: lignes de ce statut}."""
+    offsets = {None: array("Q")}
+    position = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                offsets[None].append(position)
+                start = line.rfind(_STATUS_KEY)
+                if start >= 0:
+                    start += len(_STATUS_KEY)
+                    status = line[start:line.index(b'"', start)].decode("utf-8")
+                    offsets.setdefault(status, array("Q")).append(position)
+            position += len(line)
+    return offsets
+
+
+class BatchStore:
+    """Lots stockés en segments JSONL avec un index batchId -> métadonnées."""
+
+    def __init__(self, root):
+        self.root = root
+        self.segments_dir = os.path.join(root, "segments")
+        self.index_path = os.path.join(root, "index.jsonl")
+        self._lock_path = os.path.join(root, ".lock")
+        os.makedirs(self.segments_dir, exist_ok=True)
+
+        self._index = {}  # batchId -> métadonnées, dans l'ordre d'ajout
+        self._index_inode = None
+        self._index_offset = 0
+        self._index_lock = threading.Lock()
+        self._line_indexes = ReadThroughCache("batch_store", maxsize=32, ttl=3600)
+
+    @contextmanager
+    def _locked(self):
+        """Verrou exclusif entre processus et threads (un descripteur par prise)."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        """Relit les lignes ajoutées à l'index depuis la dernière lecture."""
+        with self._index_lock:
+            try:
+                stat = os.stat(self.index_path)
+            except FileNotFoundError:
+                self._index, self._index_inode, self._index_offset = {}, None, 0
+                return
+            if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+                self._index, self._index_inode, self._index_offset = {}, stat.st_ino, 0
+            if stat.st_size == self._index_offset:
+                return
+
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_offset)
+                data = f.read(stat.st_size - self._index_offset)
+            # Une ligne en cours d'écriture par un autre processus sera lue la fois suivante
+            complete = data.rfind(b"\n") + 1
+            for line in data[:complete].splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    self._index[entry["batchId"]] = {**self._index.get(entry["batchId"], {}), **entry}
+            self._index_offset += complete
+
+    def _append_index(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def version(self):
+        """Identifiant de version de l'index (change à chaque ajout ou mise à jour de lot)."""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return (0, 0, 0)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def batches(self):
+        """Retourne les métadonnées de tous les lots, dans l'ordre d'ajout."""
+        self._refresh_index()
+        return list(self._index.values())
+
+    def get(self, batch_id):
+        """Retourne les métadonnées d'un lot, ou None."""
+        self._refresh_index()
+        return self._index.get(batch_id)
+
+    def segment_path(self, batch_id):
+        entry = self.get(batch_id)
+        return os.path.join(self.segments_dir, entry["segment"]) if entry else None
+
+    def iter_raw_participants(self, batch_id):
+        """Générateur : lignes JSON brutes (str) des participants d'un lot, sans les analyser."""
+        path = self.segment_path(batch_id)
+        if path is None:
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line:
+                    yield line
+
+    def participant_page(self, batch_id, status=None, offset=0, limit=100):
+        """Page de participants d'un lot : (nombre total correspondant, lignes JSON brutes), ou None.
+
+        Seules les lignes de la page sont lues dans le segment.
+        """
+        path = self.segment_path(batch_id)
+        if path is None:
+            return None
+        key = f"{path}:{os.stat(path).st_mtime_ns}"
+        offsets = self._line_indexes.fetch(key, lambda: _index_lines(path), lambda value: (key,))
+        selected = offsets.get(status, array("Q")) if status is not None else offsets[None]
+
+        lines = []
+        with open(path, "rb") as f:
+            for position in selected[offset:offset + limit]:
+                f.seek(position)
+                lines.append(f.readline().rstrip(b"\n").decode("utf-8"))
+        return len(selected), lines
+
+    def iter_participants(self, batch_id):
+        """Générateur : participants (dicts) d'un lot."""
+        return map(json.loads, self.iter_raw_participants(batch_id))
+
+    def append_batch(self, participants, batch_id=None, date=None, summary_pdf=None):
+        """Ajoute un lot à partir d'un itérable de participants. Retourne ses métadonnées.
+
+        Le segment est écrit hors verrou dans un fichier temporaire puis
+        adopté par add_segment. Sans `batch_id`, il vaut "<AAAAMMJJ>_<compteur du jour>".
+        """
+        part_path = os.path.join(self.segments_dir, f".tmp-{uuid.uuid4().hex}")
+        count = valid = 0
+        try:
+            with open(part_path, "w", encoding="utf-8") as part:
+                for participant in participants:
+                    part.write(json.dumps(participant, ensure_ascii=False) + "\n")
+                    count += 1
+                    valid += participant.get("status") == "valide"
+                part.flush()
+                os.fsync(part.fileno())
+            return self.add_segment(part_path, count, valid, batch_id, date, summary_pdf)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def add_segment(self, path, count, valid, batch_id=None, date=None, summary_pdf=None, **metadata):
+        """Ajoute comme nouveau lot un segment JSONL déjà écrit (`count` participants dont `valid` valides).
+
+        Le fichier est déplacé dans le magasin. Seuls le choix du batchId, le
+        renommage du segment et la ligne d'index sont faits sous verrou.
+        `metadata` est recopié dans la ligne d'index. Retourne les métadonnées du lot.
+        """
+        now = datetime.now()
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.segments_dir):
+            # Autre répertoire (peut-être un autre système de fichiers) : copie hors verrou
+            moved = os.path.join(self.segments_dir, f".tmp-{uuid.uuid4().hex}")
+            shutil.move(path, moved)
+            path = moved
+
+        try:
+            with self._locked():
+                self._refresh_index()
+                if batch_id is None:
+                    date_str = now.strftime("%Y%m%d")
+                    batch_count = sum(1 for existing in self._index if existing.startswith(date_str)) + 1
+                    batch_id = f"{date_str}_{batch_count:03d}"
+                    while batch_id in self._index:
+                        batch_count += 1
+                        batch_id = f"{date_str}_{batch_count:03d}"
+                elif batch_id in self._index:
+                    raise ValueError(f"Lot déjà existant : {batch_id}")
+
+                segment = _UNSAFE_SEGMENT_CHARS.sub("_", batch_id) + ".jsonl"
+                if os.path.exists(os.path.join(self.segments_dir, segment)):
+                    segment = f"{segment[:-6]}-{uuid.uuid4().hex[:8]}.jsonl"
+                os.replace(path, os.path.join(self.segments_dir, segment))
+                entry = {
+                    "batchId": batch_id,
+                    "date": date or now.isoformat(),
+                    "segment": segment,
+                    "participants": count,
+                    "valid": valid,
+                    "refused": count - valid,
+                    "summary_pdf": summary_pdf,
+                    **metadata
+                }
+                self._append_index(entry)
+        finally:
+            if os.path.basename(path).startswith(".tmp-") and os.path.exists(path):
+                os.remove(path)
+        self._refresh_index()
+        return dict(entry, total_batches=len(self._index))
+
+    def update(self, batch_id, **fields):
+        """Met à jour des métadonnées d'un lot (ex. summary_pdf) par une ligne d'index ajoutée."""
+        with self._locked():
+            self._refresh_index()
+            if batch_id not in self._index:
+                return False
+            self._append_index({"batchId": batch_id, **fields})
+        self._refresh_index()
+        return True
+
+    def replace_segment(self, batch_id, path, expected=None):
+        """Remplace le segment d'un lot par le fichier JSONL `path` (mêmes participants, mêmes lignes).
+
+        Le fichier est déplacé dans le magasin sous un nouveau nom ; l'ancien
+        segment et ses fichiers associés (empreintes) sont supprimés. Lève
+        LookupError si le lot n'existe pas, RuntimeError si son segment n'est
+        plus `expected`. Retourne le nom du nouveau segment.
+        """
+        with self._locked():
+            self._refresh_index()
+            entry = self._index.get(batch_id)
+            if entry is None:
+                raise LookupError(f"Lot non trouvé : {batch_id}")
+            old = entry["segment"]
+            if expected is not None and old != expected:
+                raise RuntimeError(f"Segment du lot {batch_id} modifié entre-temps")
+            segment = f"{_UNSAFE_SEGMENT_CHARS.sub('_', batch_id)}-{uuid.uuid4().hex[:8]}.jsonl"
+            os.replace(path, os.path.join(self.segments_dir, segment))
+            self._append_index({"batchId": batch_id, "segment": segment})
+        self._refresh_index()
+        for name in os.listdir(self.segments_dir):
+            if name == old or name.startswith(old + "."):
+                try:
+                    os.remove(os.path.join(self.segments_dir, name))
+                except FileNotFoundError:
+                    pass
+        return segment
+
+    def migrate_from_json(self, path):
+        """Importe les lots d'un ancien data.json (tableau JSON). Retourne le nombre de lots importés.
+
+        Les lots déjà présents (même batchId) sont ignorés : la migration peut être relancée.
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+
+        migrated = 0
+        for batch in legacy:
+            if self.get(batch.get("batchId")) is not None:
+                continue
+            try:
+                self.append_batch(batch.get("participants") or [], batch.get("batchId"), batch.get("date"),
+                                  batch.get("summary_pdf"))
+            except ValueError:
+                # Migré entre-temps par un autre processus
+                continue
+            migrated += 1
+        return migrated
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Retourne le magasin de lots du processus, créé (et migré depuis data.json) à la première demande."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = BatchStore(Config.BATCH_STORE_DIR)
+            if not os.path.exists(store.index_path):
+                store.migrate_from_json(Config.DATA_FILE)
+            _store = store
+        return _store
@@ -0,0 +1,445 @@
+# batch_summary.py
+"""
+Récapitulatif PDF d'un lot du magasin de lots (champ summary_pdf de son
+index) : une page de totaux (participants, valides/refusés, montants, motifs
+de refus, répartition par FSP) puis le tableau paginé des participants, dans
+le style des reçus (models/BatchSummaryPDF.py).
+
+Un lot peut compter des centaines de milliers de participants : le document
+n'est pas construit par fpdf2, qui garde toutes les pages en mémoire jusqu'à
+la sortie et met chaque cellule en page une à une. La page de tableau est mise
+en page une fois par processus avec des marqueurs (SummaryTemplate), puis
+chaque page est remplie, compressée et écrite dès qu'elle est complète
+(SummaryWriter) : seuls les décalages des objets déjà écrits et les totaux
+restent en mémoire. Si le modèle ne passe pas sa vérification au démarrage
+(autre version de fpdf2), le document est construit par fpdf2. La page de totaux, connue à la fin de la lecture, est
+écrite en dernier mais placée en tête du document (ordre de l'arbre des pages).
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+import fpdf
+
+try:
+    from fpdf.util import escape_parens
+except ImportError:
+    # Autre version de fpdf2 : pas de modèle précompilé, le document est construit par fpdf2
+    escape_parens = None
+
+from batch_store import get_store
+from models.BatchSummaryPDF import BatchSummaryPDF
+
+_OBJECT = re.compile(rb"(\d+) 0 obj\n(.*?)\nendobj\n", re.S)
+_REFERENCE = re.compile(rb"(\d+) 0 R")
+_MARKER = re.compile(r"@@(\w+)@@")
+_CONTROL_CHARS = re.compile(r"[\x00-\x1f\x7f-\x9f]")
+
+# Colonnes des participants (fichier de paiement ou table pensioners) portant le FSP du bénéficiaire
+FSP_FIELDS = ("fsp_id", "fspId", "payee_fsp_id", "fsp")
+NO_FSP = "Non renseigné"
+
+
+def _single_page(document):
+    """Page d'un document fpdf2 d'une page, non compressé : (contenu, ressources, polices, MediaBox)."""
+    objects = {int(number): body for number, body in _OBJECT.findall(document)}
+    page = next(body for body in objects.values() if b"/Type /Page\n" in body)
+    pages = next(body for body in objects.values() if b"/Type /Pages\n" in body)
+    contents = objects[int(re.search(rb"/Contents (\d+) 0 R", page).group(1))]
+    resources = objects[int(re.search(rb"/Resources (\d+) 0 R", page).group(1))]
+    content = contents[contents.index(b"stream\n") + len(b"stream\n"):contents.rindex(b"\nendstream")]
+    fonts = {int(number): objects[int(number)] for number in _REFERENCE.findall(resources)}
+    return content, resources, fonts, re.search(rb"/MediaBox \[[^\]]*\]", pages).group(0)
+
+
+def _text(value):
+    """Texte d'une cellule : latin-1 (polices standard du PDF), sans caractère de contrôle."""
+    if value is None:
+        return ""
+    text = value if isinstance(value, str) else str(value)
+    if not text.isascii():
+        text = text.encode("latin-1", "replace").decode("latin-1")
+    if _CONTROL_CHARS.search(text):
+        text = _CONTROL_CHARS.sub(" ", text)
+    return text
+
+
+class TableCells:
+    """Textes des cellules du tableau des participants, tronqués (avec "...") à la largeur de leur colonne."""
+
+    def __init__(self):
+        # Largeur (mm) de chaque caractère latin-1 dans la police des lignes (polices standard :
+        # la largeur d'un texte est la somme de celles de ses caractères), largeur disponible par
+        # colonne, et longueur en deçà de laquelle aucun texte ne peut déborder
+        measure = BatchSummaryPDF()
+        measure.set_font("Helvetica", "", BatchSummaryPDF.TABLE_FONT_SIZE)
+        self._widths = [0.0 if _CONTROL_CHARS.match(chr(code)) else measure.get_string_width(chr(code))
+                        for code in range(256)]
+        self._limits = [width - 2 * measure.c_margin for _, width in BatchSummaryPDF.COLUMNS]
+        self._safe_lengths = [int(limit // max(self._widths)) for limit in self._limits]
+
+    def fit(self, text, column):
+        """`text` tronqué à la largeur de la colonne `column`."""
+        if len(text) > self._safe_lengths[column]:
+            widths = [self._widths[code] for code in text.encode("latin-1")]
+            limit = self._limits[column]
+            if sum(widths) > limit:
+                limit -= 3 * self._widths[ord(".")]
+                width = 0.0
+                for length, char_width in enumerate(widths):
+                    width += char_width
+                    if width > limit:
+                        break
+                text = text[:length] + "..."
+        return text
+
+    def row(self, number, participant):
+        """Cellules de la ligne du participant `participant`, `number`-ième du lot."""
+        get = participant.get
+        name = get("nom_complet") or f"{get('first_name') or ''} {get('last_name') or ''}".strip()
+        values = (number, name, get("type_id"), get("valeur_id") or get("msisdn") or get("unique_id"),
+                  get("montant") or get("amount"), get("devise") or get("currency"), get("status"),
+                  ", ".join(get("errors") or ()))
+        return [self.fit(_text(value), column) for column, value in enumerate(values)]
+
+
+class SummaryTemplate:
+    """
+    Page de tableau des participants précompilée : mise en page par
+    BatchSummaryPDF.add_table_page avec un marqueur par cellule, puis découpée
+    en lignes fixes du flux de contenu et en lignes à remplir.
+
+    Le découpage lit la sortie non compressée de fpdf2 2.8 (version fixée dans
+    requirements.txt). À la compilation, une page d'essai est rendue des deux
+    façons et un récapitulatif d'essai est écrit puis relu : si la compilation
+    échoue, si les flux diffèrent ou si le document relu est incohérent (autre
+    version de fpdf2), get rend None et write_summary construit le document
+    avec fpdf2 (voir _write_with_fpdf).
+    """
+    _template = None
+    _compiled = False
+    _lock = threading.Lock()
+
+    # Lignes d'essai : texte tronqué, parenthèses et barre oblique inverse à échapper, accents, cellule vide
+    _SAMPLE = [
+        {"nom_complet": "Bénéficiaire (essai) " * 4, "type_id": "MSISDN", "valeur_id": "22900000001",
+         "montant": "1234.50", "devise": "XOF", "status": "valide", "errors": []},
+        {"nom_complet": "Ligne \\ refusée", "type_id": "MSISDN", "valeur_id": "abc", "montant": "",
+         "devise": "XOF", "status": "refusé", "errors": ["INVALID_MSISDN", "INVALID_AMOUNT"]},
+    ]
+
+    def __init__(self):
+        columns = len(BatchSummaryPDF.COLUMNS)
+        pdf = BatchSummaryPDF()
+        pdf.set_compression(False)
+        rows = [[f"@@r{row}c{column}@@" for column in range(columns)] for row in range(500)]
+        self.capacity = pdf.add_table_page("@@batch@@", "@@page@@", rows)
+        document = bytes(pdf.output())
+        self.header = document[:document.index(b"1 0 obj\n")]
+        if not self.header.startswith(b"%PDF-") or b" obj" in self.header:
+            raise ValueError("en-tête du document fpdf2 non reconnu")
+        content, self.resources, self.fonts, self.media_box = _single_page(document)
+        self.cells = TableCells()
+
+        # Lignes du flux : texte fixe, ou (marqueur, ligne, colonne, début de ligne, fin de ligne)
+        self._lines = []
+        for line in content.decode("latin-1").split("\n"):
+            match = _MARKER.search(line)
+            if match is None:
+                self._lines.append(line)
+                continue
+            marker = match.group(1)
+            row, column = map(int, marker[1:].split("c")) if marker.startswith("r") else (None, None)
+            self._lines.append((marker, row, column, line[:match.start()], line[match.end():]))
+
+    @classmethod
+    def get(cls):
+        """Modèle du processus courant (compilé et vérifié au premier appel), ou None s'il est indisponible."""
+        if not cls._compiled:
+            with cls._lock:
+                if not cls._compiled:
+                    cls._template = cls._compile()
+                    cls._compiled = True
+        return cls._template
+
+    @classmethod
+    def _compile(cls):
+        """Compile le modèle, compare une page d'essai à celle de fpdf2 et relit un récapitulatif d'essai.
+
+        Retourne None en cas d'écart.
+        """
+        try:
+            if escape_parens is None:
+                raise ImportError("fpdf.util.escape_parens introuvable")
+            template = cls()
+            rows = [template.cells.row(number, participant) for number, participant in enumerate(cls._SAMPLE, 1)]
+            expected = BatchSummaryPDF()
+            expected.set_compression(False)
+            expected.add_table_page("ESSAI (1)", "2", rows)
+            content, resources, fonts, media_box = _single_page(bytes(expected.output()))
+            rendered = template.render("ESSAI (1)", 2, [[escape_parens(text) for text in row] for row in rows])
+            if (rendered, template.resources, template.fonts, template.media_box) != (content, resources, fonts, media_box):
+                raise ValueError("page d'essai différente de celle de BatchSummaryPDF")
+
+            document = io.BytesIO()
+            _write_with_template(template, {"batchId": "ESSAI"}, cls._SAMPLE * template.capacity, document)
+            _check_document(document.getvalue(), pages=3)
+        except Exception as e:
+            print(f"Modèle de récapitulatif précompilé indisponible (fpdf2 {fpdf.__version__}), "
+                  f"document construit par fpdf2 : {e}")
+            return None
+        return template
+
+    def row(self, number, participant):
+        """Cellules (échappées) de la ligne du participant `participant`, `number`-ième du lot."""
+        return [escape_parens(text) for text in self.cells.row(number, participant)]
+
+    def render(self, batch_id, page, rows):
+        """Flux de contenu (octets) d'une page de tableau : `rows` au plus self.capacity lignes de row()."""
+        fixed = {"batch": escape_parens(_text(batch_id)), "page": str(page)}
+        lines = []
+        for line in self._lines:
+            if isinstance(line, str):
+                lines.append(line)
+                continue
+            marker, row, column, before, after = line
+            if row is None:
+                text = fixed[marker]
+            elif row < len(rows):
+                text = rows[row][column]
+            else:
+                continue
+            # fpdf2 n'écrit rien pour une cellule vide
+            if text:
+                lines.append(before + text + after)
+        return "\n".join(lines).encode("latin-1")
+
+
+def _check_document(document, pages):
+    """Relit un document de SummaryWriter : table des objets, arbre des pages et flux. Lève ValueError si incohérent."""
+    xref = document.rindex(b"\nxref\n") + 1
+    lines = document[xref:].split(b"\n")
+    size = int(lines[1].split()[1])
+    for number, line in enumerate(lines[3:2 + size], 1):
+        if not document.startswith(b"%d 0 obj\n" % number, int(line[:10])):
+            raise ValueError(f"décalage de l'objet {number} erroné")
+    if int(lines[lines.index(b"startxref") + 1]) != xref:
+        raise ValueError("startxref erroné")
+    objects = {int(number): body for number, body in _OBJECT.findall(document)}
+    if len(objects) != size - 1 or b"/Count %d\n" % pages not in objects[1]:
+        raise ValueError("arbre des pages incohérent")
+    for body in objects.values():
+        if b"/Type /Page\n" in body:
+            contents = objects[int(re.search(rb"/Contents (\d+) 0 R", body).group(1))]
+            stream = contents[contents.index(b"stream\n") + len(b"stream\n"):contents.rindex(b"\nendstream")]
+            if b"BT " not in zlib.decompress(stream):
+                raise ValueError("page sans texte")
+
+
+class SummaryWriter:
+    """Écrit un document PDF dans le fichier binaire `f`, page par page, sans garder les pages écrites."""
+
+    def __init__(self, f, header):
+        self._f = f
+        self._position = 0
+        self._hash = hashlib.md5(usedforsecurity=False)
+        self._offsets = [None, None, None]  # par numéro d'objet ; 1 : arbre des pages, 2 : catalogue
+        self._resources = {}  # ressources d'origine -> numéro de l'objet écrit
+        self._kids = []
+        self._media_box = None
+        self._write(header)
+
+    def _write(self, data):
+        self._f.write(data)
+        self._hash.update(data)
+        self._position += len(data)
+
+    def _object(self, body, number=None):
+        if number is None:
+            number = len(self._offsets)
+            self._offsets.append(None)
+        self._offsets[number] = self._position
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        return number
+
+    def add_page(self, content, resources, fonts, media_box, first=False):
+        """Écrit une page (flux de contenu non compressé, ressources et polices de _single_page)."""
+        key = resources + b"".join(fonts.values())
+        number = self._resources.get(key)
+        if number is None:
+            renumbered = {old: self._object(body) for old, body in fonts.items()}
+            body = _REFERENCE.sub(lambda match: b"%d 0 R" % renumbered[int(match.group(1))], resources)
+            number = self._resources[key] = self._object(body)
+        self._media_box = self._media_box or media_box
+
+        compressed = zlib.compress(content, 6)
+        contents = self._object(b"<<\n/Filter /FlateDecode\n/Length %d\n>>\nstream\n" % len(compressed)
+                                + compressed + b"\nendstream")
+        page = self._object(b"<<\n/Contents %d 0 R\n/Parent 1 0 R\n/Resources %d 0 R\n/Type /Page\n>>" % (contents, number))
+        if first:
+            self._kids.insert(0, page)
+        else:
+            self._kids.append(page)
+
+    def close(self, creation_date=None):
+        """Écrit l'arbre des pages, le catalogue, les métadonnées et la table des objets."""
+        creation_date = creation_date or datetime.now(timezone.utc)
+        kids = b" ".join(b"%d 0 R" % page for page in self._kids)
+        self._object(b"<<\n/Count %d\n/Kids [%s]\n%s\n/Type /Pages\n>>" % (len(self._kids), kids, self._media_box), 1)
+        self._object(b"<<\n/OpenAction [%d 0 R /FitH null]\n/PageLayout /OneColumn\n/Pages 1 0 R\n/Type /Catalog\n>>"
+                     % self._kids[0], 2)
+        info = self._object(f"<<\n/CreationDate (D:{creation_date:%Y%m%d%H%M%S}Z)\n>>".encode("latin-1"))
+
+        startxref = self._position
+        self._hash.update(f"{creation_date:%Y%m%d%H%M%S}".encode("latin-1"))
+        file_id = self._hash.hexdigest().upper()
+        trailer = ["xref", f"0 {len(self._offsets)}", "0000000000 65535 f "]
+        trailer += [f"{offset:010} 00000 n " for offset in self._offsets[1:]]
+        trailer += ["trailer", "<<", f"/Size {len(self._offsets)}", "/Root 2 0 R", f"/Info {info} 0 R",
+                    f"/ID [<{file_id}><{file_id}>]", ">>", "startxref", str(startxref), "%%EOF"]
+        self._f.write("\n".join(trailer).encode("latin-1") + b"\n")
+
+
+class SummaryTotals:
+    """Totaux d'un lot cumulés au fil de la lecture des participants."""
+
+    def __init__(self):
+        self.participants = 0
+        self.valid = 0
+        self.amounts = {}  # devise -> montant des participants valides
+        self.errors = {}  # code d'erreur -> participants refusés pour ce motif
+        self.fsps = {}  # FSP -> [participants, valides, refusés, {devise: montant valide}]
+
+    def add(self, participant):
+        get = participant.get
+        fsp = next((str(get(field)) for field in FSP_FIELDS if get(field)), NO_FSP)
+        counts = self.fsps.get(fsp)
+        if counts is None:
+            counts = self.fsps[fsp] = [0, 0, 0, {}]
+        self.participants += 1
+        counts[0] += 1
+        if get("status") != "valide":
+            counts[2] += 1
+            for code in get("errors") or ():
+                self.errors[code] = self.errors.get(code, 0) + 1
+            return
+
+        self.valid += 1
+        counts[1] += 1
+        try:
+            amount = Decimal(str(get("montant") or get("amount")).replace(",", "."))
+        except InvalidOperation:
+            return
+        currency = get("devise") or get("currency") or "XOF"
+        self.amounts[currency] = self.amounts.get(currency, 0) + amount
+        counts[3][currency] = counts[3].get(currency, 0) + amount
+
+    def report(self, pages):
+        """Totaux pour BatchSummaryPDF.add_totals_page (FSP du plus au moins de participants)."""
+        fsps = sorted(((fsp, *counts) for fsp, counts in self.fsps.items()), key=lambda fsp: (-fsp[1], fsp[0]))
+        return {
+            "participants": self.participants,
+            "valid": self.valid,
+            "refused": self.participants - self.valid,
+            "amounts": self.amounts,
+            "errors": self.errors,
+            "fsps": fsps,
+            "pages": pages,
+            "generated_at": f"{datetime.now():%d/%m/%Y %H:%M:%S}",
+        }
+
+
+def write_summary(batch, participants, f):
+    """Écrit dans le fichier binaire `f` le récapitulatif du lot `batch` (métadonnées de l'index).
+
+    `participants` est lu une seule fois, au fil de l'eau. Retourne les totaux (SummaryTotals.report).
+    """
+    template = SummaryTemplate.get()
+    if template is None:
+        return _write_with_fpdf(batch, participants, f)
+    return _write_with_template(template, batch, participants, f)
+
+
+def _write_with_template(template, batch, participants, f):
+    """Récapitulatif écrit page par page à partir du modèle précompilé (voir SummaryTemplate)."""
+    writer = SummaryWriter(f, template.header)
+    page_layout = (template.resources, template.fonts, template.media_box)
+    totals = SummaryTotals()
+    rows = []
+    pages = 0
+    for participant in participants:
+        totals.add(participant)
+        rows.append(template.row(totals.participants, participant))
+        if len(rows) == template.capacity:
+            pages += 1
+            writer.add_page(template.render(batch["batchId"], pages, rows), *page_layout)
+            rows = []
+    if rows:
+        pages += 1
+        writer.add_page(template.render(batch["batchId"], pages, rows), *page_layout)
+
+    report = totals.report(pages)
+    pdf = BatchSummaryPDF()
+    pdf.set_compression(False)
+    pdf.add_totals_page(batch, report)
+    writer.add_page(*_single_page(bytes(pdf.output())), first=True)
+    writer.close()
+    return report
+
+
+def _write_with_fpdf(batch, participants, f):
+    """Récapitulatif construit entièrement par fpdf2, sans modèle : lignes et pages gardées en mémoire jusqu'à la sortie."""
+    cells = TableCells()
+    totals = SummaryTotals()
+    rows = []
+    for participant in participants:
+        totals.add(participant)
+        rows.append(cells.row(totals.participants, participant))
+    capacity = BatchSummaryPDF().add_table_page("", "", [])
+    report = totals.report(-(-len(rows) // capacity))
+
+    pdf = BatchSummaryPDF()
+    pdf.add_totals_page(batch, report)
+    for page, start in enumerate(range(0, len(rows), capacity), 1):
+        pdf.add_table_page(_text(batch["batchId"]), str(page), rows[start:start + capacity])
+    f.write(bytes(pdf.output()))
+    return report
+
+
+def generate_summary(batch_id, store=None):
+    """Écrit le récapitulatif d'un lot du magasin et enregistre son chemin dans summary_pdf.
+
+    Le fichier est <racine du magasin>/summaries/<segment>.pdf, remplacé en une
+    fois. Lève LookupError si le lot n'existe pas. Retourne le résumé.
+    """
+    store = store or get_store()
+    batch = store.get(batch_id)
+    if batch is None:
+        raise LookupError(f"Lot non trouvé : {batch_id}")
+
+    directory = os.path.join(store.root, "summaries")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, os.path.splitext(batch["segment"])[0] + ".pdf")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            report = write_summary(batch, store.iter_participants(batch_id), f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    store.update(batch_id, summary_pdf=path)
+    return {
+        "batchId": batch_id,
+        "summary_pdf": path,
+        "participants": report["participants"],
+        "valid": report["valid"],
+        "refused": report["refused"],
+        "pages": report["pages"] + 1,
+    }
@@ -0,0 +1,83 @@
+# benchmarks/bench_batch_diff.py
+"""
+Mesure l'import différentiel (batch_diff.ingest_diff) d'un fichier mensuel
+contre le lot du mois précédent, comparé à l'import complet du même fichier
+(ingestion.iter_participants vers le magasin de lots).
+
+Le fichier du mois suivant reprend celui du mois précédent avec environ 1 %
+de lignes modifiées, supprimées ou ajoutées. La première comparaison calcule
+les empreintes du lot de référence (gardées ensuite à côté de son segment) ;
+les suivantes les relisent. Les deux imports doivent produire le même segment.
+Aucune base n'est nécessaire (magasin de lots dans un répertoire temporaire,
+contrôle des doubles paiements désactivé).
+Usage : python benchmarks/bench_batch_diff.py [nb_lignes] [taux de changement]
+        (défaut : 1000000 lignes, 0.01)
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_month(count, churn, seed):
+    """Lignes (msisdn, montant, nom) du mois précédent et du mois courant."""
+    previous = [(f"229{i:08d}", 50000 + i % 1000, f"Awa Koné {i}") for i in range(count)]
+    current = list(previous)
+    rng = random.Random(seed)
+    changes = int(count * churn / 3)
+    for position in rng.sample(range(count), changes):
+        msisdn, amount, name = current[position]
+        current[position] = (msisdn, amount + 500, name)
+    for position in sorted(rng.sample(range(count), changes), reverse=True):
+        del current[position]
+    current += [(f"2291{i:07d}", 60000, f"Nouveau {i}") for i in range(changes)]
+    return previous, current
+
+
+def write_csv(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("type_id,valeur_id,devise,montant,nom_complet\n")
+        f.writelines(f"MSISDN,{msisdn},XOF,{amount},{name}\n" for msisdn, amount, name in rows)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    churn = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["BATCH_STORE_DIR"] = os.path.join(workdir, "store")
+        os.environ["BENEFICIARY_CHECK"] = "0"
+        from batch_diff import ingest_diff
+        from ingestion import StoreSink, iter_participants
+
+        previous, current = make_month(count, churn, seed=1)
+        previous_path, current_path = os.path.join(workdir, "previous.csv"), os.path.join(workdir, "current.csv")
+        write_csv(previous_path, previous)
+        write_csv(current_path, current)
+        sink = StoreSink()
+
+        def full_import(path):
+            stats = {"total": 0, "valid": 0, "refused": 0}
+            with open(path, "rb") as f:
+                return sink.write_batch(iter_participants(f, stats))
+
+        reference = full_import(previous_path)["batchId"]
+        print(f"{count} lignes, {churn:.1%} de changements, lot de référence {reference}")
+
+        started = time.perf_counter()
+        full = full_import(current_path)
+        baseline = time.perf_counter() - started
+        print(f"import complet          : {baseline:6.2f}s")
+
+        for label in ("différentiel (à froid)", "différentiel (empreintes)"):
+            started = time.perf_counter()
+            with open(current_path, "rb") as f:
+                _, diff, stats, result = ingest_diff(f, "json", reference)
+            elapsed = time.perf_counter() - started
+            identical = open(full["file_saved"], "rb").read() == open(result["file_saved"], "rb").read()
+            print(f"{label:24s}: {elapsed:6.2f}s ({elapsed / baseline:5.1%} de l'import complet), "
+                  f"{diff['revalidated']} lignes revalidées, {diff['removed']} supprimées, "
+                  f"résultat identique : {identical}")
@@ -0,0 +1,76 @@
+# benchmarks/bench_batch_summary.py
+"""
+Mesure la génération du récapitulatif PDF d'un lot (batch_summary.generate_summary)
+à 100 000 et 1 000 000 de participants : durée, débit, taille du fichier et
+pic de mémoire du processus, à comparer avec le rendu direct par fpdf2
+(BatchSummaryPDF page par page, document gardé en mémoire jusqu'à la sortie),
+mesuré sur un échantillon puis extrapolé.
+
+Aucune base n'est nécessaire (magasin de lots dans un répertoire temporaire).
+Usage : python benchmarks/bench_batch_summary.py [nb_lignes ...] (défaut : 100000 1000000)
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_participants(count):
+    for i in range(count):
+        refused = i % 50 == 0
+        yield {
+            "type_id": "MSISDN",
+            "valeur_id": f"229{i:08d}",
+            "devise": "XOF",
+            "montant": str(50000 + i % 1000),
+            "nom_complet": f"Awa Koné {i}",
+            "fsp_id": f"fsp-{i % 12}",
+            "status": "refusé" if refused else "valide",
+            "receipt": None,
+            "errors": ["MSISDN_INVALID"] if refused else [],
+        }
+
+
+def peak_memory_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore", DeprecationWarning)
+    counts = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        from batch_store import BatchStore
+        from batch_summary import generate_summary
+        from models.BatchSummaryPDF import BatchSummaryPDF
+
+        store = BatchStore(workdir)
+        capacity = BatchSummaryPDF().add_table_page("", "", [])
+        sample = 5000
+        rows = [[str(value) for value in (i + 1, p["nom_complet"], p["type_id"], p["valeur_id"], p["montant"],
+                                          p["devise"], p["status"], ", ".join(p["errors"]))]
+                for i, p in enumerate(make_participants(sample))]
+        started = time.perf_counter()
+        pdf = BatchSummaryPDF()
+        for start in range(0, sample, capacity):
+            pdf.add_table_page("BENCH", str(start // capacity + 1), rows[start:start + capacity])
+        pdf.output()
+        per_row = (time.perf_counter() - started) / sample
+        del pdf
+        print(f"fpdf2 direct : {per_row * 1e6:6.1f} µs par ligne (échantillon de {sample}), "
+              f"tout le document en mémoire jusqu'à la sortie")
+
+        for count in counts:
+            batch_id = store.append_batch(make_participants(count))["batchId"]
+            before = peak_memory_mb()
+            started = time.perf_counter()
+            result = generate_summary(batch_id, store)
+            elapsed = time.perf_counter() - started
+            size = os.path.getsize(result["summary_pdf"])
+            print(f"{count:9d} lignes : {elapsed:6.1f}s ({count / elapsed:7.0f} lignes/s, "
+                  f"fpdf2 direct ≈ {per_row * count:6.1f}s), {result['pages']} pages, {size / 1024 / 1024:6.1f} Mo, "
+                  f"pic mémoire {peak_memory_mb():.0f} Mo (avant : {before:.0f} Mo)")
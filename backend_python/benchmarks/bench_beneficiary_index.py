@@ -0,0 +1,82 @@
+# benchmarks/bench_beneficiary_index.py
+"""
+Mesure le contrôle des doubles paiements (beneficiary_index.py) : un fichier
+de paiement est vérifié contre un historique de plusieurs millions de
+paiements, avec et sans filtre de Bloom, et comparé à un ensemble Python
+(set) interrogé ligne par ligne.
+
+Environ 1 % des lignes du fichier ont déjà été payées dans la période.
+Aucune base n'est nécessaire (l'historique est inscrit directement dans un
+index temporaire).
+Usage : python benchmarks/bench_beneficiary_index.py [paiements historiques] [lignes du fichier]
+        (défaut : 3000000 et 500000)
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from beneficiary_index import BeneficiaryIndex, PaymentCheck, payment_keys
+
+PERIOD = "2026-10"
+BATCH_ROWS = 500_000
+
+
+def make_frame(first, count):
+    msisdn = pd.Series(np.arange(first, first + count)).map("229{:08d}".format)
+    return pd.DataFrame({"type_id": "MSISDN", "valeur_id": msisdn, "devise": "XOF", "montant": "50000",
+                         "nom_complet": "Awa Koné"})
+
+
+if __name__ == '__main__':
+    history = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500_000
+    # Le fichier reprend ~1 % de bénéficiaires déjà payés, à la fin de l'historique
+    upload = make_frame(history - count // 100, count)
+    expected = count // 100
+
+    with tempfile.TemporaryDirectory() as workdir:
+        writer = BeneficiaryIndex(workdir, bloom_bits=0)
+        started = time.perf_counter()
+        for position, first in enumerate(range(0, history, BATCH_ROWS)):
+            hashes, present = payment_keys(make_frame(first, min(BATCH_ROWS, history - first)), PERIOD)
+            writer.record(hashes[present], f"LOT-{position}", "db", PERIOD)
+        print(f"inscription de {history} paiements : {time.perf_counter() - started:6.2f}s")
+
+        for bloom_bits in (0, 16):
+            index = BeneficiaryIndex(workdir, bloom_bits=bloom_bits)
+            started = time.perf_counter()
+            stats = index.stats()
+            loaded = time.perf_counter() - started
+
+            started = time.perf_counter()
+            masks = PaymentCheck(index, PERIOD, reserve=False).flag(upload, np.zeros(count, dtype=np.uint8))
+            elapsed = time.perf_counter() - started
+            flagged = int(np.count_nonzero(masks))
+            # Recherche seule, clés déjà calculées (le reste est le calcul des empreintes)
+            hashes, present = payment_keys(upload, PERIOD)
+            started = time.perf_counter()
+            index.paid(hashes, present)
+            lookup = time.perf_counter() - started
+            print(f"Bloom {bloom_bits:2d} bits/clé : chargement {loaded:5.2f}s ({stats['keys']} clés, "
+                  f"{(stats['table_bytes'] + stats['bloom_bytes']) / 1024 / 1024:.0f} Mo), "
+                  f"contrôle de {count} lignes {elapsed:5.2f}s ({count / elapsed:10.0f} lignes/s) "
+                  f"dont recherche {lookup:5.2f}s, {flagged} déjà payées (attendu {expected})")
+
+        # Référence : ensemble Python des clés, interrogé ligne par ligne
+        paid = set()
+        for first in range(0, history, BATCH_ROWS):
+            for msisdn in make_frame(first, min(BATCH_ROWS, history - first))["valeur_id"].tolist():
+                paid.add(("msisdn", PERIOD, msisdn))
+                paid.add(("unique_id", PERIOD, f"MSISDN-{msisdn}"))
+        started = time.perf_counter()
+        rows = zip(upload["type_id"].tolist(), upload["valeur_id"].tolist())
+        flagged = sum(1 for type_id, msisdn in rows
+                      if ("unique_id", PERIOD, f"{type_id}-{msisdn}") in paid or ("msisdn", PERIOD, msisdn.lstrip("+")) in paid)
+        elapsed = time.perf_counter() - started
+        print(f"set Python ligne à ligne : contrôle {elapsed:5.2f}s ({count / elapsed:10.0f} lignes/s), {flagged} déjà payées")
@@ -0,0 +1,67 @@
+# benchmarks/bench_bulk_insert.py
+"""
+Compare Pensioner.create (une ligne, un commit) et Pensioner.create_many
+(INSERT multi-lignes, une transaction par paquet), puis mesure le réimport
+du même fichier avec 1 % de lignes modifiées via Pensioner.upsert_many.
+
+À lancer contre une base MySQL/MariaDB locale de test (variables DB_* du .env) :
+    python benchmarks/bench_bulk_insert.py [nb_lignes] [chunk_size]
+
+Un lot temporaire est créé puis supprimé (ON DELETE CASCADE sur pensioners).
+Le chargement ligne par ligne est mesuré sur un échantillon puis extrapolé.
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.batch_model import Batch
+from models.pensioner_model import Pensioner
+
+
+def make_rows(count, prefix):
+    return [{
+        "unique_id": f"{prefix}{i:08d}",
+        "first_name": "Awa",
+        "last_name": "Kone",
+        "type_id": "MSISDN",
+        "msisdn": f"229{i:08d}",
+        "amount": 50000,
+        "currency": "XOF",
+    } for i in range(count)]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    sample = min(2000, count)
+
+    batch_code = f"BENCH-{uuid.uuid4().hex[:8]}"
+    batch_id = Batch.create(batch_code, 0, 0, "bench")
+    try:
+        started = time.perf_counter()
+        for row in make_rows(sample, "S"):
+            Pensioner.create(row["unique_id"], row["first_name"], row["last_name"], row["type_id"],
+                             row["msisdn"], row["amount"], row["currency"], batch_id=batch_id)
+        per_row = (time.perf_counter() - started) / sample
+        print(f"create()      : {1 / per_row:10.0f} lignes/s (≈ {per_row * count:7.1f}s pour {count} lignes)")
+
+        started = time.perf_counter()
+        result = Pensioner.create_many(make_rows(count, "B"), batch_id, chunk_size)
+        elapsed = time.perf_counter() - started
+        print(f"create_many() : {count / elapsed:10.0f} lignes/s ({elapsed:7.1f}s pour {count} lignes, "
+              f"{result['inserted']} insérées, {len(result['failed'])} en échec)")
+
+        # Réimport du même fichier avec 1 % de lignes modifiées
+        rows = make_rows(count, "B")
+        for row in rows[::100]:
+            row["amount"] = 55000
+        started = time.perf_counter()
+        result = Pensioner.upsert_many(rows, batch_id, chunk_size)
+        elapsed = time.perf_counter() - started
+        print(f"upsert_many() : {elapsed:7.1f}s pour réimporter {count} lignes "
+              f"({result['updated']} mises à jour, {result['unchanged']} inchangées)")
+    finally:
+        Batch.delete(batch_id)
@@ -0,0 +1,81 @@
+# benchmarks/bench_bulk_load.py
+"""
+Compare trois façons de charger un fichier de paiement dans la table pensioners :
+Pensioner.create (une ligne, un commit), Pensioner.create_many (INSERT
+multi-lignes par paquets) et Pensioner.bulk_load (fichier temporaire chargé
+par LOAD DATA LOCAL INFILE dans une table temporaire, puis fusionné en une
+transaction), écriture du fichier comprise.
+
+À lancer contre une base MySQL/MariaDB locale de test (variables DB_* du .env),
+avec local_infile=ON côté serveur (SET GLOBAL local_infile = 1 sous MySQL 8) :
+    python benchmarks/bench_bulk_load.py [nb_lignes] [chunk_size]
+
+Les lots créés sont supprimés à la fin (ON DELETE CASCADE sur pensioners).
+Le chargement ligne par ligne est mesuré sur un échantillon puis extrapolé.
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.batch_model import Batch
+from models.pensioner_model import LocalInfileUnavailable, Pensioner
+
+
+def make_rows(count, prefix):
+    return ({
+        "unique_id": f"{prefix}{i:08d}",
+        "first_name": "Awa",
+        "last_name": "Koné",
+        "type_id": "MSISDN",
+        "msisdn": f"229{i:08d}",
+        "amount": 50000 + i % 1000,
+        "currency": "XOF",
+    } for i in range(count))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    sample = min(2000, count)
+    tag = uuid.uuid4().hex[:6]
+    batch_ids = []
+
+    try:
+        batch_ids.append(Batch.create(f"BENCH-{tag}-create", 0, 0, "bench"))
+        started = time.perf_counter()
+        for row in make_rows(sample, f"S{tag}"):
+            Pensioner.create(row["unique_id"], row["first_name"], row["last_name"], row["type_id"],
+                             row["msisdn"], row["amount"], row["currency"], batch_id=batch_ids[-1])
+        per_row = (time.perf_counter() - started) / sample
+        print(f"create()      : {1 / per_row:10.0f} lignes/s (≈ {per_row * count:7.1f}s pour {count} lignes)")
+
+        batch_ids.append(Batch.create(f"BENCH-{tag}-many", 0, 0, "bench"))
+        started = time.perf_counter()
+        result = Pensioner.create_many(make_rows(count, f"M{tag}"), batch_ids[-1], chunk_size)
+        elapsed = time.perf_counter() - started
+        print(f"create_many() : {count / elapsed:10.0f} lignes/s ({elapsed:7.1f}s, {result['inserted']} insérées), "
+              f"x{per_row * count / elapsed:5.1f} contre create()")
+
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", suffix=".tsv") as f:
+            started = time.perf_counter()
+            Pensioner.write_load_file(make_rows(count, f"L{tag}"), f)
+            f.flush()
+            written = time.perf_counter() - started
+            try:
+                result = Pensioner.bulk_load(f.name, f"BENCH-{tag}-load", "bench")
+            except LocalInfileUnavailable as e:
+                print(f"bulk_load()   : LOAD DATA LOCAL INFILE indisponible ({e})")
+            else:
+                batch_ids.append(result["batch_id"])
+                elapsed = time.perf_counter() - started
+                batch = Batch.get_by_id(result["batch_id"])
+                print(f"bulk_load()   : {count / elapsed:10.0f} lignes/s ({elapsed:7.1f}s dont {written:.1f}s d'écriture "
+                      f"du fichier, {result['inserted']} insérées), x{per_row * count / elapsed:5.1f} contre create(), "
+                      f"lot : {batch.total_payments} paiements, {batch.total_amount} XOF")
+    finally:
+        for batch_id in batch_ids:
+            Batch.delete(batch_id)
@@ -0,0 +1,109 @@
+# benchmarks/bench_csv_upload.py
+"""
+Mesure la mémoire de pointe (VmHWM) du serveur pendant l'import d'un CSV
+via /csv/upload, pour plusieurs tailles de fichier.
+
+Le serveur Flask est lancé dans un sous-processus (un par taille) avec un
+magasin de lots temporaire ; le fichier est envoyé en multipart depuis le disque,
+sans être chargé côté client. Avec la lecture en continu, la mémoire de
+pointe doit rester à peu près la même quelle que soit la taille du fichier.
+
+Usage : python benchmarks/bench_csv_upload.py [nb_lignes ...]   (défaut : 100000 1000000)
+Linux uniquement (lecture de /proc/<pid>/status).
+"""
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_csv(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("type_id,valeur_id,devise,montant,nom_complet\n")
+        for i in range(count):
+            f.write(f"MSISDN,229{i:08d},XOF,{50000 + i % 1000},Awa Koné {i}\n")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def upload(port, csv_path):
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.csv\"\r\n"
+            f"Content-Type: text/csv\r\n\r\n").encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    length = len(head) + os.path.getsize(csv_path) + len(tail)
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=3600)
+    conn.putrequest("POST", "/csv/upload")
+    conn.putheader("Content-Type", f"multipart/form-data; boundary={boundary}")
+    conn.putheader("Content-Length", str(length))
+    conn.endheaders()
+    conn.send(head)
+    with open(csv_path, "rb") as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            conn.send(block)
+    conn.send(tail)
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response.status, body
+
+
+def run(count, workdir):
+    csv_path = os.path.join(workdir, f"bench_{count}.csv")
+    make_csv(csv_path, count)
+    port = free_port()
+    env = dict(os.environ, BATCH_STORE_DIR=os.path.join(workdir, f"store_{count}"))
+    server = subprocess.Popen(
+        [sys.executable, "-c", f"from app import app; app.run(port={port}, threaded=True)"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        baseline = peak_rss_mb(server.pid)
+        started = time.perf_counter()
+        status, body = upload(port, csv_path)
+        elapsed = time.perf_counter() - started
+        peak = peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    size_mb = os.path.getsize(csv_path) / 1024 / 1024
+    print(f"{count:>9} lignes ({size_mb:6.1f} Mo) : HTTP {status}, {elapsed:6.1f}s, "
+          f"{count / elapsed:8.0f} lignes/s, RSS de pointe {peak:6.1f} Mo (au repos {baseline:6.1f} Mo)")
+    if status != 200:
+        print(body[:500])
+
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in counts:
+            run(count, workdir)
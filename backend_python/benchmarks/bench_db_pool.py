@@ -0,0 +1,63 @@
+# benchmarks/bench_db_pool.py
+"""
+Compare le débit (requêtes/s) avec et sans pool de connexions.
+
+Chaque "requête" simulée reproduit le profil de update_pensioner : trois accès
+base (Pensioner.get_by_id, Batch.get_by_id, Pensioner.update) dans un même
+contexte Flask. Sans pool, chaque appel ouvre sa propre connexion.
+
+Usage : python benchmarks/bench_db_pool.py [nb_requetes] [nb_threads]
+(utilise les variables DB_* du fichier .env)
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from config import Config
+
+app = Flask(__name__)
+app.teardown_appcontext(Config.close_request_connection)
+
+
+def model_call():
+    db = Config.get_db_connection()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+        db.close()
+
+
+def simulated_request():
+    with app.app_context():
+        for _ in range(3):
+            model_call()
+
+
+def run(pool_size, requests_count, threads):
+    Config.DB_POOL_SIZE = pool_size
+    Config._pool = None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda _: simulated_request(), range(requests_count)))
+    elapsed = time.perf_counter() - started
+    return requests_count / elapsed
+
+
+if __name__ == '__main__':
+    requests_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    pool_size = int(os.getenv('DB_POOL_SIZE', 5)) or 5
+
+    before = run(0, requests_count, threads)
+    print(f"Sans pool  : {before:8.1f} requêtes/s")
+
+    after = run(pool_size, requests_count, threads)
+    print(f"Avec pool  : {after:8.1f} requêtes/s (x{after / before:.1f})")
+    print(f"Métriques  : {Config.get_pool_metrics()}")
@@ -0,0 +1,76 @@
+# benchmarks/bench_parallel_ingestion.py
+"""
+Mesure l'import parallèle (parallel_ingestion.process_file) d'un gros CSV
+selon le nombre de processus, contre la lecture séquentielle
+(ingestion.iter_participants) qui écrit le même fichier JSONL.
+
+Le gain attendu est à peu près linéaire jusqu'au nombre de cœurs : chaque
+plage est analysée, validée et sérialisée indépendamment ; le processus
+principal ne fait que concaténer les morceaux et fusionner les doublons.
+Aucune base n'est nécessaire.
+Usage : python benchmarks/bench_parallel_ingestion.py [nb_lignes] [processus max]
+        (défaut : 2000000 lignes, jusqu'au nombre de cœurs)
+"""
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingestion import SNIFF_SIZE, detect_csv_format, iter_participants
+from parallel_ingestion import process_file
+
+
+def make_csv(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("type_id,valeur_id,devise,montant,nom_complet\n")
+        for i in range(count):
+            # Environ 1 % de doublons, répartis dans tout le fichier
+            msisdn = i if i % 97 else i // 2
+            f.write(f"MSISDN,229{msisdn:08d},XOF,{50000 + i % 1000},Awa Koné {i}\n")
+
+
+def sequential(path, csv_format, output_path):
+    stats = {"total": 0, "valid": 0, "refused": 0}
+    with open(path, "rb") as f, open(output_path, "w", encoding="utf-8") as out:
+        for participant in iter_participants(f, stats, csv_format):
+            out.write(json.dumps(participant, ensure_ascii=False) + "\n")
+    return stats
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, "bench.csv")
+        make_csv(csv_path, count)
+        with open(csv_path, "rb") as f:
+            csv_format = detect_csv_format(f.read(SNIFF_SIZE))
+        print(f"{count} lignes ({os.path.getsize(csv_path) / 1024 / 1024:.1f} Mo), {os.cpu_count()} cœur(s)")
+
+        started = time.perf_counter()
+        reference = sequential(csv_path, csv_format, os.path.join(workdir, "sequential.jsonl"))
+        baseline = time.perf_counter() - started
+        print(f"séquentiel       : {baseline:6.2f}s ({count / baseline:9.0f} lignes/s), {reference['refused']} refusées")
+
+        context = multiprocessing.get_context("forkserver")
+        workers = 1
+        while workers <= max_workers:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                # Démarrer les processus avant de mesurer
+                list(executor.map(abs, range(workers)))
+                output_path = os.path.join(workdir, f"parallel_{workers}.jsonl")
+                started = time.perf_counter()
+                stats = process_file(csv_path, csv_format, output_path, executor)
+                elapsed = time.perf_counter() - started
+            identical = open(output_path, "rb").read() == open(os.path.join(workdir, "sequential.jsonl"), "rb").read()
+            print(f"{workers:2d} processus     : {elapsed:6.2f}s ({count / elapsed:9.0f} lignes/s), "
+                  f"accélération x{baseline / elapsed:4.2f}, {stats['chunks']} plages, "
+                  f"{stats['refused']} refusées, résultat identique : {identical}")
+            os.remove(output_path)
+            workers *= 2
@@ -0,0 +1,79 @@
+# benchmarks/bench_prepared_statements.py
+"""
+Compare les chemins chauds Pensioner.get_by_id (lecture en base, sans cache)
+et Pensioner.update_status avec et sans requêtes préparées (models/statements.py).
+
+Sans préparation, MySQL analyse le texte SQL à chaque appel ; avec, chaque
+instruction est préparée une fois par connexion du pool puis seulement exécutée.
+Les compteurs serveur Com_stmt_prepare / Com_stmt_execute sont affichés pour
+vérifier le nombre d'analyses.
+
+À lancer contre une base MySQL/MariaDB locale de test (variables DB_* du .env) :
+    python benchmarks/bench_prepared_statements.py [nb_appels]
+
+Un lot temporaire de 1000 pensionnés est créé puis supprimé.
+"""
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from models.batch_model import Batch
+from models.pensioner_model import Pensioner
+
+
+def server_counters():
+    db = Config.get_db_connection()
+    cursor = db.cursor()
+    try:
+        cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ('Com_stmt_prepare', 'Com_stmt_execute', 'Questions')")
+        return {name: int(value) for name, value in cursor.fetchall()}
+    finally:
+        cursor.close()
+        db.close()
+
+
+def run(prepared, ids, calls):
+    Config.DB_PREPARED_STATEMENTS = prepared
+    Config._pool = None
+    before = server_counters()
+
+    started = time.perf_counter()
+    for i in range(calls):
+        Pensioner._load_by_id(ids[i % len(ids)])
+    read = calls / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(calls):
+        Pensioner.update_status(ids[i % len(ids)], 'validated' if (i // len(ids)) % 2 == 0 else 'pending')
+    write = calls / (time.perf_counter() - started)
+
+    after = server_counters()
+    delta = {name: after[name] - before[name] for name in after}
+    label = "préparées   " if prepared else "texte       "
+    print(f"{label}: get_by_id {read:8.0f} appels/s | update_status {write:8.0f} appels/s | "
+          f"Com_stmt_prepare {delta['Com_stmt_prepare']:6d} | Com_stmt_execute {delta['Com_stmt_execute']:7d}")
+    return read, write
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    if Config.DB_POOL_SIZE <= 0:
+        Config.DB_POOL_SIZE = 5
+
+    batch_id = Batch.create(f"BENCH-{uuid.uuid4().hex[:8]}", 0, 0, "bench")
+    try:
+        rows = [{"unique_id": f"P{i:08d}{uuid.uuid4().hex[:6]}", "type_id": "MSISDN", "msisdn": f"229{i:08d}",
+                 "amount": 50000} for i in range(1000)]
+        Pensioner.create_many(rows, batch_id)
+        ids = [pensioner.id for pensioner in Pensioner.get_by_batch_id(batch_id)]
+
+        text_read, text_write = run(False, ids, calls)
+        prepared_read, prepared_write = run(True, ids, calls)
+        print(f"Gain : get_by_id x{prepared_read / text_read:.2f}, update_status x{prepared_write / text_write:.2f}")
+    finally:
+        Config.DB_PREPARED_STATEMENTS = True
+        Batch.delete(batch_id)
@@ -0,0 +1,52 @@
+# benchmarks/bench_receipt_cache.py
+"""
+Mesure le coût d'un téléchargement de reçu selon le niveau du cache des reçus
+(receipt_cache.py) : rendu (défaut de cache, rangement compris), lecture du
+disque, lecture en mémoire, et calcul seul de la clé (ce que coûte une
+réponse 304 à If-None-Match).
+
+Aucune base n'est nécessaire : les reçus sont faits à partir de transaction.json
+et le cache est dans un répertoire temporaire.
+Usage : python benchmarks/bench_receipt_cache.py [nb_reçus] (défaut : 2000)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from receipt_cache import ReceiptCache
+
+
+def make_payloads(count):
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "transaction.json")) as f:
+        data = json.load(f)["data"]
+    return [dict(data, homeTransactionId=f"bench-{i:08d}", amount=str(50000 + i % 1000)) for i in range(count)]
+
+
+def per_receipt(label, count, action):
+    started = time.perf_counter()
+    action()
+    elapsed = time.perf_counter() - started
+    print(f"{label:22s}: {elapsed / count * 1000:6.3f} ms par reçu")
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore", DeprecationWarning)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    payloads = make_payloads(count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ReceiptCache(directory, 64 * 1024 * 1024, 1024 * 1024 * 1024)
+        keys = [cache.key(data) for data in payloads]
+        per_receipt("rendu (défaut)", count, lambda: [cache.fetch(data, key) for data, key in zip(payloads, keys)])
+        per_receipt("mémoire", count, lambda: [cache.fetch(data, key) for data, key in zip(payloads, keys)])
+        cache._memory.clear()
+        cache._memory_size = 0
+        cache.memory_bytes = 0
+        per_receipt("disque", count, lambda: [cache.fetch(data, key) for data, key in zip(payloads, keys)])
+        per_receipt("clé seule (304)", count, lambda: [cache.key(data) for data in payloads])
+        print(cache.stats())
@@ -0,0 +1,62 @@
+# benchmarks/bench_receipt_template.py
+"""
+Compare le coût d'un reçu rendu par ReceiptPDF (mise en page complète à chaque
+reçu) et par le modèle précompilé (models.ReceiptPDF.render_receipt : champs
+variables inscrits dans la mise en page calculée une fois par processus).
+
+Affiche les ms par reçu avant/après, la compilation du modèle à part, puis
+vérifie que les deux rendus sont identiques octet pour octet à date de
+création égale, avec et sans note.
+Aucune base n'est nécessaire : les reçus sont faits à partir de transaction.json.
+Usage : python benchmarks/bench_receipt_template.py [nb_reçus] (défaut : 2000)
+"""
+import json
+import os
+import sys
+import time
+import warnings
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.ReceiptPDF import ReceiptPDF, ReceiptTemplate, render_receipt
+
+
+def make_payloads(count):
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "transaction.json")) as f:
+        data = json.load(f)["data"]
+    return [dict(data, homeTransactionId=f"bench-{i:08d}", amount=str(50000 + i % 1000),
+                 note=f"Pension (mois {i % 12 + 1})" if i % 2 else None) for i in range(count)]
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore", DeprecationWarning)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    payloads = make_payloads(count)
+
+    started = time.perf_counter()
+    for data in payloads:
+        ReceiptPDF(data).generate()
+    before = (time.perf_counter() - started) / count
+    print(f"ReceiptPDF            : {before * 1000:6.3f} ms par reçu")
+
+    started = time.perf_counter()
+    if None in [ReceiptTemplate.get(with_note) for with_note in (False, True)]:
+        sys.exit("modèle précompilé indisponible avec cette version de fpdf2")
+    print(f"compilation du modèle : {(time.perf_counter() - started) * 1000:6.1f} ms (une fois par processus, vérification comprise)")
+
+    started = time.perf_counter()
+    for data in payloads:
+        render_receipt(data)
+    after = (time.perf_counter() - started) / count
+    print(f"modèle précompilé     : {after * 1000:6.3f} ms par reçu (x{before / after:.1f})")
+
+    creation_date = datetime.now(timezone.utc).replace(microsecond=0)
+    identical = 0
+    for data in payloads[:2]:
+        pdf = ReceiptPDF(data)
+        pdf.set_creation_date(creation_date)
+        values = ReceiptTemplate.fields(data)
+        template = ReceiptTemplate.get(values["note"] != "Aucune note")
+        identical += pdf.generate() == template.render(values, creation_date)
+    print(f"rendus identiques (sans note, avec note) : {identical}/2")
@@ -0,0 +1,177 @@
+# benchmarks/bench_receipt_uploads.py
+"""
+Mesure l'envoi des reçus d'un lot vers Cloudinary (receipt_uploads.UploadJobs)
+contre un serveur HTTP local qui tient lieu de l'API d'envoi de Cloudinary
+(POST /v1_1/<cloud>/raw/upload) : latence fixe par envoi et une part de
+réponses 503, pour exercer les nouveaux essais. Seuls les participants payés
+(virement COMPLETED enregistré dans le segment) ont un reçu.
+
+Affiche le débit, le nombre de requêtes reçues par le serveur (nouveaux essais
+compris), les reçus renseignés dans le segment, puis un second envoi du même
+lot, qui ne doit rien renvoyer (index des envois). Pendant l'envoi, le thread
+principal lit des pages du lot comme le ferait une requête : la latence de
+ces lectures montre que l'envoi ne bloque pas les autres threads.
+
+Aucune base ni compte Cloudinary n'est nécessaire (répertoires temporaires).
+Usage : python benchmarks/bench_receipt_uploads.py [nb_participants] [threads] [latence ms] [part de 503]
+        (défaut : 50000 participants, Config.UPLOAD_WORKERS threads, 20 ms, 0.02)
+"""
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cloudinary
+
+from config import Config
+
+
+class StandInCloudinary(BaseHTTPRequestHandler):
+    """API d'envoi de Cloudinary réduite : enregistre le public_id et rend son URL."""
+    latency = 0.02
+    failure_rate = 0.02
+    lock = threading.Lock()
+    requests = failures = 0
+    stored = set()
+    protocol_version = "HTTP/1.1"
+    # En-têtes et corps en un seul envoi (sinon Nagle et l'ACK retardé ajoutent ~40 ms par réponse)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    _FIELD = re.compile(rb'name="(public_id|folder)"\r\n\r\n([^\r]*)\r\n')
+
+    def fails(self, fields):
+        """L'envoi des champs `fields` reçoit-il un 503 ? (appelé sous le verrou)"""
+        return random.random() < self.failure_rate
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.latency)
+        fields = {name.decode(): value.decode() for name, value in self._FIELD.findall(body)}
+        server = type(self)
+        with self.lock:
+            server.requests += 1
+            failed = self.fails(fields)
+            if failed:
+                server.failures += 1
+            else:
+                server.stored.add(fields["public_id"])
+        if failed:
+            self._reply(503, {"error": {"message": "Service Unavailable"}})
+        else:
+            public_id = f"{fields.get('folder')}/{fields['public_id']}"
+            self._reply(200, {"public_id": public_id, "resource_type": "raw",
+                              "secure_url": f"https://res.cloudinary.com/bench/raw/upload/v1/{public_id}"})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_participants(count):
+    """Participants d'un lot : une ligne sur 50 refusée, une sur 10 valide mais pas encore payée."""
+    for i in range(count):
+        refused = i % 50 == 0
+        participant = {
+            "type_id": "MSISDN",
+            "valeur_id": f"229{i:08d}",
+            "devise": "XOF",
+            "montant": str(50000 + i % 1000),
+            "nom_complet": f"Awa Koné {i}",
+            "status": "refusé" if refused else "valide",
+            "receipt": None,
+            "errors": ["MSISDN_INVALID"] if refused else [],
+        }
+        if not refused and i % 10:
+            participant["transfer"] = {
+                "transferId": f"bench-{i:08d}",
+                "homeTransactionId": f"bench-{i:08d}",
+                "from": {"name": "Caisse des pensions", "idType": "MSISDN", "idValue": "22900000000"},
+                "to": {"idType": "MSISDN", "idValue": participant["valeur_id"], "firstName": "Awa",
+                       "middleName": "", "lastName": f"Koné {i}"},
+                "amount": participant["montant"],
+                "currency": "XOF",
+                "note": "Pension",
+                "currentState": "COMPLETED",
+                "completedTimestamp": "2026-10-01T09:00:00.000Z",
+            }
+        yield participant
+
+
+def run(jobs, store, batch_id):
+    """Envoie un lot ; retourne l'état final, la durée et les latences (ms) des lectures faites pendant l'envoi."""
+    started = time.perf_counter()
+    job = jobs.submit(batch_id)
+    latencies = []
+    while jobs.status(job["job_id"])["status"] not in ("completed", "failed"):
+        request_started = time.perf_counter()
+        store.participant_page(batch_id, "valide", random.randrange(0, 1000), 100)
+        latencies.append((time.perf_counter() - request_started) * 1000)
+        time.sleep(0.05)
+    return jobs.status(job["job_id"]), time.perf_counter() - started, latencies
+
+
+def report(label, state, elapsed, latencies, requests, failures):
+    print(f"{label} : {state['status']} en {elapsed:6.1f} s ({state['receipts_done'] / elapsed:6.0f} reçus/s), "
+          f"{state['receipts_uploaded']} envoyés, {state['receipts_deduplicated']} déjà présents, "
+          f"{state['receipts_failed']} en échec, {state['receipts_skipped']} sans reçu ; serveur : {requests} requêtes dont {failures} en 503")
+    if latencies:
+        latencies.sort()
+        print(f"    lectures pendant l'envoi : médiane {statistics.median(latencies):.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:.1f} ms, max {latencies[-1]:.1f} ms "
+              f"({len(latencies)} lectures)")
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore", DeprecationWarning)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else Config.UPLOAD_WORKERS
+    StandInCloudinary.latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 20) / 1000
+    StandInCloudinary.failure_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.02
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInCloudinary)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cloudinary.config(cloud_name="bench", api_key="bench", api_secret="bench", secure=True,
+                      upload_prefix=f"http://127.0.0.1:{server.server_port}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        Config.BATCH_STORE_DIR = os.path.join(workdir, "batches")
+        Config.UPLOAD_BACKOFF = 0.05
+        from batch_store import get_store
+        from receipt_uploads import UploadJobs
+
+        store = get_store()
+        batch = store.append_batch(make_participants(count), "BENCH")
+        jobs = UploadJobs(os.path.join(workdir, "uploads"), workers)
+        paid = sum(1 for participant in make_participants(count) if "transfer" in participant)
+        print(f"{count} participants ({batch['valid']} valides, {paid} payés), {workers} threads d'envoi, "
+              f"latence {StandInCloudinary.latency * 1000:.0f} ms, {StandInCloudinary.failure_rate:.0%} de 503, "
+              f"{os.cpu_count()} cœur(s)")
+
+        state, elapsed, latencies = run(jobs, store, "BENCH")
+        report("premier envoi", state, elapsed, latencies, StandInCloudinary.requests, StandInCloudinary.failures)
+        filled = sum(1 for participant in store.iter_participants("BENCH") if participant.get("receipt"))
+        print(f"    reçus renseignés dans le segment : {filled}, public_id distincts côté serveur : "
+              f"{len(StandInCloudinary.stored)}, récapitulatif : {state['summary_pdf_url']}")
+
+        requests, failures = StandInCloudinary.requests, StandInCloudinary.failures
+        state, elapsed, latencies = run(jobs, store, "BENCH")
+        report("second envoi ", state, elapsed, latencies, StandInCloudinary.requests - requests,
+               StandInCloudinary.failures - failures)
+    server.shutdown()
@@ -0,0 +1,63 @@
+# benchmarks/bench_receipts.py
+"""
+Mesure la génération de reçus par lot (receipts.render_receipts) selon le
+nombre de processus, contre le rendu séquentiel d'un reçu après l'autre
+(ce que fait /pdf/generate_receipt appelé en boucle, HTTP en moins).
+
+Affiche le débit en reçus/s et en reçus/s par cœur, puis le coût de
+l'archive ZIP construite au fil de l'eau (receipts.stream_zip).
+Aucune base n'est nécessaire : les reçus sont faits à partir de transaction.json.
+Usage : python benchmarks/bench_receipts.py [nb_reçus] [processus max]
+        (défaut : 5000 reçus, jusqu'au nombre de cœurs)
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.ReceiptPDF import ReceiptPDF
+from receipts import render_receipts, stream_zip
+
+
+def make_payloads(count):
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "transaction.json")) as f:
+        data = json.load(f)["data"]
+    return [dict(data, homeTransactionId=f"bench-{i:08d}", amount=str(50000 + i % 1000)) for i in range(count)]
+
+
+if __name__ == '__main__':
+    warnings.simplefilter("ignore", DeprecationWarning)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    payloads = make_payloads(count)
+    print(f"{count} reçus, {os.cpu_count()} cœur(s)")
+
+    started = time.perf_counter()
+    for data in payloads:
+        ReceiptPDF(data).generate()
+    baseline = time.perf_counter() - started
+    print(f"séquentiel     : {count / baseline:7.0f} reçus/s ({baseline / count * 1000:5.2f} ms par reçu)")
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["receipts"])
+    workers = 1
+    while workers <= max_workers:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            # Démarrer les processus avant de mesurer
+            list(executor.map(abs, range(workers)))
+            started = time.perf_counter()
+            rendered = sum(1 for _, _, pdf, _ in render_receipts(payloads, executor, window=2 * workers) if pdf)
+            elapsed = time.perf_counter() - started
+
+            started = time.perf_counter()
+            size = sum(len(part) for part in stream_zip(render_receipts(payloads, executor, window=2 * workers)))
+            zipped = time.perf_counter() - started
+        print(f"{workers:2d} processus   : {count / elapsed:7.0f} reçus/s, {count / elapsed / workers:7.0f} reçus/s par cœur, "
+              f"accélération x{baseline / elapsed:4.2f}, {rendered} rendus ; "
+              f"en ZIP : {count / zipped:7.0f} reçus/s ({size / 1024 / 1024:.1f} Mo)")
+        workers *= 2
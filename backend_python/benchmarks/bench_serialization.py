@@ -0,0 +1,85 @@
+# benchmarks/bench_serialization.py
+"""
+Micro-benchmark des endpoints de liste : ancien chemin (curseur dictionary=True,
+Pensioner(**row) à __dict__, dict reconstruit à la main, jsonify) contre le
+nouveau (curseur tuple, Pensioner(*row) à __slots__, serializer en une passe).
+
+Aucune base n'est nécessaire : les lignes du curseur sont simulées.
+Usage : python benchmarks/bench_serialization.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from models.pensioner_model import Pensioner
+from serializer import json_response
+
+app = Flask(__name__)
+
+
+class LegacyPensioner:
+    """Copie de l'ancienne classe Pensioner (attributs dans __dict__)."""
+    def __init__(self, id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at=None, updated_at=None):
+        self.id = id
+        self.unique_id = unique_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.type_id = type_id
+        self.msisdn = msisdn
+        self.amount = amount
+        self.currency = currency
+        self.comment = comment
+        self.status = status
+        self.home_transaction_id = home_transaction_id
+        self.batch_id = batch_id
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+def make_tuples(count):
+    now = datetime(2025, 1, 31, 8, 30)
+    return [(i, f"PEN{i:08d}", "Awa", "Koné", "MSISDN", f"229{i:08d}", Decimal("50000.00"), "XOF",
+             None, "pending", None, 1, now, now) for i in range(count)]
+
+
+def legacy_path(tuples):
+    rows = [dict(zip(Pensioner.FIELDS, row)) for row in tuples]  # curseur dictionary=True
+    pensioners = [LegacyPensioner(**row) for row in rows]
+    pensioner_list = [{
+        "id": p.id, "unique_id": p.unique_id, "first_name": p.first_name, "last_name": p.last_name,
+        "msisdn": p.msisdn, "amount": p.amount, "currency": p.currency, "comment": p.comment,
+        "status": p.status, "home_transaction_id": p.home_transaction_id, "batch_id": p.batch_id,
+        "created_at": p.created_at, "updated_at": p.updated_at
+    } for p in pensioners]
+    return jsonify({"message": "Pensionnés récupérés avec succès", "pensioners": pensioner_list}).get_data()
+
+
+def new_path(tuples):
+    pensioners = [Pensioner(*row) for row in tuples]
+    return json_response({"message": "Pensionnés récupérés avec succès", "pensioners": pensioners}).get_data()
+
+
+def measure(function, tuples):
+    started = time.perf_counter()
+    function(tuples)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    function(tuples)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        for count in (10_000, 100_000):
+            tuples = make_tuples(count)
+            for label, function in (("ancien", legacy_path), ("nouveau", new_path)):
+                elapsed, peak = measure(function, tuples)
+                print(f"{count:>7} lignes  {label:<8} {elapsed * 1000:8.1f} ms   pic mémoire {peak / 1e6:7.1f} Mo")
@@ -0,0 +1,98 @@
+# benchmarks/bench_validation.py
+"""
+Mesure la validation d'un fichier de paiement : moteur vectorisé
+(validation.CsvValidator, pandas/NumPy) contre les mêmes contrôles écrits
+ligne par ligne en Python.
+
+Le fichier généré contient quelques erreurs de chaque sorte (cellule vide,
+msisdn mal formé, montant négatif ou non numérique, devise inconnue, doublon).
+Aucune base n'est nécessaire.
+Usage : python benchmarks/bench_validation.py [nb_lignes]   (défaut : 1000000)
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from validation import _AMOUNT_PATTERN, CsvValidator, decode
+
+
+def make_frame(count):
+    index = np.arange(count)
+    msisdn = pd.Series(index).map("229{:08d}".format)
+    amount = pd.Series(50000 + index % 1000).astype(str)
+    currency = pd.Series(["XOF"] * count)
+    name = pd.Series(index).map("Awa Koné {}".format)
+
+    # Environ 1 % de lignes en erreur
+    msisdn[index % 499 == 1] = "22A123"
+    amount[index % 503 == 2] = "-10"
+    amount[index % 509 == 3] = "abc"
+    currency[index % 521 == 4] = "EUR"
+    name[index % 541 == 5] = ""
+    msisdn[index % 547 == 6] = msisdn[0]
+    return pd.DataFrame({
+        "type_id": "MSISDN",
+        "valeur_id": msisdn,
+        "devise": currency,
+        "montant": amount,
+        "nom_complet": name,
+    })
+
+
+def validate_per_row(records):
+    """Mêmes contrôles, ligne par ligne (dicts, comme csv.DictReader)."""
+    pattern = re.compile(Config.MSISDN_PATTERN)
+    amount_pattern = re.compile(_AMOUNT_PATTERN)
+    currencies = {currency.upper() for currency in Config.ALLOWED_CURRENCIES}
+    seen = set()
+    errors = []
+    for row in records:
+        codes = []
+        values = {key: str(value).strip() for key, value in row.items()}
+        if any(value == "" for value in values.values()):
+            codes.append("EMPTY_FIELD")
+        msisdn = values["valeur_id"]
+        if msisdn and values["type_id"].upper() in ("MSISDN", "") and not pattern.fullmatch(msisdn):
+            codes.append("MSISDN_INVALID")
+        if values["montant"]:
+            if not amount_pattern.fullmatch(values["montant"]):
+                codes.append("AMOUNT_INVALID")
+            elif float(values["montant"].replace(",", ".")) <= 0:
+                codes.append("AMOUNT_NOT_POSITIVE")
+        if values["devise"] and values["devise"].upper() not in currencies:
+            codes.append("CURRENCY_INVALID")
+        if msisdn:
+            key = f"{values['type_id']}-{msisdn}"
+            if key in seen:
+                codes.append("DUPLICATE_UNIQUE_ID")
+            seen.add(key)
+        errors.append(codes)
+    return errors
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    frame = make_frame(count)
+
+    started = time.perf_counter()
+    masks = CsvValidator().validate(frame)
+    vectorized = time.perf_counter() - started
+    refused = int(np.count_nonzero(masks))
+    print(f"vectorisé      : {vectorized:6.2f}s pour {count} lignes ({count / vectorized:10.0f} lignes/s), {refused} refusées")
+
+    records = frame.to_dict(orient="records")
+    started = time.perf_counter()
+    per_row = validate_per_row(records)
+    python = time.perf_counter() - started
+    print(f"ligne à ligne  : {python:6.2f}s pour {count} lignes ({count / python:10.0f} lignes/s), "
+          f"{sum(1 for codes in per_row if codes)} refusées")
+
+    mismatches = sum(1 for mask, codes in zip(masks.tolist(), per_row) if sorted(decode(mask)) != sorted(codes))
+    print(f"écarts entre les deux : {mismatches}")
@@ -0,0 +1,693 @@
+# beneficiary_index.py
+"""
+Index des bénéficiaires déjà payés, pour bloquer un double paiement dès l'import.
+
+Chaque ligne valide d'un lot importé y est inscrite sous deux clés, unique_id
+et msisdn, rattachées à la période de paiement (AAAA-MM). Une ligne d'un
+nouveau fichier dont l'une des clés a déjà été payée dans la même période
+reçoit le code DUPLICATE_PAYMENT et est refusée.
+
+Les clés sont les empreintes 64 bits de validation.key_hashes, combinées à
+la période et au type de clé. En mémoire, elles sont rangées dans une table
+de hachage à adressage ouvert (tableaux NumPy, sondage linéaire) interrogée
+pour tout un paquet de lignes à la fois : O(1) par ligne. Un filtre de Bloom
+par blocs (Config.BENEFICIARY_BLOOM_BITS bits par clé, un mot de 64 bits par
+clé) écarte d'abord la plupart des clés jamais vues, avec un seul accès à une
+petite zone de mémoire au lieu d'un accès à la table.
+
+Les clés d'un import sont réservées dès le contrôle de chaque paquet, sous
+le verrou de l'index : un import simultané de la même période les voit déjà
+comme payées. Une fois le lot enregistré, la réservation lui est rattachée ;
+un import refusé, en échec ou annulé libère la sienne. Une réservation jamais
+close (arrêt brutal) est ignorée après Config.BENEFICIARY_RESERVATION_TTL
+secondes. Un lot supprimé ou remplacé est retiré de l'index (unregister) :
+ses clés peuvent de nouveau être payées, et une nouvelle inscription les
+reprend.
+
+Répertoire (Config.BENEFICIARY_INDEX_DIR) :
+- entries.bin : journal en ajout seul des clés inscrites (empreinte uint64,
+  référence du lot uint32) ; pour une clé inscrite plusieurs fois, la
+  dernière l'emporte ;
+- batches.jsonl : une ligne par lot inscrit ou réservation (référence, lot,
+  origine, période, fin de ses clés dans entries.bin), écrite après ses clés,
+  et par opération sans clé : "commit" (réservation rattachée à un lot),
+  "remove" (lot retiré, réservation libérée) ;
+- .lock : verrou (fcntl.flock), exclusif pour écrire, partagé pour relire.
+
+Seules les clés couvertes par une ligne de batches.jsonl sont lues : des clés
+écrites juste avant un arrêt brutal sont ignorées puis écrasées. Comme dans
+batch_store.py, le journal est relu de façon incrémentale. rebuild_from_db
+reconstruit l'index depuis la table pensioners ; les autres processus le
+voient au changement d'inode de batches.jsonl.
+"""
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+from validation import DUPLICATE_PAYMENT, ERROR_CODES, CsvValidator, identity_columns, key_hashes
+
+_PAYMENT_BIT = np.uint8(1 << ERROR_CODES.index(DUPLICATE_PAYMENT))
+_PERIOD = re.compile(r"\d{4}-(0[1-9]|1[0-2])")
+# Colonnes qui forment unique_id et msisdn (validation.identity_columns)
+_IDENTITY_COLUMNS = ("type_id", "unique_id", "msisdn", "valeur_id")
+# Clé inscrite : empreinte et référence du lot (position dans batches.jsonl)
+ENTRY = np.dtype([("hash", "<u8"), ("ref", "<u4")])
+# Origine des clés réservées par un import en cours (PaymentCheck)
+RESERVATION = "reservation"
+
+
+def payment_period(value=None):
+    """Période de paiement "AAAA-MM" : `value` vérifiée, ou le mois en cours."""
+    if value is None or value == "":
+        return datetime.now().strftime("%Y-%m")
+    if not _PERIOD.fullmatch(str(value)):
+        raise ValueError(f"Période invalide : {value} (AAAA-MM attendu)")
+    return str(value)
+
+
+@lru_cache(maxsize=256)
+def _salt(kind, period):
+    return pd.util.hash_pandas_object(pd.Series([f"{kind}:{period}"]), index=False).to_numpy()[0]
+
+
+def identity_hashes(frame):
+    """Empreintes (n, 2) des clés de chaque ligne de `frame`, non rattachées à une période, et masque (n, 2) des clés renseignées.
+
+    Colonne 0 : unique_id (validation.identity_columns) ; colonne 1 : msisdn sans "+" initial.
+    """
+    text = CsvValidator._text(frame[[column for column in frame.columns if column in _IDENTITY_COLUMNS]])
+    hashes = np.zeros((len(text), 2), dtype=np.uint64)
+    present = np.zeros((len(text), 2), dtype=bool)
+    if text.empty:
+        return hashes, present
+    _, msisdn, unique_id = identity_columns(text)
+    for position, keys in enumerate((unique_id, msisdn.str.lstrip("+") if msisdn is not None else None)):
+        if keys is not None:
+            hashes[:, position], present[:, position] = key_hashes(keys)
+    return hashes, present
+
+
+def salt_keys(hashes, present, period):
+    """Clés de paiement de `period` à partir des empreintes de identity_hashes. Retourne (clés, renseignées)."""
+    salted = hashes ^ np.array([_salt("unique_id", period), _salt("msisdn", period)], dtype=np.uint64)
+    # 0 marque une case vide de la table
+    salted[salted == 0] = 1
+    return salted, present
+
+
+def payment_keys(frame, period):
+    """Clés de paiement des lignes de `frame` pour `period` : (clés, renseignées), tableaux (n, 2).
+
+    Calcul sans index : utilisable dans les processus de calcul de parallel_ingestion.
+    """
+    return salt_keys(*identity_hashes(frame), period)
+
+
+class _HashTable:
+    """Table de hachage à adressage ouvert et sondage linéaire : empreinte (0 = case vide) -> référence de lot."""
+
+    MAX_LOAD = 0.7
+
+    def __init__(self, capacity=1 << 16):
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.refs = np.zeros(capacity, dtype=np.uint32)
+        self.size = 0
+
+    def _slots(self, hashes):
+        return (hashes & np.uint64(len(self.keys) - 1)).astype(np.intp)
+
+    def locate(self, hashes):
+        """Case de chaque empreinte, -1 si elle est absente."""
+        found = np.full(len(hashes), -1, dtype=np.int64)
+        mask = len(self.keys) - 1
+        pending = np.arange(len(hashes))
+        slots = self._slots(hashes)
+        # Un tour par case sondée : seules les empreintes pas encore résolues avancent
+        while len(pending):
+            keys = self.keys[slots]
+            hit = keys == hashes[pending]
+            found[pending[hit]] = slots[hit]
+            more = ~hit & (keys != 0)
+            pending = pending[more]
+            slots = (slots[more] + 1) & mask
+        return found
+
+    def find(self, hashes):
+        """Référence de chaque empreinte, -1 si elle est absente."""
+        slots = self.locate(hashes)
+        found = np.full(len(hashes), -1, dtype=np.int64)
+        present = slots >= 0
+        found[present] = self.refs[slots[present]]
+        return found
+
+    def assign(self, hashes, refs):
+        """Rattache les empreintes aux références `refs` : ajoutées si absentes, sinon leur référence est remplacée.
+
+        Pour une empreinte répétée, la dernière référence l'emporte.
+        """
+        last = len(hashes) - 1 - np.unique(hashes[::-1], return_index=True)[1]
+        hashes, refs = hashes[last], refs[last]
+        slots = self.locate(hashes)
+        present = slots >= 0
+        self.refs[slots[present]] = refs[present]
+        self.insert(hashes[~present], refs[~present])
+
+    def insert(self, hashes, refs):
+        """Ajoute les empreintes absentes (une empreinte présente garde sa référence). Retourne le nombre ajouté."""
+        hashes, first = np.unique(hashes, return_index=True)
+        refs = refs[first]
+        if self.size + len(hashes) > self.MAX_LOAD * len(self.keys):
+            self._grow(self.size + len(hashes))
+        mask = len(self.keys) - 1
+        pending = np.arange(len(hashes))
+        slots = self._slots(hashes)
+        added = 0
+        while len(pending):
+            keys = self.keys[slots]
+            wanted = hashes[pending]
+            free = np.flatnonzero(keys == 0)
+            # Plusieurs empreintes visent la même case vide : une seule y reste écrite,
+            # les autres la retrouvent occupée au tour suivant et avancent
+            self.keys[slots[free]] = wanted[free]
+            winners = free[self.keys[slots[free]] == wanted[free]]
+            self.refs[slots[winners]] = refs[pending[winners]]
+            added += len(winners)
+
+            settled = keys == wanted
+            settled[winners] = True
+            advance = (keys != 0) & ~settled
+            retry = ~settled
+            slots = np.where(advance, (slots + 1) & mask, slots)[retry]
+            pending = pending[retry]
+        self.size += added
+        return added
+
+    def _grow(self, count):
+        capacity = len(self.keys)
+        while count > self.MAX_LOAD * capacity:
+            capacity *= 2
+        used = self.keys != 0
+        keys, refs = self.keys[used], self.refs[used]
+        self.keys = np.zeros(capacity, dtype=np.uint64)
+        self.refs = np.zeros(capacity, dtype=np.uint32)
+        self.size = 0
+        self.insert(keys, refs)
+
+    def nbytes(self):
+        return self.keys.nbytes + self.refs.nbytes
+
+
+class _BlockedBloom:
+    """Filtre de Bloom par blocs : les K bits d'une clé tombent dans un même mot de 64 bits."""
+
+    K = 6
+
+    def __init__(self, keys, bits_per_key):
+        words = 1024
+        while words * 64 < keys * bits_per_key:
+            words *= 2
+        self.words = np.zeros(words, dtype=np.uint64)
+        self.capacity = words * 64 // bits_per_key
+        # Bits de poids fort pour le mot, de poids faible pour les positions dans le mot
+        self._shift = np.uint64(64 - (words.bit_length() - 1))
+
+    def _locate(self, hashes):
+        blocks = (hashes >> self._shift).astype(np.intp)
+        bits = np.zeros(len(hashes), dtype=np.uint64)
+        for position in range(self.K):
+            bits |= np.uint64(1) << ((hashes >> np.uint64(6 * position)) & np.uint64(63))
+        return blocks, bits
+
+    def add(self, hashes):
+        blocks, bits = self._locate(hashes)
+        np.bitwise_or.at(self.words, blocks, bits)
+
+    def might_contain(self, hashes):
+        blocks, bits = self._locate(hashes)
+        return (self.words[blocks] & bits) == bits
+
+
+class BeneficiaryIndex:
+    """Clés (unique_id, msisdn) déjà payées par période, avec le lot où elles l'ont été."""
+
+    def __init__(self, root, bloom_bits=None):
+        self.root = root
+        self.entries_path = os.path.join(root, "entries.bin")
+        self.batches_path = os.path.join(root, "batches.jsonl")
+        self._lock_path = os.path.join(root, ".lock")
+        self.bloom_bits = Config.BENEFICIARY_BLOOM_BITS if bloom_bits is None else bloom_bits
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self._table = _HashTable()
+        self._bloom = _BlockedBloom(0, self.bloom_bits) if self.bloom_bits else None
+        self._batches = []  # référence -> métadonnées du lot (ou de l'opération)
+        self._owners = {}  # (origine, lot) -> références de ses clés
+        self._removed = set()  # références des lots retirés et des réservations libérées
+        self._reserved_at = {}  # référence d'une réservation -> horodatage de sa ligne
+        self._inode = inode
+        self._batches_offset = 0
+        self._entries_end = 0
+
+    @contextmanager
+    def _locked(self, operation=fcntl.LOCK_EX):
+        """Verrou entre processus (un descripteur par prise) : LOCK_EX pour écrire, LOCK_SH pour relire."""
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Relit les lots et les clés inscrits depuis la dernière lecture."""
+        try:
+            stat = os.stat(self.batches_path)
+        except FileNotFoundError:
+            stat = None
+        with self._lock:
+            if stat is not None and stat.st_ino == self._inode and stat.st_size == self._batches_offset:
+                return
+        with self._locked(fcntl.LOCK_SH):
+            self._load_new()
+
+    def _load_new(self):
+        """Comme _refresh, verrou de fichier déjà pris."""
+        with self._lock:
+            try:
+                stat = os.stat(self.batches_path)
+            except FileNotFoundError:
+                if self._inode is not None:
+                    self._reset(None)
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._batches_offset:
+                self._reset(stat.st_ino)
+            if stat.st_size == self._batches_offset:
+                return
+
+            with open(self.batches_path, "rb") as f:
+                f.seek(self._batches_offset)
+                data = f.read(stat.st_size - self._batches_offset)
+            complete = data.rfind(b"\n") + 1
+            batches = [json.loads(line) for line in data[:complete].splitlines() if line.strip()]
+            self._batches_offset += complete
+            if not batches:
+                return
+
+            end = batches[-1]["end"]
+            with open(self.entries_path, "rb") as f:
+                f.seek(self._entries_end)
+                entries = np.frombuffer(f.read(end - self._entries_end), dtype=ENTRY)
+            for batch in batches:
+                self._apply(batch)
+            self._entries_end = end
+            self._add(entries["hash"], entries["ref"])
+
+    def _apply(self, batch):
+        """Prend en compte une ligne de batches.jsonl (verrou self._lock tenu)."""
+        self._batches.append(batch)
+        operation = batch.get("op")
+        if operation == "commit":
+            # Réservation devenue le lot enregistré : ses clés changent de propriétaire
+            refs = self._owners.pop((RESERVATION, batch["reservation"]), [])
+            for ref in refs:
+                self._reserved_at.pop(ref, None)
+                self._batches[ref] = dict(self._batches[ref], batch=batch["batch"], source=batch["source"],
+                                          reservation=batch["reservation"])
+            self._owners.setdefault((batch["source"], batch["batch"]), []).extend(refs)
+        elif operation == "remove":
+            self._removed.update(self._owners.pop((batch["source"], batch["batch"]), []))
+        else:
+            self._owners.setdefault((batch["source"], batch["batch"]), []).append(batch["ref"])
+            if batch["source"] == RESERVATION:
+                self._reserved_at[batch["ref"]] = datetime.fromisoformat(batch["recorded_at"]).timestamp()
+
+    def _add(self, hashes, refs):
+        # Clés écrites seulement si absentes ou tenues par un lot retiré : la dernière inscrite l'emporte
+        self._table.assign(hashes, refs)
+        if self._bloom is None:
+            return
+        if self._table.size > self._bloom.capacity:
+            # Filtre plein : recréé deux fois plus grand depuis la table
+            self._bloom = _BlockedBloom(2 * self._table.size, self.bloom_bits)
+            self._bloom.add(self._table.keys[self._table.keys != 0])
+        else:
+            self._bloom.add(hashes)
+
+    def find(self, hashes):
+        """Référence du lot où chaque empreinte a été payée (-1 si jamais payée)."""
+        self._refresh()
+        with self._lock:
+            if self._bloom is None:
+                return self._table.find(hashes)
+            found = np.full(len(hashes), -1, dtype=np.int64)
+            candidates = np.flatnonzero(self._bloom.might_contain(hashes))
+            found[candidates] = self._table.find(hashes[candidates])
+            return found
+
+    def _released(self, ref, reservation, expired):
+        """La référence `ref` ne tient plus ses clés : lot retiré, réservation libérée ou expirée, ou réservation de l'appelant."""
+        if ref in self._removed or self._reserved_at.get(ref, expired) < expired:
+            return True
+        batch = self._batches[ref]
+        return reservation is not None and (batch.get("reservation") == reservation or (
+            batch["source"] == RESERVATION and batch["batch"] == reservation))
+
+    def _held(self, refs, reservation=None):
+        """Masque des références tenues par un lot ou une réservation en cours autre que `reservation` (verrou tenu)."""
+        held = refs >= 0
+        expired = time.time() - Config.BENEFICIARY_RESERVATION_TTL
+        released = [ref for ref in np.unique(refs[held]).tolist() if self._released(ref, reservation, expired)]
+        if released:
+            held &= ~np.isin(refs, released)
+        return held
+
+    def _paid(self, hashes, present, reservation=None):
+        found = np.zeros(present.shape, dtype=bool)
+        found[present] = self._held(self._table.find(hashes[present]), reservation)
+        return found.any(axis=1)
+
+    def paid(self, hashes, present, reservation=None):
+        """Masque des lignes (tableaux de payment_keys) dont une clé renseignée a déjà été payée.
+
+        Une clé compte si elle est tenue par un lot inscrit ou par une
+        réservation en cours, sauf la réservation `reservation` (celle de l'appelant).
+        """
+        self._refresh()
+        with self._lock:
+            return self._paid(hashes, present, reservation)
+
+    def reserve(self, hashes, present, valid, reservation, period):
+        """Contrôle puis réservation, sous le verrou de l'index : retourne le masque des lignes déjà payées.
+
+        Les clés des lignes `valid` non payées sont inscrites au nom de la
+        réservation `reservation` : un autre import de la période les voit
+        aussitôt comme payées. commit les rattache au lot enregistré, release
+        les libère.
+        """
+        with self._locked():
+            self._load_new()
+            with self._lock:
+                paid = self._paid(hashes, present, reservation)
+                keep = valid & ~paid
+                new = np.unique(hashes[keep][present[keep]])
+                # Déjà réservées par l'appelant (paquet rejoué) : pas réinscrites
+                new = new[~self._held(self._table.find(new))]
+                ref, start = len(self._batches), self._entries_end
+            if len(new):
+                self._append(self.entries_path, self.batches_path, start, new, {
+                    "ref": ref, "batch": reservation, "source": RESERVATION, "period": period, "keys": len(new),
+                    "recorded_at": datetime.now().isoformat()
+                })
+                self._load_new()
+        return paid
+
+    def _operation(self, operation, **fields):
+        """Ajoute une ligne d'opération (sans clé) à batches.jsonl (verrous tenus, index à jour)."""
+        self._append(self.entries_path, self.batches_path, self._entries_end, np.empty(0, dtype=np.uint64), {
+            "ref": len(self._batches), "op": operation, "keys": 0, "recorded_at": datetime.now().isoformat(),
+            **fields
+        })
+        self._load_new()
+
+    def _keys(self, owner):
+        return sum(self._batches[ref]["keys"] for ref in self._owners.get(owner, []))
+
+    def commit(self, reservation, batch, source, period):
+        """Rattache les clés de la réservation au lot `batch` (origine "json" ou "db"). Retourne leur nombre.
+
+        Comme record, un lot déjà inscrit ne l'est pas une seconde fois.
+        """
+        batch = str(batch)
+        with self._locked():
+            self._load_new()
+            with self._lock:
+                if (source, batch) in self._owners:
+                    return 0
+                keys = self._keys((RESERVATION, reservation))
+            self._operation("commit", reservation=reservation, batch=batch, source=source, period=period)
+        return keys
+
+    def release(self, reservation):
+        """Libère les clés d'une réservation (import refusé, en échec ou annulé). Retourne leur nombre."""
+        return self.unregister(reservation, RESERVATION)
+
+    def unregister(self, batch, source):
+        """Retire un lot de l'index (supprimé, annulé ou remplacé) : ses clés peuvent de nouveau être payées.
+
+        Retourne le nombre de clés libérées (0 si le lot n'est pas inscrit).
+        """
+        batch = str(batch)
+        with self._locked():
+            self._load_new()
+            with self._lock:
+                if (source, batch) not in self._owners:
+                    return 0
+                keys = self._keys((source, batch))
+            self._operation("remove", batch=batch, source=source)
+        return keys
+
+    def registered(self):
+        """Lots inscrits : ensemble de (origine, lot), réservations exclues."""
+        self._refresh()
+        with self._lock:
+            return {owner for owner in self._owners if owner[0] != RESERVATION}
+
+    def batch(self, ref):
+        """Métadonnées du lot de référence `ref`, ou None."""
+        self._refresh()
+        with self._lock:
+            return self._batches[ref] if 0 <= ref < len(self._batches) else None
+
+    def record(self, hashes, batch, source, period):
+        """Inscrit des empreintes comme payées dans le lot `batch` (origine "json" ou "db"). Retourne le nombre de clés nouvelles.
+
+        Un lot déjà inscrit (même origine, même identifiant) ne l'est pas une
+        seconde fois : rejouer la fin d'un import ne change rien.
+        """
+        batch = str(batch)
+        with self._locked():
+            self._load_new()
+            with self._lock:
+                if (source, batch) in self._owners:
+                    return 0
+                new = np.unique(hashes)
+                new = new[~self._held(self._table.find(new))]
+                ref, start = len(self._batches), self._entries_end
+            self._append(self.entries_path, self.batches_path, start, new, {
+                "ref": ref, "batch": batch, "source": source, "period": period, "keys": len(new),
+                "recorded_at": datetime.now().isoformat()
+            })
+            self._load_new()
+        return len(new)
+
+    @staticmethod
+    def _append(entries_path, batches_path, start, hashes, batch):
+        """Écrit les clés d'un lot à partir de `start` (ce qui suit est un reste d'écriture interrompue), puis sa ligne."""
+        entries = np.empty(len(hashes), dtype=ENTRY)
+        entries["hash"] = hashes
+        entries["ref"] = batch["ref"]
+        with open(entries_path, "ab") as f:
+            f.truncate(start)
+            f.write(entries.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        line = (json.dumps(dict(batch, end=start + entries.nbytes), ensure_ascii=False) + "\n").encode("utf-8")
+        fd = os.open(batches_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return start + entries.nbytes
+
+    def rebuild_from_db(self, fetch_size=10000):
+        """Reconstruit l'index depuis la table pensioners. Retourne {"batches", "keys"}.
+
+        Chaque pensionné (hors statut failed, qui peut être payé à nouveau)
+        est inscrit dans le lot dont il fait partie, pour le mois de création
+        de ce lot. Les lots inscrits depuis le magasin de lots, ou pendant la
+        reconstruction, et les réservations en cours sont conservés ; les lots
+        retirés (unregister) ne le sont pas.
+        """
+        started = datetime.now().isoformat()
+        entries_path = f"{self.entries_path}.{os.getpid()}.tmp"
+        batches_path = f"{self.batches_path}.{os.getpid()}.tmp"
+        table = _HashTable()
+        state = {"end": 0, "refs": 0, "keys": 0}
+
+        def write(hashes, batch, source, period, recorded_at=None):
+            new = np.unique(hashes)
+            new = new[table.find(new) < 0]
+            table.insert(new, np.full(len(new), state["refs"], dtype=np.uint32))
+            state["end"] = self._append(entries_path, batches_path, state["end"], new, {
+                "ref": state["refs"], "batch": str(batch), "source": source, "period": period, "keys": len(new),
+                "recorded_at": recorded_at or started
+            })
+            state["refs"] += 1
+            state["keys"] += len(new)
+
+        for path in (entries_path, batches_path):
+            if os.path.exists(path):
+                os.remove(path)
+        db = Config.get_db_connection(dedicated=True)
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+        cursor = None
+        streaming = False
+        try:
+            cursor = db.cursor()
+            cursor.execute("""
+                SELECT b.batch_code, DATE_FORMAT(b.created_at, '%Y-%m'), p.unique_id, p.msisdn
+                FROM pensioners p JOIN batches b ON b.id = p.batch_id
+                WHERE p.status <> 'failed'
+                ORDER BY p.batch_id
+            """)
+            streaming = True
+            current, pending = None, []
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                frame = pd.DataFrame(rows, columns=["batch_code", "period", "unique_id", "msisdn"])
+                # Les lignes arrivent groupées par lot : un lot est inscrit dès que le suivant commence
+                for (batch_code, period), group in frame.groupby(["batch_code", "period"], sort=False):
+                    if current is not None and (batch_code, period) != current:
+                        write(np.concatenate(pending), current[0], "db", current[1])
+                        pending = []
+                    current = (batch_code, period)
+                    hashes, present = payment_keys(group, period)
+                    pending.append(hashes[present])
+            if current is not None:
+                write(np.concatenate(pending), current[0], "db", current[1])
+            streaming = False
+        except Exception as e:
+            print(f"Erreur lors de la reconstruction de l'index des bénéficiaires : {e}")
+            for path in (entries_path, batches_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise Exception(f"Erreur lors de la reconstruction de l'index des bénéficiaires : {e}")
+        finally:
+            if streaming:
+                Config.discard_db_connection(db)
+            else:
+                if cursor is not None:
+                    cursor.close()
+                db.close()
+
+        with self._locked():
+            self._load_new()
+            # Lots qui ne viennent pas de la table, ou inscrits pendant la lecture, et réservations en cours :
+            # recopiés sous leur propriétaire actuel
+            with self._lock:
+                live = self._held(np.arange(len(self._batches)))
+                kept = [batch for batch in self._batches if "op" not in batch and live[batch["ref"]]
+                        and (batch["source"] != "db" or batch["recorded_at"] >= started)]
+                bounds = [(self._batches[batch["ref"] - 1]["end"] if batch["ref"] else 0, batch["end"]) for batch in kept]
+            with open(self.entries_path, "rb") as f:
+                for batch, (start, end) in zip(kept, bounds):
+                    f.seek(start)
+                    hashes = np.frombuffer(f.read(end - start), dtype=ENTRY)["hash"]
+                    write(hashes, batch["batch"], batch["source"], batch["period"], batch["recorded_at"])
+            open(entries_path, "ab").close()
+            open(batches_path, "ab").close()
+            os.replace(entries_path, self.entries_path)
+            os.replace(batches_path, self.batches_path)
+            self._load_new()
+        return {"batches": state["refs"], "keys": state["keys"]}
+
+    def stats(self):
+        """Taille de l'index : lots, clés, mémoire de la table et du filtre de Bloom."""
+        self._refresh()
+        with self._lock:
+            return {
+                "batches": sum(1 for source, _ in self._owners if source != RESERVATION),
+                "reservations": sum(1 for source, _ in self._owners if source == RESERVATION),
+                "keys": self._table.size,
+                "table_slots": len(self._table.keys),
+                "table_bytes": self._table.nbytes(),
+                "bloom_bytes": self._bloom.words.nbytes if self._bloom is not None else 0,
+                "bloom_bits_per_key": self.bloom_bits
+            }
+
+
+class PaymentCheck:
+    """Contrôle d'un fichier contre l'index pour une période.
+
+    Les clés des lignes restées valides sont réservées dès le contrôle de
+    leur paquet (BeneficiaryIndex.reserve) : deux imports simultanés qui se
+    recoupent ne peuvent pas tous deux les accepter. commit les rattache au
+    lot une fois celui-ci enregistré ; release les libère si l'import est
+    refusé, échoue ou est annulé (sans effet après commit). `reservation`
+    identifie la réservation : un import repris après un arrêt garde la
+    sienne et ne se voit pas comme déjà payé. Avec `reserve=False`, contrôle
+    seul (rien n'est inscrit). Une instance par fichier.
+    """
+
+    def __init__(self, index, period, reservation=None, reserve=True):
+        self.index = index
+        self.period = period
+        self.reservation = reservation or uuid.uuid4().hex
+        self.reserve = reserve
+        self.flagged = 0
+
+    def flag(self, frame, masks):
+        """Masques d'erreurs de `frame` complétés par DUPLICATE_PAYMENT (voir apply)."""
+        return self.apply(masks, *payment_keys(frame, self.period))
+
+    def apply(self, masks, hashes, present):
+        """Pose DUPLICATE_PAYMENT sur les lignes déjà payées dans la période. Retourne les nouveaux masques."""
+        masks = np.asarray(masks, dtype=np.uint8)
+        if self.reserve:
+            paid = self.index.reserve(hashes, present, masks == 0, self.reservation, self.period)
+        else:
+            paid = self.index.paid(hashes, present)
+        self.flagged += int(np.count_nonzero(paid))
+        return masks | np.where(paid, _PAYMENT_BIT, np.uint8(0))
+
+    def commit(self, batch, source):
+        """Rattache les clés réservées au lot enregistré `batch`. Retourne le nombre de clés inscrites."""
+        return self.index.commit(self.reservation, batch, source, self.period)
+
+    def release(self):
+        """Libère les clés réservées et pas encore rattachées à un lot. Retourne leur nombre."""
+        if not self.reserve:
+            return 0
+        return self.index.release(self.reservation)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_beneficiary_index():
+    """Retourne l'index des bénéficiaires du processus, chargé à la première demande."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = BeneficiaryIndex(Config.BENEFICIARY_INDEX_DIR)
+        return _index
+
+
+def payment_check(period=None, reservation=None, reserve=True):
+    """Contrôle des doubles paiements pour `period` (voir payment_period), ou None si désactivé (BENEFICIARY_CHECK=0).
+
+    `reservation` et `reserve` : voir PaymentCheck.
+    """
+    period = payment_period(period)
+    if not Config.BENEFICIARY_CHECK:
+        return None
+    return PaymentCheck(get_beneficiary_index(), period, reservation, reserve)
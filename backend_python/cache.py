@@ -0,0 +1,216 @@
+# cache.py
+"""
+Cache de lecture LRU + TTL en mémoire pour les recherches unitaires des
+modèles (Pensioner.get_by_id, Batch.get_by_batch_code, ...).
+
+Chaque valeur est rangée sous une ou plusieurs clés (ex. "id:5" et
+"uid:PEN001") et rattachée à des étiquettes (ex. "id:5", "batch:3").
+Invalider une étiquette supprime toutes les clés qui y sont rattachées.
+
+Les invalidations passent par un bus : en local (LocalInvalidationBus) ou
+partagé entre workers via Redis (RedisInvalidationBus, si CACHE_REDIS_URL est
+défini et le paquet `redis` installé).
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import Config
+
+MISSING = object()
+
+
+class LocalInvalidationBus:
+    """Bus d'invalidation en mémoire : diffuse aux caches du même processus."""
+
+    def __init__(self):
+        self._subscribers = []
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def publish(self, namespace, tags):
+        for callback in list(self._subscribers):
+            callback(namespace, tags)
+
+
+class RedisInvalidationBus:
+    """Bus d'invalidation partagé entre processus via Redis pub/sub."""
+
+    def __init__(self, url, channel='pension:cache:invalidate'):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._channel = channel
+        self._origin = uuid.uuid4().hex
+        self._subscribers = []
+        self._listener = None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        if self._listener is None:
+            self._listener = threading.Thread(target=self._listen, daemon=True)
+            self._listener.start()
+
+    def publish(self, namespace, tags):
+        # Application locale immédiate, puis diffusion aux autres workers
+        for callback in list(self._subscribers):
+            callback(namespace, tags)
+        self._client.publish(self._channel, json.dumps([self._origin, namespace, list(tags)]))
+
+    def _listen(self):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel)
+        for message in pubsub.listen():
+            try:
+                origin, namespace, tags = json.loads(message['data'])
+            except (ValueError, TypeError):
+                continue
+            if origin == self._origin:
+                continue
+            for callback in list(self._subscribers):
+                callback(namespace, tags)
+
+
+class ReadThroughCache:
+    """Cache LRU + TTL thread-safe avec invalidation par étiquettes.
+
+    `maxsize` borne le nombre de clés (une valeur rangée sous deux clés en compte deux).
+    """
+
+    def __init__(self, namespace, maxsize=10000, ttl=60.0, bus=None):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clé -> (expiration, valeur, étiquettes)
+        self._tags = {}  # étiquette -> ensemble de clés
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self._bus = bus
+        if bus is not None:
+            bus.subscribe(self._on_invalidate)
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        """Retourne la valeur en cache ou MISSING (entrée absente ou expirée)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self._stats["misses"] += 1
+            return MISSING
+
+    def set(self, value, keys, tags=(), generation=None):
+        """Range `value` sous `keys`, rattachée aux étiquettes `tags` (et aux clés elles-mêmes).
+
+        Si `generation` est fourni et qu'une invalidation a eu lieu depuis,
+        la valeur (potentiellement périmée) n'est pas rangée.
+        """
+        expires = time.monotonic() + self.ttl
+        all_tags = frozenset(keys) | frozenset(tags)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+                self._entries[key] = (expires, value, all_tags)
+                for tag in all_tags:
+                    self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def fetch(self, key, loader, keys_of, tags_of=None):
+        """Lecture traversante : retourne la valeur en cache, sinon appelle `loader()` et la range.
+
+        `keys_of(value)` donne les clés sous lesquelles ranger la valeur et
+        `tags_of(value)` ses étiquettes supplémentaires. None n'est jamais mis en cache.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        generation = self._generation
+        value = loader()
+        if value is not None:
+            self.set(value, keys_of(value), tags_of(value) if tags_of else (), generation)
+        return value
+
+    def _on_invalidate(self, namespace, tags):
+        if namespace != self.namespace:
+            return
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self._stats["invalidations"] += 1
+
+    def invalidate(self, *tags):
+        """Supprime toutes les entrées rattachées à `tags`, ici et dans les autres workers."""
+        if not tags:
+            return
+        if self._bus is not None:
+            self._bus.publish(self.namespace, tags)
+        else:
+            self._on_invalidate(self.namespace, tags)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def stats(self):
+        """Retourne les compteurs (hits, misses, evictions, invalidations) et la taille."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["size"] = len(self._entries)
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+        return snapshot
+
+
+_bus = None
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_bus():
+    global _bus
+    if _bus is None:
+        _bus = RedisInvalidationBus(Config.CACHE_REDIS_URL) if Config.CACHE_REDIS_URL else LocalInvalidationBus()
+    return _bus
+
+
+def get_cache(namespace):
+    """Retourne le cache du processus pour `namespace`, créé à la première demande."""
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = ReadThroughCache(namespace, Config.CACHE_MAXSIZE, Config.CACHE_TTL, _get_bus())
+            _caches[namespace] = cache
+        return cache
+
+
+def get_cache_stats():
+    """Retourne les compteurs de tous les caches du processus."""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {namespace: cache.stats() for namespace, cache in caches.items()}
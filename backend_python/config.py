@@ -1,9 +1,13 @@
 import os
+import threading
 from dotenv import load_dotenv
 import mysql.connector
 from mysql.connector import Error
+from flask import g, has_app_context
 import datetime
 
+from db_pool import ConnectionPool, PooledConnection
+
 
 # Charger le fichier .env au moment de l'import
 load_dotenv()
@@ -16,18 +20,145 @@ class Config:
     DB_NAME = os.getenv('DB_NAME')
     api_key=os.getenv('API_KEY')
 
+    # Pool de connexions (DB_POOL_SIZE=0 désactive le pool)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))
+    # Requêtes préparées côté serveur pour les requêtes nommées des modèles (models/statements.py)
+    DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', '1') not in ('0', 'false', 'False')
+    # Chargement des gros fichiers par LOAD DATA LOCAL INFILE (Pensioner.bulk_load) : autorisé côté
+    # client (le serveur doit aussi avoir local_infile=ON), choisi d'office pour sink=db sans option bulk_load
+    DB_LOCAL_INFILE = os.getenv('DB_LOCAL_INFILE', '1') not in ('0', 'false', 'False')
+    DB_BULK_LOAD = os.getenv('DB_BULK_LOAD', '0') not in ('0', 'false', 'False')
+
+    # Cache de lecture des modèles (CACHE_TTL=0 le désactive en pratique)
+    CACHE_MAXSIZE = int(os.getenv('CACHE_MAXSIZE', 10000))
+    CACHE_TTL = float(os.getenv('CACHE_TTL', 60))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+
+    # Lots importés depuis les CSV (/csv/upload, /api/pensioners) : répertoire du
+    # magasin de lots et ancien fichier data.json, migré à la première utilisation
+    BATCH_STORE_DIR = os.getenv('BATCH_STORE_DIR', 'batch_store')
+    DATA_FILE = os.getenv('DATA_FILE', 'data.json')
+    # Imports en tâche de fond (/csv/jobs) : fichiers et état des tâches, threads de traitement
+    INGESTION_JOBS_DIR = os.getenv('INGESTION_JOBS_DIR', 'ingestion_jobs')
+    INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 2))
+    # Import parallèle des gros fichiers (parallel_ingestion.py) : processus de calcul,
+    # taille des plages d'octets, taille à partir de laquelle il est choisi d'office
+    PARALLEL_WORKERS = int(os.getenv('PARALLEL_WORKERS', os.cpu_count() or 1))
+    PARALLEL_CHUNK_BYTES = int(os.getenv('PARALLEL_CHUNK_BYTES', 8 * 1024 * 1024))
+    PARALLEL_MIN_BYTES = int(os.getenv('PARALLEL_MIN_BYTES', 32 * 1024 * 1024))
+
+    # Reçus PDF par lot (receipts.py) : reçus rendus par tâche du pool de processus,
+    # répertoire sous lequel les écrire (option "directory" de /pdf/receipts)
+    RECEIPT_CHUNK = int(os.getenv('RECEIPT_CHUNK', 64))
+    RECEIPTS_DIR = os.getenv('RECEIPTS_DIR', 'receipts')
+    # Cache des reçus rendus (receipt_cache.py) : octets gardés en mémoire, répertoire et
+    # taille maximale sur disque (RECEIPT_CACHE_DISK=0 garde les reçus en mémoire seulement)
+    RECEIPT_CACHE_MEMORY = int(os.getenv('RECEIPT_CACHE_MEMORY', 32 * 1024 * 1024))
+    RECEIPT_CACHE_DIR = os.getenv('RECEIPT_CACHE_DIR', 'receipt_cache')
+    RECEIPT_CACHE_DISK = int(os.getenv('RECEIPT_CACHE_DISK', 1024 * 1024 * 1024))
+    # Envoi des reçus et récapitulatifs des lots vers Cloudinary (receipt_uploads.py) : répertoire
+    # (index des envois, tâches), envois simultanés, nouveaux essais et attente initiale (doublée à
+    # chaque essai), délai d'une requête (s), URL écrites par paquets de UPLOAD_WRITEBACK lignes,
+    # dossier Cloudinary
+    UPLOADS_DIR = os.getenv('UPLOADS_DIR', 'receipt_uploads')
+    UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 8))
+    UPLOAD_RETRIES = int(os.getenv('UPLOAD_RETRIES', 4))
+    UPLOAD_BACKOFF = float(os.getenv('UPLOAD_BACKOFF', 0.5))
+    UPLOAD_TIMEOUT = float(os.getenv('UPLOAD_TIMEOUT', 30))
+    UPLOAD_WRITEBACK = int(os.getenv('UPLOAD_WRITEBACK', 500))
+    CLOUDINARY_FOLDER = os.getenv('CLOUDINARY_FOLDER', 'receipts')
+
+    # Index des bénéficiaires déjà payés (beneficiary_index.py) : répertoire, contrôle des doubles
+    # paiements à l'import (BENEFICIARY_CHECK=0 le désactive), bits par clé du filtre de Bloom (0 = sans filtre),
+    # durée (s) au-delà de laquelle les clés réservées par un import jamais terminé (arrêt brutal) sont ignorées
+    BENEFICIARY_INDEX_DIR = os.getenv('BENEFICIARY_INDEX_DIR', 'beneficiary_index')
+    BENEFICIARY_CHECK = os.getenv('BENEFICIARY_CHECK', '1') not in ('0', 'false', 'False')
+    BENEFICIARY_BLOOM_BITS = int(os.getenv('BENEFICIARY_BLOOM_BITS', 16))
+    BENEFICIARY_RESERVATION_TTL = int(os.getenv('BENEFICIARY_RESERVATION_TTL', 24 * 3600))
+
+    # Contrôles des lignes des fichiers de paiement (validation.py)
+    ALLOWED_CURRENCIES = [c.strip() for c in os.getenv('ALLOWED_CURRENCIES', 'XOF').split(',') if c.strip()]
+    MSISDN_PATTERN = os.getenv('MSISDN_PATTERN', r'\+?\d{8,15}')
+
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    @staticmethod
+    def connect(**options):
+        """Ouvre une nouvelle connexion MySQL (sans passer par le pool) ; `options` complète les paramètres de connexion."""
+        return mysql.connector.connect(
+            host=Config.DB_HOST,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            **options
+        )
+
+    @staticmethod
+    def get_pool():
+        """Retourne le pool de connexions du processus, créé à la première demande."""
+        if Config._pool is None:
+            with Config._pool_lock:
+                if Config._pool is None:
+                    Config._pool = ConnectionPool(
+                        Config.connect,
+                        size=Config.DB_POOL_SIZE,
+                        max_overflow=Config.DB_POOL_MAX_OVERFLOW,
+                        timeout=Config.DB_POOL_TIMEOUT,
+                        ping_after=Config.DB_POOL_PING_AFTER
+                    )
+        return Config._pool
 
     @staticmethod
-    def get_db_connection():
-        """Crée et retourne une connexion à la base de données."""
+    def get_db_connection(dedicated=False):
+        """Retourne une connexion à la base de données.
+
+        La connexion provient du pool ; pendant une requête Flask, la même
+        connexion est réutilisée par tous les appels de modèles et rendue au
+        pool par `close_request_connection` à la fin de la requête.
+        `dedicated=True` force une connexion propre à l'appelant (lecture en
+        continu qui ne doit pas bloquer la connexion de la requête).
+        """
         try:
-            connection = mysql.connector.connect(
-                host=Config.DB_HOST,
-                user=Config.DB_USER,
-                password=Config.DB_PASSWORD,
-                database=Config.DB_NAME
-            )
-            return connection
+            if Config.DB_POOL_SIZE <= 0:
+                return Config.connect()
+
+            pool = Config.get_pool()
+            if has_app_context() and not dedicated:
+                connection = g.get('_db_connection')
+                if connection is None:
+                    connection = PooledConnection(pool, pool.acquire(), request_scoped=True)
+                    g._db_connection = connection
+                return connection
+            return PooledConnection(pool, pool.acquire())
         except Error as e:
             print(f"Erreur de connexion MySQL : {e}")
             return None
+
+    @staticmethod
+    def close_request_connection(exception=None):
+        """Rend au pool la connexion de la requête en cours (teardown Flask)."""
+        connection = g.pop('_db_connection', None)
+        if connection is not None:
+            connection.release()
+
+    @staticmethod
+    def discard_db_connection(connection):
+        """Ferme une connexion devenue inutilisable au lieu de la rendre au pool."""
+        if isinstance(connection, PooledConnection):
+            connection.discard()
+            return
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    @staticmethod
+    def get_pool_metrics():
+        """Retourne les compteurs du pool (emprunts, attentes, débordements)."""
+        if Config._pool is None:
+            return {}
+        return Config._pool.metrics()
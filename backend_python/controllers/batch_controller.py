@@ -1,9 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 import jwt
 from functools import wraps
 from http import HTTPStatus
 from models.batch_model import Batch
 from config import Config
+from serializer import encode_value, json_response
+from beneficiary_index import get_beneficiary_index
 
 class BatchController:
     @staticmethod
@@ -40,21 +42,15 @@ class BatchController:
         """Crée un nouveau lot dans la table batches."""
         try:
             data = request.get_json()
-            required_fields = ['batch_code', 'total_amount', 'total_payments']
-            if not all(field in data for field in required_fields):
-                return jsonify({"message": "Champs obligatoires manquants : batch_code, total_amount, total_payments"}), HTTPStatus.BAD_REQUEST
+            if 'batch_code' not in data:
+                return jsonify({"message": "Champ obligatoire manquant : batch_code"}), HTTPStatus.BAD_REQUEST
 
             batch_code = data.get('batch_code')
-            total_amount = data.get('total_amount')
-            total_payments = data.get('total_payments')
             initiated_by = "admin"  # Par défaut 'admin' si non fourni
-            status = data.get('status', 'pending')  # Par défaut 'pending'
-            success_rate = data.get('success_rate', 0.00)
 
-            if status not in ['pending', 'completed', 'partial']:
-                return jsonify({"message": "Statut invalide. Doit être 'pending', 'completed' ou 'partial'"}), HTTPStatus.BAD_REQUEST
-            
-            batch_id = Batch.create(batch_code, total_amount, total_payments, initiated_by, status, success_rate)
+            # total_amount, total_payments, success_rate et status sont maintenus
+            # par le serveur à partir des pensionnés du lot : le lot démarre vide.
+            batch_id = Batch.create(batch_code, 0, 0, initiated_by)
             return jsonify({
                 'message': 'Lot créé avec succès',
                 'batch_id': batch_id
@@ -73,9 +69,6 @@ class BatchController:
 
             id = data.get('id')
             batch_code = data.get('batch_code')
-            total_amount = data.get('total_amount')
-            total_payments = data.get('total_payments')
-            success_rate = data.get('success_rate')
             status = data.get('status')
             initiated_by = data.get('initiated_by')
 
@@ -87,7 +80,8 @@ class BatchController:
             if not batch:
                 return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
         
-            success = Batch.update(id, batch_code, total_amount, total_payments, success_rate, status, initiated_by)
+            # Les agrégats (montant, nombre, taux) ne sont pas modifiables par le client
+            success = Batch.update(id, batch_code, status=status, initiated_by=initiated_by)
             if not success:
                 return jsonify({"message": "Lot non trouvé ou aucun changement effectué"}), HTTPStatus.NOT_FOUND
 
@@ -111,20 +105,10 @@ class BatchController:
             if not batch:
                 return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
             
-            return jsonify({
+            return json_response({
                 "message": "Lot récupéré avec succès",
-                "batch": {
-                    "id": batch.id,
-                    "batch_code": batch.batch_code,
-                    "total_amount": batch.total_amount,
-                    "total_payments": batch.total_payments,
-                    "success_rate": batch.success_rate,
-                    "status": batch.status,
-                    "initiated_by": batch.initiated_by,
-                    "created_at": batch.created_at,
-                    "updated_at": batch.updated_at
-                }
-            }), HTTPStatus.OK
+                "batch": batch
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -133,31 +117,31 @@ class BatchController:
     def get_all_batches():
         """Récupère tous les lots."""
         try:
-            limit = request.args.get('limit', 50, type=int)
-            offset = request.args.get('offset', 0, type=int)
+            limit = min(request.args.get('limit', 50, type=int), 500)
+            cursor = request.args.get('cursor')
+            status = request.args.get('status')
+
+            if status and status not in ['pending', 'completed', 'partial']:
+                return jsonify({"message": "Statut invalide. Doit être 'pending', 'completed' ou 'partial'"}), HTTPStatus.BAD_REQUEST
 
             # Vérification du token : les admins peuvent voir tous, sinon seulement les leurs
-            batches = Batch.get_all(limit, offset)
+            try:
+                page = Batch.get_all(limit, cursor, status)
+            except ValueError as e:
+                return jsonify({"message": str(e)}), HTTPStatus.BAD_REQUEST
+
+            if page is None:
+                return jsonify({"message": "Erreur lors de la récupération des lots"}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+            batches, next_cursor = page
             if not batches:
                 return jsonify({"message": "Aucun lot trouvé"}), HTTPStatus.NOT_FOUND
 
-            batch_list = [{
-                "id": b.id,
-                "batch_code": b.batch_code,
-                "total_amount": b.total_amount,
-                "total_payments": b.total_payments,
-                "success_rate": b.success_rate,
-                "status": b.status,
-                "initiated_by": b.initiated_by,
-                "created_at": b.created_at,
-                "updated_at": b.updated_at
-            } for b in batches]
-
-            return jsonify({
+            return json_response({
                 "message": "Lots récupérés avec succès",
-                "batches": batch_list
-            }), HTTPStatus.OK
+                "batches": batches,
+                "next_cursor": next_cursor
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -178,20 +162,10 @@ class BatchController:
             if not batch:
                 return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
             
-            return jsonify({
+            return json_response({
                 "message": "Lot récupéré avec succès",
-                "batch": {
-                    "id": batch.id,
-                    "batch_code": batch.batch_code,
-                    "total_amount": batch.total_amount,
-                    "total_payments": batch.total_payments,
-                    "success_rate": batch.success_rate,
-                    "status": batch.status,
-                    "initiated_by": batch.initiated_by,
-                    "created_at": batch.created_at,
-                    "updated_at": batch.updated_at
-                }
-            }), HTTPStatus.OK
+                "batch": batch
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -231,39 +205,131 @@ class BatchController:
 
     @staticmethod
     def get_batch_with_pensioners():
-        """Récupère tous les lots avec tous les pensionnaires qui y sont associés."""
+        """Diffuse un lot puis ses pensionnés, en JSON par morceaux ou en NDJSON.
+
+        Paramètres : id ou batch_code, status (optionnel), format=json|ndjson.
+        """
         try:
-            results = Batch.get_batch_with_pensioners()
-            if not results:
-                return jsonify({"message": "Aucun résultat trouvé"}), HTTPStatus.NOT_FOUND
-            
-            return jsonify({
-                "message": "Tous les lots et pensionnaires récupérés avec succès",
-                "data": results
-            }), HTTPStatus.OK
+            batch_id = request.args.get('id', type=int)
+            batch_code = request.args.get('batch_code')
+            status = request.args.get('status')
+            output = request.args.get('format', 'json')
+
+            if batch_id is None and not batch_code:
+                return jsonify({"message": "ID ou code du lot requis"}), HTTPStatus.BAD_REQUEST
+            if status and status not in ['pending', 'validated', 'processing', 'success', 'failed']:
+                return jsonify({"message": "Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'"}), HTTPStatus.BAD_REQUEST
+            if output not in ('json', 'ndjson'):
+                return jsonify({"message": "Format invalide. Doit être 'json' ou 'ndjson'"}), HTTPStatus.BAD_REQUEST
+
+            rows = Batch.get_batch_with_pensioners(batch_id, batch_code, status)
+            batch = next(rows, None)
+            if batch is None:
+                return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
+
+            def generate_ndjson():
+                yield encode_value({"batch": batch}) + "\n"
+                buffer = []
+                for pensioner in rows:
+                    buffer.append(encode_value(pensioner))
+                    if len(buffer) >= 500:
+                        yield "\n".join(buffer) + "\n"
+                        buffer = []
+                if buffer:
+                    yield "\n".join(buffer) + "\n"
+
+            def generate_json():
+                yield '{"message": "Lot et pensionnaires récupérés avec succès", "batch": ' + encode_value(batch) + ', "pensioners": ['
+                separator = ""
+                buffer = []
+                for pensioner in rows:
+                    buffer.append(encode_value(pensioner))
+                    if len(buffer) >= 500:
+                        yield separator + ",".join(buffer)
+                        separator = ","
+                        buffer = []
+                if buffer:
+                    yield separator + ",".join(buffer)
+                yield "]}"
+
+            if output == 'ndjson':
+                return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+            return Response(stream_with_context(generate_json()), mimetype='application/json')
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
     @staticmethod
     def update_batch_success_rate():
-        """Met à jour le taux de réussite d'un lot."""
+        """Le taux de réussite est calculé par le serveur : retourne la valeur courante."""
         try:
             data = request.get_json()
-            if 'id' not in data or 'success_rate' not in data:
-                return jsonify({"message": "ID du lot et taux de réussite requis"}), HTTPStatus.BAD_REQUEST
-
-            id = data.get('id')
-            success_rate = data.get('success_rate')
+            if 'id' not in data:
+                return jsonify({"message": "ID du lot requis"}), HTTPStatus.BAD_REQUEST
 
-            batch = Batch.get_by_id(id)
+            batch = Batch.get_by_id(data.get('id'))
             if not batch:
                 return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
-            
-            success = Batch.update_success_rate(id, success_rate)
-            if not success:
-                return jsonify({"message": "Échec de la mise à jour du taux de réussite"}), HTTPStatus.NOT_FOUND
-    
-            return jsonify({'message': 'Taux de réussite du lot mis à jour avec succès'}), HTTPStatus.OK
+
+            return jsonify({
+                'message': "Le taux de réussite est calculé automatiquement à partir des pensionnés du lot",
+                'success_rate': batch.success_rate
+            }), HTTPStatus.CONFLICT
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def check_batches_consistency():
+        """Recalcule les agrégats des lots depuis les pensionnés et signale les écarts."""
+        try:
+            batch_id = request.args.get('batch_id', type=int)
+            repair = request.args.get('repair', '').lower() in ('1', 'true', 'yes')
+
+            drifts = Batch.check_consistency(batch_id, repair)
+            return jsonify({
+                "message": f"{len(drifts)} lot(s) en écart" + (" corrigé(s)" if repair and drifts else ""),
+                "repaired": repair,
+                "drifts": drifts
+            }), HTTPStatus.OK
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def get_beneficiary_index_stats():
+        """Taille de l'index des bénéficiaires déjà payés (lots inscrits, clés, mémoire)."""
+        try:
+            return jsonify(get_beneficiary_index().stats()), HTTPStatus.OK
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def unregister_beneficiary_batch():
+        """Retire un lot de l'index des bénéficiaires (import annulé, ou remplacé par un fichier corrigé)."""
+        try:
+            data = request.get_json(silent=True) or {}
+            batch_id = data.get('batchId')
+            source = data.get('source', 'json')
+            if not batch_id:
+                return jsonify({"error": "batchId requis"}), HTTPStatus.BAD_REQUEST
+            if source not in ('json', 'db'):
+                return jsonify({"error": "Origine invalide. Doit être 'json' ou 'db'"}), HTTPStatus.BAD_REQUEST
+            index = get_beneficiary_index()
+            if (source, str(batch_id)) not in index.registered():
+                return jsonify({"error": "Lot non inscrit dans l'index"}), HTTPStatus.NOT_FOUND
+            keys = index.unregister(batch_id, source)
+            return jsonify({"message": "Lot retiré de l'index", "batchId": batch_id, "source": source,
+                            "keys": keys}), HTTPStatus.OK
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def rebuild_beneficiary_index():
+        """Reconstruit l'index des bénéficiaires depuis la table pensioners."""
+        try:
+            rebuilt = get_beneficiary_index().rebuild_from_db()
+            return jsonify({
+                "message": f"Index reconstruit : {rebuilt['batches']} lot(s), {rebuilt['keys']} clé(s)",
+                **rebuilt
+            }), HTTPStatus.OK
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -284,6 +350,12 @@ class BatchController:
             success = Batch.delete(id)
             if not success:
                 return jsonify({"message": "Échec de la suppression du lot"}), HTTPStatus.NOT_FOUND
+
+            # Paiements du lot supprimé : ses bénéficiaires peuvent de nouveau être payés dans la période
+            try:
+                get_beneficiary_index().unregister(batch.batch_code, "db")
+            except Exception as e:
+                print(f"Erreur lors du retrait du lot {batch.batch_code} de l'index des bénéficiaires : {e}")
     
             return jsonify({'message': 'Lot supprimé avec succès'}), HTTPStatus.OK
         except Exception as e:
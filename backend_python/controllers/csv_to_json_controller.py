@@ -1,72 +1,367 @@
-import csv
 import json
 import os
-from flask import request, jsonify
-from datetime import datetime
-
-DATA_FILE = "data.json"
+from datetime import datetime, timezone
+from itertools import chain
+from flask import request, jsonify, Response, send_file, stream_with_context
+from batch_diff import DiffSinkError, ingest_diff
+from batch_store import get_store
+from batch_summary import generate_summary
+from beneficiary_index import payment_check, payment_period
+from ingestion import MultipartUpload, open_csv, iter_participants, StoreSink, PensionerDbSink, use_bulk_load
+from ingestion_jobs import get_ingestion_jobs
+from parallel_ingestion import ingest_upload, use_parallel
+from receipt_uploads import SOURCES, get_upload_jobs
 
 class CsvToJsonController:
 
+    @staticmethod
+    def _open_upload():
+        """Ouvre le fichier envoyé : (erreur, nom du fichier, flux binaire, options).
+
+        `erreur` est une réponse 400 toute prête, ou None.
+        """
+        # Corps multipart lu directement sur le flux de la requête (pas de request.files,
+        # qui recopie tout le fichier avant de rendre la main)
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            return (jsonify({"error": "Aucun fichier reçu"}), 400), None, None, None
+
+        upload = MultipartUpload(request.stream, boundary.encode('latin-1'))
+        try:
+            found = upload.next_file('file')
+        except ValueError as e:
+            return (jsonify({"error": str(e)}), 400), None, None, None
+        if found is None:
+            return (jsonify({"error": "Aucun fichier reçu"}), 400), None, None, None
+
+        filename, stream = found
+        if filename.strip() == "":
+            return (jsonify({"error": "Nom de fichier vide"}), 400), None, None, None
+
+        # Destination des lignes : magasin de lots (par défaut) ou table pensioners ;
+        # période de paiement (AAAA-MM, mois en cours par défaut) pour le contrôle des doubles paiements.
+        # Les champs du formulaire doivent précéder le fichier, sinon passer par l'URL.
+        options = {**request.args, **upload.fields}
+        if options.get('sink', 'json') not in ('json', 'db'):
+            return (jsonify({"error": "Destination invalide. Doit être 'json' ou 'db'"}), 400), None, None, None
+        try:
+            options['period'] = payment_period(options.get('period'))
+        except ValueError as e:
+            return (jsonify({"error": str(e)}), 400), None, None, None
+        return None, filename, stream, options
+
+    @staticmethod
+    def _record_payments(payments, result, sink_name):
+        """Inscrit les lignes valides du lot enregistré dans l'index des bénéficiaires.
+
+        Le lot est déjà enregistré : une erreur ici est signalée sans faire échouer l'import.
+        """
+        if payments is None:
+            return
+        try:
+            payments.commit(result["batchId"], sink_name)
+        except Exception as e:
+            print(f"Erreur lors de l'inscription du lot {result['batchId']} dans l'index des bénéficiaires : {e}")
+
+    @staticmethod
+    def _sink(sink_name, options):
+        """Puits de l'import : magasin de lots, ou table pensioners (par LOAD DATA LOCAL INFILE avec bulk_load)."""
+        if sink_name == 'db':
+            return PensionerDbSink(batch_code=options.get('batch_code'), bulk=use_bulk_load(options.get('bulk_load')))
+        return StoreSink()
+
     @staticmethod
     def upload_and_convert():
-        if 'file' not in request.files:
-            return jsonify({"error": "Aucun fichier reçu"}), 400
+        error, filename, stream, options = CsvToJsonController._open_upload()
+        if error:
+            return error
+        sink_name = options.get('sink', 'json')
+        # Lignes déjà payées dans un autre lot de la période : refusées (DUPLICATE_PAYMENT)
+        payments = payment_check(options['period'])
+        try:
+            if options.get('reference'):
+                return CsvToJsonController._upload_diff(stream, sink_name, options, payments)
+            if use_parallel(options.get('parallel'), request.content_length):
+                return CsvToJsonController._upload_parallel(stream, sink_name, options, payments)
+            return CsvToJsonController._upload_stream(stream, sink_name, options, payments)
+        finally:
+            # Import refusé ou en échec : clés réservées au contrôle libérées (sans effet une fois inscrites)
+            if payments is not None:
+                payments.release()
+
+    @staticmethod
+    def _upload_stream(stream, sink_name, options, payments):
+        """Import direct : CSV lu et écrit au fil de l'eau."""
+        # Lire le CSV envoyé au fil de l'eau, sans le charger en entier,
+        # avec l'encodage et le séparateur détectés sur son début
+        csv_format, stream = open_csv(stream)
+        stats = {"total": 0, "valid": 0, "refused": 0}
+        participants = iter_participants(stream, stats, csv_format, payments)
+        try:
+            first = next(participants, None)
+            if first is None:
+                return jsonify({"error": "CSV vide"}), 400
 
-        file = request.files['file']
+            sink = CsvToJsonController._sink(sink_name, options)
+            result = sink.write_batch(chain([first], participants))
+        except UnicodeDecodeError:
+            return jsonify({"error": f"Impossible de décoder le fichier (encodage détecté : {csv_format['encoding']})"}), 400
+        except ValueError as e:
+            # pandas.errors.ParserError (nombre de colonnes incohérent...) dérive de ValueError
+            return jsonify({"error": f"CSV invalide : {e}"}), 400
+        finally:
+            participants.close()
+        CsvToJsonController._record_payments(payments, result, sink_name)
 
-        if file.filename.strip() == "":
-            return jsonify({"error": "Nom de fichier vide"}), 400
+        return jsonify({
+            "message": "Nouveau lot ajouté avec succès",
+            **result,
+            "participants_valid": stats["valid"],
+            "participants_refused": stats["refused"],
+            "participants_already_paid": payments.flagged if payments else 0,
+            "period": options['period'],
+            "csv_format": csv_format
+        }), 200
 
-        # Lire le CSV envoyé
-        csv_reader = csv.DictReader(file.stream.read().decode('utf-8').splitlines())
-        participants = []
+    @staticmethod
+    def _upload_parallel(stream, sink_name, options, payments):
+        """Gros fichier : enregistré sur disque puis découpé et traité sur plusieurs processus."""
+        sink = CsvToJsonController._sink(sink_name, options)
+        try:
+            csv_format, stats, result = ingest_upload(stream, sink, get_store().root, payments)
+        except UnicodeDecodeError as e:
+            return jsonify({"error": f"Impossible de décoder le fichier (encodage détecté : {e.encoding})"}), 400
+        except ValueError as e:
+            return jsonify({"error": f"CSV invalide : {e}"}), 400
+        if result is None:
+            return jsonify({"error": "CSV vide"}), 400
+        CsvToJsonController._record_payments(payments, result, sink_name)
 
-        for row in csv_reader:
-            # Vérifier que toutes les colonnes ont une valeur non vide
-            # Convertir chaque valeur en str avant strip pour éviter les erreurs
-            status = "valide" if all(str(value).strip() != "" for value in row.values()) else "refusé"
-            row["status"] = status
-            row["receipt"] = None  # Lien vers PDF individuel
-            participants.append(row)
+        return jsonify({
+            "message": "Nouveau lot ajouté avec succès",
+            **result,
+            "participants_valid": stats["valid"],
+            "participants_refused": stats["refused"],
+            "participants_already_paid": payments.flagged if payments else 0,
+            "period": options['period'],
+            "csv_format": csv_format,
+            "parallel_chunks": stats.get("chunks")
+        }), 200
 
-        if not participants:
+    @staticmethod
+    def _upload_diff(stream, sink_name, options, payments):
+        """Import différentiel contre le lot `reference` (batchId du magasin, ou batch_code avec sink=db).
+
+        Seules les lignes ajoutées ou modifiées sont validées et écrites ; avec
+        `dry_run`, la comparaison est renvoyée sans rien enregistrer. Contre un
+        lot de la base (sink=db), seule la simulation est possible (voir batch_diff).
+        """
+        dry_run = str(options.get('dry_run', '')).lower() in ("1", "true", "oui")
+        try:
+            csv_format, diff, stats, result = ingest_diff(stream, sink_name, options['reference'], payments, dry_run)
+        except DiffSinkError as e:
+            return jsonify({"error": str(e)}), 400
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except UnicodeDecodeError as e:
+            return jsonify({"error": f"Impossible de décoder le fichier (encodage détecté : {e.encoding})"}), 400
+        except ValueError as e:
+            return jsonify({"error": f"CSV invalide : {e}"}), 400
+        if result is None and not dry_run:
             return jsonify({"error": "CSV vide"}), 400
+        if result is not None:
+            CsvToJsonController._record_payments(payments, result, sink_name)
+
+        return jsonify({
+            "message": "Comparaison effectuée" if dry_run else "Nouveau lot ajouté avec succès",
+            **(result or {}),
+            "participants_valid": stats["valid"],
+            "participants_refused": stats["refused"],
+            "participants_already_paid": payments.flagged if payments else 0,
+            "period": options['period'],
+            "csv_format": csv_format,
+            "diff": {"reference": options['reference'], **diff}
+        }), 200
+
+    @staticmethod
+    def create_job():
+        """Enregistre le fichier reçu et lance son import en tâche de fond (202 + identifiant de tâche)."""
+        error, filename, stream, options = CsvToJsonController._open_upload()
+        if error:
+            return error
+        try:
+            job = get_ingestion_jobs().submit(stream, filename, options.get('sink', 'json'), options.get('batch_code'),
+                                              options['period'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        # Charger l'existant si data.json existe
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = []
+        response = jsonify({"message": "Import programmé", **job})
+        response.status_code = 202
+        response.headers['Location'] = f"/csv/jobs/{job['job_id']}"
+        return response
+
+    @staticmethod
+    def get_job(job_id):
+        """État d'une tâche d'import : lignes traitées et refusées, débit, temps restant estimé."""
+        job = get_ingestion_jobs().status(job_id)
+        if job is None:
+            return jsonify({"error": "Tâche non trouvée"}), 404
+        return jsonify(job), 200
+
+    @staticmethod
+    def cancel_job(job_id):
+        """Demande l'annulation d'une tâche d'import (prise en compte avant le paquet de lignes suivant)."""
+        job = get_ingestion_jobs().cancel(job_id)
+        if job is None:
+            return jsonify({"error": "Tâche non trouvée"}), 404
+        return jsonify(job), 202 if job["status"] not in ("completed", "failed", "cancelled") else 200
+
+    @staticmethod
+    def generate_summary(batch_id):
+        """Génère le récapitulatif PDF d'un lot importé (totaux puis participants) et l'enregistre dans summary_pdf."""
+        try:
+            result = generate_summary(batch_id)
+        except LookupError:
+            return jsonify({"error": "Lot non trouvé"}), 404
+        return jsonify(result), 200
+
+    @staticmethod
+    def get_summary(batch_id):
+        """Télécharge le récapitulatif PDF d'un lot importé."""
+        batch = get_store().get(batch_id)
+        if batch is None:
+            return jsonify({"error": "Lot non trouvé"}), 404
+        path = batch.get("summary_pdf")
+        if not path or not os.path.isfile(path):
+            return jsonify({"error": "Récapitulatif non généré"}), 404
+        return send_file(os.path.abspath(path), mimetype='application/pdf', as_attachment=True,
+                         download_name=f"Recapitulatif_{batch_id}.pdf")
+
+    @staticmethod
+    def upload_receipts(batch_id):
+        """Lance l'envoi vers Cloudinary des reçus et du récapitulatif d'un lot (202 + identifiant de tâche).
+
+        Corps JSON facultatif {"source": "json" | "db"} : lot du magasin (par
+        défaut) ou lot de la table batches désigné par son batch_code.
+        """
+        source = (request.get_json(silent=True) or {}).get('source', 'json')
+        if source not in SOURCES:
+            return jsonify({"error": "Origine invalide. Doit être 'json' ou 'db'"}), 400
+        try:
+            job = get_upload_jobs().submit(batch_id, source=source)
+        except LookupError:
+            return jsonify({"error": "Lot non trouvé"}), 404
+
+        response = jsonify({"message": "Envoi programmé", **job})
+        response.status_code = 202
+        response.headers['Location'] = f"/uploads/jobs/{job['job_id']}"
+        return response
+
+    @staticmethod
+    def get_upload_job(job_id):
+        """État d'une tâche d'envoi : reçus envoyés, déjà présents, en échec, débit, temps restant estimé."""
+        job = get_upload_jobs().status(job_id)
+        if job is None:
+            return jsonify({"error": "Tâche non trouvée"}), 404
+        return jsonify(job), 200
+
+    @staticmethod
+    def _conditional(response, etag, last_modified):
+        """Ajoute les en-têtes de validation : le client doit revalider à chaque sondage."""
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+
+    @staticmethod
+    def get_pensioners():
+        """Renvoie les lots importés et leurs participants.
+
+        - sans paramètre : tous les lots avec leurs participants (format de l'ancien data.json) ;
+        - batchId : une page des participants du lot, filtrée par `status`,
+          paginée par `offset`/`limit` et réduite aux colonnes de `fields` ;
+        - offset/limit seuls : une page de lots (métadonnées, sans participants).
+        L'ETag et Last-Modified suivent la version de l'index du magasin : un
+        sondage sans changement reçoit 304 sans qu'aucun fichier de lot ne soit lu.
+        """
+        store = get_store()
+        inode, size, mtime_ns = store.version()
+        etag = f"{inode:x}-{size:x}-{mtime_ns:x}"
+        last_modified = datetime.fromtimestamp(mtime_ns // 10**9, timezone.utc)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
         else:
-            existing_data = []
+            not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+        if not_modified:
+            return CsvToJsonController._conditional(Response(status=304), etag, last_modified)
 
-        # Générer batchId unique basé sur date + compteur
-        now = datetime.now()
-        date_str = now.strftime("%Y%m%d")
-        batch_count = sum(1 for b in existing_data if b.get("batchId", "").startswith(date_str)) + 1
-        batch_id = f"{date_str}_{batch_count:03d}"
+        args = request.args
+        batch_id = args.get('batchId')
+        status = args.get('status')
+        fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()]
+        offset = args.get('offset', 0, type=int)
+        limit = min(args.get('limit', 100, type=int), 1000)
+        if offset < 0 or limit <= 0:
+            return jsonify({"error": "offset doit être positif et limit strictement positif"}), 400
 
-        # Créer le nouveau batch avec summary_pdf
-        new_batch = {
-            "batchId": batch_id,
-            "date": now.isoformat(),
-            "participants": participants,
-            "summary_pdf": None  # Lien vers PDF récapitulatif du lot
-        }
+        if batch_id:
+            batch = store.get(batch_id)
+            if batch is None:
+                return jsonify({"error": "Lot non trouvé"}), 404
 
-        # Ajouter au fichier
-        existing_data.append(new_batch)
+            total, lines = store.participant_page(batch_id, status, offset, limit)
+            if fields:
+                # Projection : seules les lignes de la page sont analysées
+                lines = [json.dumps({field: participant[field] for field in fields if field in participant}, ensure_ascii=False)
+                         for participant in map(json.loads, lines)]
+            header = json.dumps({
+                "batchId": batch["batchId"],
+                "date": batch["date"],
+                "summary_pdf": batch.get("summary_pdf"),
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+                "next_offset": offset + limit if offset + limit < total else None
+            }, ensure_ascii=False)
+            body = header[:-1] + ', "participants": [' + ",".join(lines) + "]}"
+            return CsvToJsonController._conditional(Response(body, mimetype='application/json'), etag, last_modified)
 
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(existing_data, f, indent=4, ensure_ascii=False)
+        if status or fields:
+            return jsonify({"error": "batchId requis pour filtrer ou projeter les participants"}), 400
 
-        return jsonify({
-            "message": "Nouveau lot ajouté avec succès",
-            "batchId": batch_id,
-            "participants_added": len(participants),
-            "total_batches": len(existing_data),
-            "file_saved": DATA_FILE
-        }), 200
\ No newline at end of file
+        batches = store.batches()
+        if 'offset' in args or 'limit' in args:
+            page = [{key: value for key, value in batch.items() if key != "segment"} for batch in batches[offset:offset + limit]]
+            response = jsonify({
+                "batches": page,
+                "total": len(batches),
+                "offset": offset,
+                "limit": limit,
+                "next_offset": offset + limit if offset + limit < len(batches) else None
+            })
+            return CsvToJsonController._conditional(response, etag, last_modified)
+
+        if not batches:
+            return jsonify({"error": "Aucun lot importé"}), 404
+
+        def generate():
+            yield "["
+            for position, batch in enumerate(batches):
+                yield ("," if position else "") + '{"batchId": ' + json.dumps(batch["batchId"]) + ', "date": ' + \
+                    json.dumps(batch["date"]) + ', "participants": ['
+                separator = ""
+                buffer = []
+                for line in store.iter_raw_participants(batch["batchId"]):
+                    buffer.append(line)
+                    if len(buffer) >= 500:
+                        yield separator + ",".join(buffer)
+                        separator = ","
+                        buffer = []
+                if buffer:
+                    yield separator + ",".join(buffer)
+                yield '], "summary_pdf": ' + json.dumps(batch.get("summary_pdf")) + "}"
+            yield "]"
+
+        response = Response(stream_with_context(generate()), mimetype='application/json')
+        return CsvToJsonController._conditional(response, etag, last_modified)
@@ -1,16 +1,25 @@
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 from http import HTTPStatus
 import io # Utilisé pour stocker le PDF en mémoire avant de l'envoyer
-from models.ReceiptPDF import ReceiptPDF
+import re
+from config import Config
+from models.batch_model import Batch
+from receipt_cache import get_receipt_cache
+from receipts import render_receipts, stream_zip, transfer_payload, write_directory
 import os # Pour supprimer le fichier temporaire (si on ne veut pas utiliser io.BytesIO)
 
+_DIRECTORY_NAME = re.compile(r"[\w-][\w.-]*")
+
 
 class PdfController:
     @staticmethod
     def generate_receipt():
         """
         Génère un reçu PDF à partir des données de transaction reçues en JSON.
+
+        Le reçu est servi depuis le cache des reçus (receipt_cache.py) quand il a
+        déjà été rendu, avec un ETag : If-None-Match qui le cite donne un 304.
         """
         try:
             # Récupère les données JSON de la requête
@@ -21,11 +30,16 @@ class PdfController:
 
             transaction_data = api_response['data']
 
-            # Créer l'objet PDF avec les données
-            pdf = ReceiptPDF(transaction_data)
-            
-            # Générer le PDF en mémoire (BytesIO)
-            pdf_bytes = pdf.generate()
+            # Clé du reçu dans le cache, qui sert aussi d'ETag
+            cache = get_receipt_cache()
+            etag = cache.key(transaction_data)
+            if request.if_none_match.contains(etag):
+                response = Response(status=HTTPStatus.NOT_MODIFIED)
+                response.set_etag(etag)
+                return response
+
+            # Reçu en cache, sinon rendu en mémoire (modèle de reçu précompilé) puis rangé
+            pdf_bytes = cache.fetch(transaction_data, etag)
 
             # Créer un objet BytesIO à partir des bytes du PDF
             pdf_buffer = io.BytesIO(pdf_bytes)
@@ -34,14 +48,63 @@ class PdfController:
             filename = f"Reçu_Paiement_{transaction_data.get('homeTransactionId', 'sans-id')}.pdf"
 
             # Renvoyer le PDF comme réponse
-            return send_file(
+            response = send_file(
                 pdf_buffer,
                 mimetype='application/pdf',
                 as_attachment=True,
-                download_name=filename
+                download_name=filename,
+                etag=etag,
+                conditional=False
             )
+            response.cache_control.private = True
+            return response
 
         except Exception as e:
             # En cas d'erreur inattendue (ex: données mal structurées, fpdf crash)
             print(f"Erreur lors de la génération du PDF: {e}")
             return jsonify({"error": "Erreur interne lors de la génération du PDF", "details": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def generate_receipts():
+        """
+        Génère les reçus d'un lot : ceux des pensionnés payés d'un lot de la base
+        (`batch_id`) ou ceux d'une liste de transactions (`transfers`, chacune de
+        la forme du champ "data" de /pdf/generate_receipt).
+
+        Par défaut les reçus sont renvoyés dans une archive ZIP construite au fil
+        de l'eau ; avec `directory`, ils sont écrits dans ce sous-répertoire de
+        Config.RECEIPTS_DIR et un résumé est renvoyé.
+        """
+        body = request.get_json(silent=True) or {}
+        batch_id = body.get('batch_id')
+        transfers = body.get('transfers')
+        directory = body.get('directory')
+
+        if (batch_id is None) == (transfers is None):
+            return jsonify({"message": "Indiquer soit batch_id, soit transfers"}), HTTPStatus.BAD_REQUEST
+        if transfers is not None and (not isinstance(transfers, list) or not all(isinstance(data, dict) for data in transfers)):
+            return jsonify({"message": "transfers doit être une liste de transactions"}), HTTPStatus.BAD_REQUEST
+        if directory is not None and not (isinstance(directory, str) and _DIRECTORY_NAME.fullmatch(directory)):
+            return jsonify({"message": "Nom de répertoire invalide"}), HTTPStatus.BAD_REQUEST
+
+        if batch_id is not None:
+            if Batch.get_by_id(batch_id) is None:
+                return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
+            payloads = (transfer_payload(row) for row in Batch.iter_transfers(batch_id))
+            name = f"recus_lot_{batch_id}"
+        else:
+            payloads = transfers
+            name = "recus"
+
+        try:
+            if directory is not None:
+                result = write_directory(render_receipts(payloads), os.path.join(Config.RECEIPTS_DIR, directory))
+                return jsonify(result), HTTPStatus.OK
+        except Exception as e:
+            print(f"Erreur lors de la génération des reçus : {e}")
+            return jsonify({"error": "Erreur interne lors de la génération des reçus", "details": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+        # Archive envoyée au fur et à mesure du rendu des reçus
+        response = Response(stream_with_context(stream_zip(render_receipts(payloads))), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{name}.zip"'
+        return response
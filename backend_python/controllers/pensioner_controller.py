@@ -4,6 +4,7 @@ from functools import wraps
 from http import HTTPStatus
 from models.pensioner_model import Pensioner
 from config import Config
+from serializer import json_response
 
 class PensionerController:
     @staticmethod
@@ -75,6 +76,57 @@ class PensionerController:
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+    @staticmethod
+    def create_pensioners_bulk():
+        """Crée en masse les pensionnés d'un lot à partir d'une liste de lignes."""
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('rows'), list):
+                return jsonify({"message": "Liste 'rows' requise"}), HTTPStatus.BAD_REQUEST
+
+            batch_id = data.get('batch_id')
+            chunk_size = data.get('chunk_size', 1000)
+
+            if batch_id:
+                from models.batch_model import Batch
+                batch = Batch.get_by_id(batch_id)
+                if not batch:
+                    return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
+
+            result = Pensioner.create_many(data['rows'], batch_id, chunk_size)
+            return jsonify({
+                'message': f"{result['inserted']} pensionnés créés, {len(result['failed'])} lignes en échec",
+                'inserted': result['inserted'],
+                'failed': result['failed']
+            }), HTTPStatus.CREATED if result['inserted'] else HTTPStatus.BAD_REQUEST
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+    @staticmethod
+    def upsert_pensioners():
+        """Réimporte les pensionnés d'un lot : insère les nouveaux, met à jour les modifiés."""
+        try:
+            data = request.get_json()
+            if not data or not isinstance(data.get('rows'), list):
+                return jsonify({"message": "Liste 'rows' requise"}), HTTPStatus.BAD_REQUEST
+
+            batch_id = data.get('batch_id')
+            chunk_size = data.get('chunk_size', 1000)
+
+            if batch_id:
+                from models.batch_model import Batch
+                batch = Batch.get_by_id(batch_id)
+                if not batch:
+                    return jsonify({"message": "Lot non trouvé"}), HTTPStatus.NOT_FOUND
+
+            result = Pensioner.upsert_many(data['rows'], batch_id, chunk_size)
+            return jsonify({
+                'message': f"{result['inserted']} créés, {result['updated']} mis à jour, {result['unchanged']} inchangés, {len(result['failed'])} en échec",
+                **result
+            }), HTTPStatus.OK
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
     @staticmethod
     
     def update_pensioner():
@@ -141,24 +193,10 @@ class PensionerController:
             if not pensioner:
                 return jsonify({"message": "Pensionné non trouvé"}), HTTPStatus.NOT_FOUND
 
-            return jsonify({
+            return json_response({
                 "message": "Pensionné récupéré avec succès",
-                "pensioner": {
-                    "id": pensioner.id,
-                    "unique_id": pensioner.unique_id,
-                    "first_name": pensioner.first_name,
-                    "last_name": pensioner.last_name,
-                    "msisdn": pensioner.msisdn,
-                    "amount": pensioner.amount,
-                    "currency": pensioner.currency,
-                    "comment": pensioner.comment,
-                    "status": pensioner.status,
-                    "home_transaction_id": pensioner.home_transaction_id,
-                    "batch_id": pensioner.batch_id,
-                    "created_at": pensioner.created_at,
-                    "updated_at": pensioner.updated_at
-                }
-            }), HTTPStatus.OK
+                "pensioner": pensioner
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -167,34 +205,31 @@ class PensionerController:
     def get_all_pensioners():
         """Récupère tous les pensionnés."""
         try:
-            limit = request.args.get('limit', 50, type=int)
-            offset = request.args.get('offset', 0, type=int)
+            limit = min(request.args.get('limit', 50, type=int), 500)
+            cursor = request.args.get('cursor')
+            status = request.args.get('status')
+            batch_id = request.args.get('batch_id', type=int)
+
+            if status and status not in ['pending', 'validated', 'processing', 'success', 'failed']:
+                return jsonify({"message": "Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'"}), HTTPStatus.BAD_REQUEST
+
+            try:
+                page = Pensioner.get_all(limit, cursor, status, batch_id)
+            except ValueError as e:
+                return jsonify({"message": str(e)}), HTTPStatus.BAD_REQUEST
 
-            pensioners = Pensioner.get_all(limit, offset)
+            if page is None:
+                return jsonify({"message": "Erreur lors de la récupération des pensionnés"}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+            pensioners, next_cursor = page
             if not pensioners:
                 return jsonify({"message": "Aucun pensionné trouvé"}), HTTPStatus.NOT_FOUND
 
-            pensioner_list = [{
-                "id": p.id,
-                "unique_id": p.unique_id,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "msisdn": p.msisdn,
-                "amount": p.amount,
-                "currency": p.currency,
-                "comment": p.comment,
-                "status": p.status,
-                "home_transaction_id": p.home_transaction_id,
-                "batch_id": p.batch_id,
-                "created_at": p.created_at,
-                "updated_at": p.updated_at
-            } for p in pensioners]
-
-            return jsonify({
+            return json_response({
                 "message": "Pensionnés récupérés avec succès",
-                "pensioners": pensioner_list
-            }), HTTPStatus.OK
+                "pensioners": pensioners,
+                "next_cursor": next_cursor
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -213,24 +248,10 @@ class PensionerController:
             if not pensioner:
                 return jsonify({"message": "Pensionné non trouvé"}), HTTPStatus.NOT_FOUND
 
-            return jsonify({
+            return json_response({
                 "message": "Pensionné récupéré avec succès",
-                "pensioner": {
-                    "id": pensioner.id,
-                    "unique_id": pensioner.unique_id,
-                    "first_name": pensioner.first_name,
-                    "last_name": pensioner.last_name,
-                    "msisdn": pensioner.msisdn,
-                    "amount": pensioner.amount,
-                    "currency": pensioner.currency,
-                    "comment": pensioner.comment,
-                    "status": pensioner.status,
-                    "home_transaction_id": pensioner.home_transaction_id,
-                    "batch_id": pensioner.batch_id,
-                    "created_at": pensioner.created_at,
-                    "updated_at": pensioner.updated_at
-                }
-            }), HTTPStatus.OK
+                "pensioner": pensioner
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -254,26 +275,10 @@ class PensionerController:
             if not pensioners:
                 return jsonify({"message": "Aucun pensionné trouvé pour ce lot"}), HTTPStatus.NOT_FOUND
 
-            pensioner_list = [{
-                "id": p.id,
-                "unique_id": p.unique_id,
-                "first_name": p.first_name,
-                "last_name": p.last_name,
-                "msisdn": p.msisdn,
-                "amount": p.amount,
-                "currency": p.currency,
-                "comment": p.comment,
-                "status": p.status,
-                "home_transaction_id": p.home_transaction_id,
-                "batch_id": p.batch_id,
-                "created_at": p.created_at,
-                "updated_at": p.updated_at
-            } for p in pensioners]
-
-            return jsonify({
+            return json_response({
                 "message": "Pensionnés du lot récupérés avec succès",
-                "pensioners": pensioner_list
-            }), HTTPStatus.OK
+                "pensioners": pensioners
+            }, HTTPStatus.OK)
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -292,11 +297,7 @@ class PensionerController:
             if status not in ['pending', 'validated', 'processing', 'success', 'failed']:
                 return jsonify({"message": "Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'"}), HTTPStatus.BAD_REQUEST
 
-
-            pensioner = Pensioner.get_by_id(id)
-            if not pensioner:
-                return jsonify({"message": "Pensionné non trouvé"}), HTTPStatus.NOT_FOUND
-            
+            # Pas de get_by_id préalable : l'UPDATE ne touche aucune ligne si l'id est inconnu
             success = Pensioner.update_status(id, status)
             if not success:
                 return jsonify({"message": "Pensionné non trouvé"}), HTTPStatus.NOT_FOUND
@@ -305,6 +306,36 @@ class PensionerController:
         except Exception as e:
             return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
 
+    @staticmethod
+    def update_pensioners_status_bulk():
+        """Met à jour en masse le statut de pensionnés.
+
+        Accepte l'une des formes suivantes :
+        - {"ids": [...], "status": "..."}
+        - {"batch_id": ..., "current_status": "...", "status": "..."}
+        - {"statuses": {"<id>": "<statut>", ...}}
+        """
+        try:
+            data = request.get_json()
+            if not data:
+                return jsonify({"message": "Corps JSON requis"}), HTTPStatus.BAD_REQUEST
+
+            if 'statuses' in data:
+                counts = Pensioner.update_status_map({int(id): status for id, status in data['statuses'].items()})
+            elif 'ids' in data and 'status' in data:
+                counts = Pensioner.update_status_many(data['ids'], data['status'])
+            elif 'batch_id' in data and 'current_status' in data and 'status' in data:
+                counts = Pensioner.update_status_by_batch(data['batch_id'], data['current_status'], data['status'])
+            else:
+                return jsonify({"message": "Fournir 'statuses', 'ids' et 'status', ou 'batch_id', 'current_status' et 'status'"}), HTTPStatus.BAD_REQUEST
+
+            return jsonify({
+                'message': 'Statuts des pensionnés mis à jour',
+                'counts': counts
+            }), HTTPStatus.OK
+        except Exception as e:
+            return jsonify({"error": str(e)}), HTTPStatus.INTERNAL_SERVER_ERROR
+
     @staticmethod
     
     def delete_pensioner():
@@ -0,0 +1,215 @@
+# db_pool.py
+import threading
+import time
+from mysql.connector import Error
+
+
+class PooledConnection:
+    """Enveloppe une connexion MySQL empruntée au pool.
+
+    Toutes les méthodes sont déléguées à la connexion réelle, sauf close()
+    qui rend la connexion au pool au lieu de fermer le socket.
+    """
+
+    def __init__(self, pool, raw, request_scoped=False):
+        self._pool = pool
+        self._raw = raw
+        self._request_scoped = request_scoped
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        # Dans une requête Flask, la connexion est rendue au teardown
+        if self._request_scoped:
+            return
+        self.release()
+
+    def release(self):
+        """Rend réellement la connexion au pool (une seule fois)."""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._raw)
+
+    def discard(self):
+        """Ferme la connexion sans la rendre au pool (ex. résultat non lu en entier)."""
+        if not self._released:
+            self._released = True
+            self._pool.discard(self._raw)
+
+    def prepared_cursor(self, name):
+        """Curseur préparé de l'instruction `name`, conservé avec la connexion physique."""
+        return self._pool.prepared_cursor(self._raw, name)
+
+
+class ConnectionPool:
+    """Pool de connexions MySQL thread-safe avec débordement borné.
+
+    - `size` connexions sont conservées ouvertes entre deux emprunts ;
+    - jusqu'à `max_overflow` connexions supplémentaires peuvent être ouvertes
+      en cas de pic, puis sont fermées à leur retour ;
+    - au-delà, l'appelant attend au plus `timeout` secondes qu'une connexion
+      soit rendue ou qu'une place se libère (connexion fermée) ;
+    - une connexion inactive depuis plus de `ping_after` secondes est vérifiée
+      (ping) avant d'être rendue, et remplacée si elle est morte ;
+    - les curseurs préparés (prepared_cursor) vivent aussi longtemps que la
+      connexion physique et sont réutilisés d'un emprunt à l'autre.
+    """
+
+    def __init__(self, factory, size=5, max_overflow=5, timeout=10.0, ping_after=30.0):
+        self._factory = factory
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.ping_after = ping_after
+        # Connexions inactives (pile) et places occupées, sous la même condition : toute
+        # connexion rendue ou place libérée réveille un appelant en attente
+        self._idle = []
+        self._lock = threading.Condition(threading.Lock())
+        self._opened = 0
+        self._last_used = {}
+        self._prepared = {}  # id(connexion) -> {nom d'instruction: curseur préparé}
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "timeouts": 0,
+            "overflow": 0,
+            "created": 0,
+            "stale_replaced": 0,
+            "prepared": 0,
+        }
+
+    def _incr(self, key, value=1):
+        with self._lock:
+            self._metrics[key] += value
+
+    def _open(self):
+        raw = self._factory()
+        self._incr("created")
+        return raw
+
+    def _reserve_slot(self):
+        """Réserve une place pour une nouvelle connexion si la limite le permet (verrou tenu)."""
+        if self._opened < self.size + self.max_overflow:
+            self._opened += 1
+            if self._opened > self.size:
+                self._metrics["overflow"] += 1
+            return True
+        return False
+
+    def _free_slot(self):
+        with self._lock:
+            self._opened -= 1
+            self._lock.notify()
+
+    def _is_alive(self, raw):
+        last_used = self._last_used.get(id(raw), 0)
+        if time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def discard(self, raw):
+        """Ferme une connexion et libère sa place dans le pool."""
+        self._last_used.pop(id(raw), None)
+        self._prepared.pop(id(raw), None)
+        try:
+            raw.close()
+        except Error:
+            pass
+        self._free_slot()
+
+    def acquire(self):
+        """Emprunte une connexion vivante au pool."""
+        deadline = None
+        while True:
+            with self._lock:
+                while not self._idle and not self._reserve_slot():
+                    # Pool saturé : on attend qu'une connexion soit rendue ou qu'une place se libère
+                    now = time.monotonic()
+                    if deadline is None:
+                        deadline = now + self.timeout
+                        started = now
+                        self._metrics["waits"] += 1
+                    if now >= deadline:
+                        self._metrics["timeouts"] += 1
+                        self._metrics["wait_time_total"] += now - started
+                        raise Error(msg=f"Pool de connexions saturé après {self.timeout}s d'attente")
+                    self._lock.wait(deadline - now)
+                raw = self._idle.pop() if self._idle else None
+                if deadline is not None:
+                    self._metrics["wait_time_total"] += time.monotonic() - started
+                    deadline = None
+
+            if raw is None:
+                try:
+                    raw = self._open()
+                except Exception:
+                    self._free_slot()
+                    raise
+                self._incr("checkouts")
+                return raw
+
+            if self._is_alive(raw):
+                self._incr("checkouts")
+                return raw
+
+            self._incr("stale_replaced")
+            self.discard(raw)
+
+    def prepared_cursor(self, raw, name):
+        """Retourne le curseur préparé `name` de la connexion, créé au premier appel.
+
+        Une connexion n'est utilisée que par un thread à la fois : le
+        dictionnaire de ses curseurs n'a pas besoin de verrou.
+        """
+        cursors = self._prepared.setdefault(id(raw), {})
+        cursor = cursors.get(name)
+        if cursor is None:
+            cursor = raw.cursor(prepared=True)
+            cursors[name] = cursor
+            self._incr("prepared")
+        return cursor
+
+    def release(self, raw):
+        """Rend une connexion au pool, ou la ferme si elle est en débordement."""
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Error:
+            self.discard(raw)
+            return
+
+        with self._lock:
+            overflowing = self._opened > self.size
+            if not overflowing:
+                self._last_used[id(raw)] = time.monotonic()
+                self._idle.append(raw)
+                self._lock.notify()
+        if overflowing:
+            self.discard(raw)
+
+    def metrics(self):
+        """Retourne un instantané des compteurs du pool."""
+        with self._lock:
+            snapshot = dict(self._metrics)
+            snapshot["opened"] = self._opened
+            snapshot["idle"] = len(self._idle)
+        snapshot["in_use"] = snapshot["opened"] - snapshot["idle"]
+        snapshot["size"] = self.size
+        snapshot["max_overflow"] = self.max_overflow
+        return snapshot
+
+    def close_all(self):
+        """Ferme toutes les connexions inactives (arrêt du processus)."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                raw = self._idle.pop()
+            self.discard(raw)
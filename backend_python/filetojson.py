@@ -3,12 +3,18 @@ from flask import Blueprint, request, jsonify
 from http import HTTPStatus
 import pandas as pd
 from io import BytesIO
+from validation import CsvValidator, decode
+from beneficiary_index import payment_check
+from ingestion import SNIFF_SIZE, detect_csv_format, read_csv_options
+from parallel_ingestion import can_split, read_bytes, use_parallel
 
 class SimpleCsvReaderController:
     @staticmethod
     def read_and_print_csv():
         """
-        Reçoit un fichier CSV, le lit ligne par ligne et retourne son contenu brut.
+        Reçoit un fichier CSV, le lit ligne par ligne et retourne son contenu brut,
+        avec les erreurs de validation de chaque ligne refusée (validation.py),
+        y compris les lignes déjà payées dans la période `period` (AAAA-MM, mois en cours par défaut).
         Affiche aussi chaque ligne dans la console avec print().
         """
         try:
@@ -26,22 +32,35 @@ class SimpleCsvReaderController:
             content = file.read()
             file.seek(0)  # Reset du pointeur
             
-            # Essayer plusieurs encodages
-            df = None
-            encodings = ['utf-8', 'latin-1', 'iso-8859-1', 'cp1252']
-            
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(BytesIO(content), encoding=encoding, sep=',')
-                    break
-                except Exception:
-                    continue
-            
-            if df is None:
-                return jsonify({"error": "Impossible de lire le fichier CSV avec les encodages supportés"}), HTTPStatus.BAD_REQUEST
+            # Lecture seule : les lignes déjà payées sont signalées, rien n'est inscrit dans l'index
+            try:
+                payments = payment_check(request.args.get('period'), reserve=False)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), HTTPStatus.BAD_REQUEST
 
-            # Convertir en liste de dicts propre
-            records = df.to_dict(orient='records')
+            # Détecter encodage et séparateur sur le début du fichier, puis le lire une seule fois
+            csv_format = detect_csv_format(content[:SNIFF_SIZE])
+            parallel = use_parallel(request.args.get('parallel'), len(content)) and can_split(csv_format)
+            try:
+                if parallel:
+                    # Gros fichier : découpé, lu et validé sur plusieurs processus
+                    participants, columns = read_bytes(content, csv_format, payments=payments)
+                    errors = [{"line": i, "errors": p["errors"]} for i, p in enumerate(participants, 1) if p["errors"]]
+                    records = [{k: v for k, v in p.items() if k not in ("status", "receipt", "errors")} for p in participants]
+                else:
+                    df = pd.read_csv(BytesIO(content), dtype=str, keep_default_na=False, index_col=False,
+                                     **read_csv_options(csv_format))
+                    columns = list(df.columns)
+                    # Valider toutes les lignes d'un coup, colonne par colonne
+                    masks = CsvValidator().validate(df)
+                    if payments is not None:
+                        masks = payments.flag(df, masks)
+                    masks = masks.tolist()
+                    errors = [{"line": i, "errors": decode(mask)} for i, mask in enumerate(masks, 1) if mask]
+                    # Convertir en liste de dicts propre
+                    records = df.to_dict(orient='records')
+            except (UnicodeDecodeError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+                return jsonify({"error": f"Impossible de lire le fichier CSV ({csv_format['encoding']}) : {e}"}), HTTPStatus.BAD_REQUEST
 
             # Nettoyer les données
             clean_data = []
@@ -65,7 +84,13 @@ class SimpleCsvReaderController:
                 "message": f"{len(clean_data)} lignes lues avec succès",
                 "filename": file.filename,
                 "total_lines": len(clean_data),
-                "columns": list(df.columns),
+                "columns": columns,
+                "csv_format": csv_format,
+                "parallel": parallel,
+                "valid_lines": len(records) - len(errors),
+                "refused_lines": len(errors),
+                "already_paid_lines": payments.flagged if payments else 0,
+                "errors": errors,
                 "data": clean_data  # Toutes les lignes brutes
             }), HTTPStatus.OK
 
@@ -0,0 +1,478 @@
+# ingestion.py
+"""
+Lecture en continu des fichiers CSV de paiement et écriture des participants
+dans un puits (sink) interchangeable.
+
+Le corps multipart de la requête est lu directement sur le flux d'entrée
+(MultipartUpload). L'encodage et le séparateur sont détectés une fois sur le
+début du fichier (detect_csv_format), puis le fichier est analysé par paquets de
+VALIDATION_CHUNK_ROWS lignes, validés colonne par colonne (validation.py) :
+la mémoire utilisée ne dépend pas de la taille du fichier.
+Puits disponibles :
+- StoreSink : ajoute le lot au magasin de lots (batch_store.py) ;
+- PensionerDbSink : crée un lot en base et y insère les participants valides
+  par paquets (Pensioner.create_many) ou, avec bulk=True, les écrit dans un
+  fichier temporaire chargé par LOAD DATA LOCAL INFILE (Pensioner.bulk_load).
+"""
+import codecs
+import csv
+import io
+import json
+import os
+import tempfile
+import uuid
+from array import array
+from datetime import datetime
+
+import pandas as pd
+from werkzeug.http import parse_options_header
+
+from batch_store import get_store
+from config import Config
+from models.batch_model import Batch
+from models.pensioner_model import LocalInfileUnavailable, Pensioner
+from validation import CsvValidator, decode
+
+READ_CHUNK_SIZE = 64 * 1024
+# Nombre de lignes du CSV analysées et validées ensemble
+VALIDATION_CHUNK_ROWS = 50_000
+
+# Début du fichier lu pour détecter l'encodage et le séparateur
+SNIFF_SIZE = 64 * 1024
+SNIFF_LINES = 50
+CSV_DELIMITERS = ",;\t|"
+
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+# Octets 0x80-0x9F sans caractère en cp1252 : le fichier est alors lu en latin-1
+_CP1252_UNDEFINED = frozenset(b"\x81\x8d\x8f\x90\x9d")
+
+
+def _cp1252_fallback(error):
+    """Gestionnaire d'erreurs de décodage : octets invalides en UTF-8 relus en cp1252."""
+    return error.object[error.start:error.end].decode("cp1252", "replace"), error.end
+
+
+# Un fichier UTF-8 dont le début détecté est pur ASCII peut contenir plus loin
+# des caractères cp1252 : ils sont décodés au passage, sans relire le fichier
+codecs.register_error("cp1252_fallback", _cp1252_fallback)
+
+# Taille maximale des en-têtes d'une partie et d'un champ simple du formulaire
+MAX_PART_HEADERS = 16 * 1024
+MAX_FIELD_SIZE = 64 * 1024
+
+
+class MultipartUpload:
+    """Lecteur multipart/form-data en continu sur le flux brut de la requête.
+
+    Contrairement à request.files, le fichier n'est ni recopié dans un
+    fichier temporaire ni relu : next_file() rend un flux binaire qui lit la
+    partie bloc par bloc jusqu'à la frontière suivante.
+    """
+
+    def __init__(self, stream, boundary, chunk_size=READ_CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._delimiter = b"\r\n--" + boundary
+        # Le premier délimiteur n'est pas précédé d'un saut de ligne
+        self._buffer = bytearray(b"\r\n")
+        self._eof = False
+        self._done = False
+        self.fields = {}
+
+    def _fill(self):
+        """Lit un bloc de plus dans le tampon. Retourne False en fin de flux."""
+        if self._eof:
+            return False
+        data = self._stream.read(self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buffer += data
+        return True
+
+    def _find(self, marker, limit=None):
+        """Position de `marker` dans le tampon, en lisant le flux si besoin ; -1 si absent."""
+        while True:
+            index = self._buffer.find(marker)
+            if index >= 0:
+                return index
+            if limit is not None and len(self._buffer) > limit:
+                raise ValueError("Partie multipart trop volumineuse")
+            if not self._fill():
+                return -1
+
+    def _next_part_headers(self):
+        if self._done:
+            return None
+        index = self._find(self._delimiter)
+        if index < 0:
+            raise ValueError("Corps multipart tronqué")
+        del self._buffer[:index + len(self._delimiter)]
+        while len(self._buffer) < 2 and self._fill():
+            pass
+        if self._buffer[:2] == b"--":
+            self._done = True
+            return None
+
+        end = self._find(b"\r\n\r\n", MAX_PART_HEADERS)
+        if end < 0:
+            raise ValueError("Corps multipart tronqué")
+        headers = {}
+        for line in bytes(self._buffer[2:end]).decode("utf-8", "replace").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        del self._buffer[:end + 4]
+        return headers
+
+    def next_file(self, name):
+        """Avance jusqu'à la partie fichier `name` et retourne (nom du fichier, flux binaire), ou None.
+
+        Les champs simples rencontrés avant le fichier sont rangés dans `fields`.
+        """
+        while True:
+            headers = self._next_part_headers()
+            if headers is None:
+                return None
+            _, params = parse_options_header(headers.get("content-disposition", ""))
+            part = _PartReader(self)
+            if "filename" in params:
+                if params.get("name") == name:
+                    return params["filename"], io.BufferedReader(part, self._chunk_size)
+                while part.read(self._chunk_size):
+                    pass
+            else:
+                value = bytearray()
+                while True:
+                    block = part.read(self._chunk_size)
+                    if not block:
+                        break
+                    value += block
+                    if len(value) > MAX_FIELD_SIZE:
+                        raise ValueError("Partie multipart trop volumineuse")
+                self.fields[params.get("name")] = value.decode("utf-8", "replace")
+
+
+class _PartReader(io.RawIOBase):
+    """Flux binaire du contenu d'une partie, jusqu'au délimiteur suivant (exclu)."""
+
+    def __init__(self, upload):
+        self._upload = upload
+        self._finished = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        if self._finished:
+            return 0
+        upload = self._upload
+        delimiter = upload._delimiter
+        while True:
+            buffer = upload._buffer
+            index = buffer.find(delimiter)
+            if index >= 0:
+                available = index
+            else:
+                # Garder la fin du tampon : le délimiteur peut être à cheval sur deux blocs
+                available = len(buffer) - len(delimiter) + 1
+            if available > 0:
+                size = min(available, len(target))
+                target[:size] = buffer[:size]
+                del buffer[:size]
+                return size
+            if index == 0:
+                self._finished = True
+                return 0
+            if not upload._fill():
+                raise ValueError("Corps multipart tronqué")
+
+
+def _detect_encoding(head):
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    try:
+        # Décodeur incrémental : un caractère coupé en fin d'échantillon n'est pas une erreur
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    high = {byte for byte in head if 0x80 <= byte <= 0x9F}
+    return "latin-1" if high & _CP1252_UNDEFINED else "cp1252"
+
+
+def detect_csv_format(head):
+    """Détecte encodage et dialecte d'un CSV d'après ses premiers octets.
+
+    Retourne {"encoding", "delimiter", "quotechar"} : BOM, sinon UTF-8 si
+    l'échantillon est du UTF-8 valide, sinon cp1252 (ou latin-1 si des octets
+    sans caractère cp1252 sont présents) ; séparateur et guillemet par
+    csv.Sniffer sur les premières lignes complètes.
+    """
+    encoding = _detect_encoding(head)
+    text = codecs.getincrementaldecoder(encoding)("replace").decode(head, final=False)
+    lines = text.splitlines(keepends=True)
+    if len(head) >= SNIFF_SIZE and len(lines) > 1:
+        lines = lines[:-1]  # Dernière ligne probablement coupée
+    sample = "".join(lines[:SNIFF_LINES])
+
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+        delimiter, quotechar = dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        # Une seule colonne ou échantillon ambigu : le séparateur le plus fréquent de l'en-tête
+        header = lines[0] if lines else ""
+        delimiter = max(CSV_DELIMITERS, key=header.count) if any(d in header for d in CSV_DELIMITERS) else ","
+        quotechar = '"'
+    return {"encoding": encoding, "delimiter": delimiter, "quotechar": quotechar}
+
+
+def read_csv_options(csv_format):
+    """Paramètres de pd.read_csv pour un format rendu par detect_csv_format."""
+    return {
+        "encoding": csv_format["encoding"],
+        "encoding_errors": "cp1252_fallback" if csv_format["encoding"] == "utf-8" else "strict",
+        "sep": csv_format["delimiter"],
+        "quotechar": csv_format["quotechar"],
+    }
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Flux binaire : les octets déjà lus pour la détection, puis la suite du flux."""
+
+    def __init__(self, head, stream):
+        self._head = memoryview(head)
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        if self._head:
+            size = min(len(self._head), len(target))
+            target[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        return self._stream.readinto(target)
+
+
+def open_csv(stream):
+    """Lit le début du CSV binaire `stream` et détecte son format.
+
+    Retourne (format, flux) : le flux rendu repart du début du fichier.
+    """
+    head = stream.read(SNIFF_SIZE)
+    return detect_csv_format(head), io.BufferedReader(_PrefixedReader(head, stream), READ_CHUNK_SIZE)
+
+
+def build_participants(frame, masks):
+    """Participants (dicts) d'un paquet de lignes `frame` et de ses masques d'erreurs (CsvValidator)."""
+    columns = [str(column) for column in frame.columns]
+    rows = zip(*(frame[column].tolist() for column in frame.columns))
+    participants = []
+    for values, mask in zip(rows, masks):
+        row = dict(zip(columns, values))
+        row["status"] = "refusé" if mask else "valide"
+        row["receipt"] = None  # Lien vers PDF individuel
+        row["errors"] = decode(mask)
+        participants.append(row)
+    return participants
+
+
+def iter_participant_chunks(stream, stats, csv_format=None, skip_chunks=0, payments=None):
+    """Générateur : lit le CSV binaire `stream` et produit une liste de participants par paquet de lignes.
+
+    `csv_format` (detect_csv_format) donne l'encodage et le séparateur ; UTF-8
+    et virgule par défaut. Chaque participant reçoit "status" ("valide" si la
+    ligne passe tous les contrôles de CsvValidator, "refusé" sinon), "receipt"
+    (None) et "errors" (codes d'erreur de la ligne). `stats` cumule
+    total / valid / refused au fil de la lecture.
+    Les `skip_chunks` premiers paquets (déjà traités, reprise d'un import) sont
+    seulement validés, pour que les doublons avec eux restent détectés.
+    `payments` (beneficiary_index.PaymentCheck) refuse en plus les lignes déjà
+    payées dans un autre lot de la période.
+    """
+    validator = CsvValidator()
+    try:
+        # index_col=False : une ligne trop longue ne fait pas de la première colonne un index
+        options = read_csv_options(csv_format or {"encoding": "utf-8", "delimiter": ",", "quotechar": '"'})
+        reader = pd.read_csv(stream, dtype=str, keep_default_na=False, index_col=False,
+                             chunksize=VALIDATION_CHUNK_ROWS, **options)
+    except pd.errors.EmptyDataError:
+        return
+
+    # Le flux appartient à l'appelant : pandas ne ferme pas un flux qu'il n'a pas ouvert
+    with reader:
+        for position, frame in enumerate(reader):
+            # Lignes plus courtes que l'en-tête : cellules manquantes vides
+            frame = frame.fillna("")
+            masks = validator.validate(frame)
+            if payments is not None:
+                masks = payments.flag(frame, masks)
+            masks = masks.tolist()
+            if position < skip_chunks:
+                continue
+            refused = sum(1 for mask in masks if mask)
+            stats["total"] += len(masks)
+            stats["valid"] += len(masks) - refused
+            stats["refused"] += refused
+            yield build_participants(frame, masks)
+
+
+def iter_participants(stream, stats, csv_format=None, payments=None):
+    """Générateur : un participant par ligne du CSV binaire `stream` (voir iter_participant_chunks)."""
+    chunks = iter_participant_chunks(stream, stats, csv_format, payments=payments)
+    try:
+        for participants in chunks:
+            yield from participants
+    finally:
+        chunks.close()
+
+
+def use_bulk_load(option):
+    """Décide du chargement par LOAD DATA LOCAL INFILE : option explicite ("1"/"0") ou Config.DB_BULK_LOAD."""
+    if option is not None:
+        return str(option).lower() in ("1", "true", "oui")
+    return Config.DB_BULK_LOAD
+
+
+def to_pensioner_row(participant):
+    """Convertit un participant du fichier de paiement en ligne pour Pensioner.create_many.
+
+    Accepte les colonnes du fichier (type_id, valeur_id, devise, montant,
+    nom_complet) ou directement celles de la table pensioners.
+    """
+    get = participant.get
+    msisdn = get('msisdn') or get('valeur_id')
+    names = (get('nom_complet') or '').split(None, 1)
+    return {
+        "unique_id": get('unique_id') or f"{get('type_id')}-{msisdn}",
+        "first_name": get('first_name') or (names[0] if names else None),
+        "last_name": get('last_name') or (names[1] if len(names) > 1 else None),
+        "type_id": get('type_id'),
+        "msisdn": msisdn,
+        "amount": get('amount') or get('montant'),
+        "currency": get('currency') or get('devise') or 'XOF',
+        "comment": get('comment'),
+    }
+
+
+class StoreSink:
+    """Ajoute le lot au magasin de lots (un segment JSONL par lot, voir batch_store.py)."""
+
+    def __init__(self, store=None):
+        self.store = store or get_store()
+
+    def write_batch(self, participants):
+        """Écrit les participants (itérable) comme nouveau lot. Retourne le résumé du lot."""
+        entry = self.store.append_batch(participants)
+        return {
+            "batchId": entry["batchId"],
+            "participants_added": entry["participants"],
+            "total_batches": entry["total_batches"],
+            "file_saved": self.store.segment_path(entry["batchId"])
+        }
+
+    def write_segment(self, path, count, valid):
+        """Ajoute comme nouveau lot un fichier JSONL de participants déjà écrit (import parallèle)."""
+        entry = self.store.add_segment(path, count, valid)
+        return {
+            "batchId": entry["batchId"],
+            "participants_added": entry["participants"],
+            "total_batches": entry["total_batches"],
+            "file_saved": self.store.segment_path(entry["batchId"])
+        }
+
+
+class PensionerDbSink:
+    """Crée un lot dans la table batches et y insère les participants valides par paquets.
+
+    Avec `bulk`, les lignes normalisées sont écrites dans un fichier
+    temporaire (dans `work_dir`) chargé en une transaction par LOAD DATA LOCAL
+    INFILE ; si le serveur le refuse, le fichier est inséré par paquets.
+    """
+
+    def __init__(self, batch_code=None, initiated_by="admin", chunk_size=1000, bulk=False, work_dir=None):
+        self.batch_code = batch_code
+        self.initiated_by = initiated_by
+        self.chunk_size = chunk_size
+        self.bulk = bulk
+        self.work_dir = work_dir
+
+    def write_batch(self, participants):
+        """Insère les participants valides (itérable) dans un nouveau lot. Retourne le résumé du lot.
+
+        L'index des échecs (errors) est la position du participant dans `participants`.
+        """
+        batch_code = self.batch_code or f"CSV-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        # Position dans `participants` de chaque ligne insérée (les refusés sont écartés)
+        positions = array("Q")
+
+        def valid_rows():
+            for position, participant in enumerate(participants):
+                if participant["status"] == "valide":
+                    positions.append(position)
+                    yield to_pensioner_row(participant)
+
+        if self.bulk:
+            summary = self._load(batch_code, valid_rows())
+        else:
+            batch_id = Batch.create(batch_code, 0, 0, self.initiated_by)
+            try:
+                result = Pensioner.create_many(valid_rows(), batch_id, self.chunk_size)
+            except Exception:
+                # Lecture interrompue (fichier mal encodé...) : pas de lot à moitié chargé
+                Batch.delete(batch_id)
+                raise
+            summary = self._summary(batch_code, batch_id, result["inserted"], result["failed"])
+        summary["errors"] = [dict(failure, index=positions[failure["index"]]) for failure in summary["errors"]]
+        return summary
+
+    def _load(self, batch_code, rows):
+        """Chargement par LOAD DATA LOCAL INFILE, ou par paquets si LOCAL INFILE est refusé."""
+        fd, path = tempfile.mkstemp(prefix=".load-", suffix=".tsv", dir=self.work_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                _, failed = Pensioner.write_load_file(rows, f)
+            try:
+                result = Pensioner.bulk_load(path, batch_code, self.initiated_by)
+                return self._summary(batch_code, result["batch_id"], result["inserted"], sorted(
+                    failed + result["failed"], key=lambda failure: failure["index"]))
+            except LocalInfileUnavailable as e:
+                print(f"LOAD DATA LOCAL INFILE indisponible ({e}) : insertion par paquets")
+
+            lines = array("Q")
+
+            def read_rows(f):
+                for index, row in Pensioner.read_load_file(f):
+                    lines.append(index)
+                    yield row
+
+            batch_id = Batch.create(batch_code, 0, 0, self.initiated_by)
+            try:
+                with open(path, "r", encoding="utf-8", newline="") as f:
+                    result = Pensioner.create_many(read_rows(f), batch_id, self.chunk_size)
+            except Exception:
+                Batch.delete(batch_id)
+                raise
+            # Index des échecs ramenés aux lignes d'origine
+            failed += [dict(failure, index=lines[failure["index"]]) for failure in result["failed"]]
+            return self._summary(batch_code, batch_id, result["inserted"],
+                                 sorted(failed, key=lambda failure: failure["index"]))
+        finally:
+            os.remove(path)
+
+    @staticmethod
+    def _summary(batch_code, batch_id, inserted, failed):
+        return {
+            "batchId": batch_code,
+            "batch_id": batch_id,
+            "participants_added": inserted,
+            "participants_failed": len(failed),
+            "errors": failed[:100]
+        }
+
+    def write_segment(self, path, count, valid):
+        """Insère les participants valides d'un fichier JSONL déjà écrit (import parallèle)."""
+        with open(path, "r", encoding="utf-8") as f:
+            return self.write_batch(json.loads(line) for line in f if line.strip())
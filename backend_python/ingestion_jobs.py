@@ -0,0 +1,377 @@
+# ingestion_jobs.py
+"""
+Imports de fichiers CSV en tâche de fond.
+
+POST /csv/jobs enregistre le fichier reçu sur disque et rend aussitôt un
+identifiant de tâche ; un pool borné de threads (Config.INGESTION_WORKERS)
+analyse, valide et enregistre ensuite le fichier par paquets de lignes
+(ingestion.iter_participant_chunks).
+
+Répertoire d'une tâche (Config.INGESTION_JOBS_DIR/<job_id>) :
+- upload.csv : le fichier reçu, supprimé une fois la tâche terminée ;
+- job.json : état de la tâche, réécrit (atomiquement) après chaque paquet enregistré ;
+- participants.jsonl : participants déjà traités (destination "json") ;
+- cancel : présent si l'annulation a été demandée (vu aussi par les autres processus) ;
+- .lock : verrou (fcntl.flock) tenu par le thread qui traite la tâche.
+
+Reprise : au démarrage de l'application, les tâches en attente ou en cours
+sont relancées. Les paquets déjà enregistrés (chunks_committed) sont sautés,
+participants.jsonl est ramené à sa taille enregistrée et, en base, les lignes
+sont insérées par Pensioner.create_many(resume=True) : les lignes d'un paquet
+rejoué déjà présentes dans le lot de la tâche sont sautées, sans doublon ni
+déplacement de lignes d'autres lots.
+
+Les lignes déjà payées dans un autre lot de la période de la tâche sont
+refusées (beneficiary_index.PaymentCheck). Les clés des lignes valides sont
+réservées au nom de la tâche dès leur contrôle, rattachées au lot une fois
+celui-ci terminé, et libérées si la tâche échoue ou est annulée.
+"""
+import fcntl
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from batch_store import get_store
+from beneficiary_index import payment_check
+from config import Config
+from ingestion import READ_CHUNK_SIZE, SNIFF_SIZE, detect_csv_format, iter_participant_chunks, to_pensioner_row
+from models.batch_model import Batch
+from models.pensioner_model import Pensioner
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class _StoreJobSink:
+    """Participants ajoutés paquet par paquet à participants.jsonl, puis au magasin de lots."""
+
+    def __init__(self, state, directory):
+        self.state = state
+        self.path = os.path.join(directory, "participants.jsonl")
+        # Reprise : retirer ce qui a été écrit après le dernier paquet enregistré
+        with open(self.path, "ab") as f:
+            f.truncate(state["segment_bytes"])
+        self.file = open(self.path, "ab")
+
+    def write(self, participants):
+        data = "".join(json.dumps(participant, ensure_ascii=False) + "\n" for participant in participants)
+        self.file.write(data.encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.state["segment_bytes"] = self.file.tell()
+
+    def finish(self):
+        self.file.close()
+        store = get_store()
+        # Le lot a pu être ajouté juste avant un redémarrage
+        entry = next((batch for batch in store.batches() if batch.get("job_id") == self.state["job_id"]), None)
+        if entry is None:
+            entry = store.add_segment(self.path, self.state["rows_processed"], self.state["rows_valid"],
+                                      job_id=self.state["job_id"])
+        return {"batchId": entry["batchId"], "participants_added": entry["participants"]}
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _DbJobSink:
+    """Participants valides insérés paquet par paquet dans un nouveau lot de la table pensioners (rejouable).
+
+    Comme l'import direct (PensionerDbSink), un unique_id déjà présent dans un
+    autre lot est refusé ("unique_id déjà existant") sans changer de lot : le
+    lot de la tâche ne contient que des lignes insérées par elle, et discard
+    peut le supprimer entier.
+    """
+
+    def __init__(self, state, save):
+        self.state = state
+        if state["batch_id"] is None:
+            # Code du lot fixé à la création de la tâche : un lot créé avant un redémarrage est retrouvé,
+            # mais un lot existant d'un autre import n'est jamais repris
+            existing = Batch.get_by_batch_code(state["batch_code"])
+            if existing is not None and not state.get("batch_creating"):
+                raise ValueError(f"Lot déjà existant : {state['batch_code']}")
+            if existing is None:
+                state["batch_creating"] = True
+                save(state)
+            state["batch_id"] = existing.id if existing else Batch.create(state["batch_code"], 0, 0, "admin")
+            save(state)
+
+    def write(self, participants):
+        # Index des échecs ramenés aux lignes du fichier (lignes des paquets précédents + position dans le paquet)
+        positions = [self.state["rows_processed"] + position for position, participant in enumerate(participants)
+                     if participant["status"] == "valide"]
+        rows = [to_pensioner_row(participant) for participant in participants if participant["status"] == "valide"]
+        # Paquet rejoué après un arrêt : les lignes déjà insérées dans le lot de la tâche sont sautées
+        result = Pensioner.create_many(rows, self.state["batch_id"], resume=True)
+        self.state["rows_failed"] += len(result["failed"])
+        room = 100 - len(self.state["errors"])
+        if room > 0:
+            for failure in result["failed"][:room]:
+                self.state["errors"].append(dict(failure, index=positions[failure["index"]],
+                                                 chunk=self.state["chunks_committed"]))
+
+    def finish(self):
+        return {
+            "batchId": self.state["batch_code"],
+            "batch_id": self.state["batch_id"],
+            "participants_added": self.state["rows_valid"] - self.state["rows_failed"],
+            "participants_failed": self.state["rows_failed"]
+        }
+
+    def discard(self):
+        # Pas de lot à moitié chargé
+        Batch.delete(self.state["batch_id"])
+
+
+class IngestionJobs:
+    """Tâches d'import : dépôt du fichier, traitement par un pool borné de threads, état et annulation."""
+
+    def __init__(self, root, workers):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+
+    def _directory(self, job_id):
+        if not _JOB_ID.fullmatch(job_id or ""):
+            return None
+        return os.path.join(self.root, job_id)
+
+    def _load(self, job_id):
+        directory = self._directory(job_id)
+        if directory is None:
+            return None
+        try:
+            with open(os.path.join(directory, "job.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, state):
+        """Réécrit job.json d'un coup (fichier temporaire puis renommage)."""
+        state["updated_at"] = datetime.now().isoformat()
+        state["run"]["updated"] = time.time()
+        path = os.path.join(self.root, state["job_id"], "job.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def submit(self, stream, filename, sink="json", batch_code=None, period=None):
+        """Enregistre le fichier binaire `stream` sur disque et programme son import. Retourne l'état de la tâche.
+
+        `period` : période de paiement "AAAA-MM" (beneficiary_index.payment_period).
+        """
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, job_id)
+        os.makedirs(directory)
+        upload_path = os.path.join(directory, "upload.csv")
+        try:
+            with open(upload_path, "wb") as f:
+                shutil.copyfileobj(stream, f, READ_CHUNK_SIZE)
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            # Envoi interrompu ou corps multipart invalide : pas de tâche
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        now = datetime.now()
+        state = {
+            "job_id": job_id,
+            "status": "queued",
+            "filename": filename,
+            "sink": sink,
+            "batch_code": batch_code or (f"CSV-{now:%Y%m%d%H%M%S}-{job_id[:6]}" if sink == "db" else None),
+            "batch_id": None,
+            "batch_creating": False,
+            "period": period,
+            "size": os.path.getsize(upload_path),
+            "csv_format": None,
+            "created_at": now.isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "rows_processed": 0,
+            "rows_valid": 0,
+            "rows_refused": 0,
+            "rows_failed": 0,
+            "bytes_read": 0,
+            "chunks_committed": 0,
+            "segment_bytes": 0,
+            "errors": [],
+            "result": None,
+            "error": None,
+            # Début de l'exécution en cours, pour le débit et l'estimation du temps restant
+            "run": {"started": None, "rows": 0, "bytes": 0, "updated": None}
+        }
+        self._save(state)
+        self._executor.submit(self._run, job_id)
+        return self.status(job_id)
+
+    def resume(self):
+        """Relance les tâches interrompues (en attente ou en cours). Retourne leur nombre."""
+        resumed = 0
+        for job_id in sorted(os.listdir(self.root)):
+            state = self._load(job_id)
+            if state is not None and state["status"] not in TERMINAL_STATUSES:
+                self._executor.submit(self._run, job_id)
+                resumed += 1
+        return resumed
+
+    def status(self, job_id):
+        """État d'une tâche avec progression, débit (lignes/s) et temps restant estimé, ou None."""
+        state = self._load(job_id)
+        if state is None:
+            return None
+        run = state.pop("run")
+        state.pop("segment_bytes")
+        state.pop("batch_creating", None)
+        state["cancel_requested"] = os.path.exists(os.path.join(self.root, job_id, "cancel"))
+        state["progress"] = round(state["bytes_read"] / state["size"], 4) if state["size"] else 1.0
+
+        state["rows_per_second"] = None
+        state["eta_seconds"] = None
+        if run["started"] and run["updated"] and run["updated"] > run["started"]:
+            elapsed = run["updated"] - run["started"]
+            state["rows_per_second"] = round((state["rows_processed"] - run["rows"]) / elapsed, 1)
+            bytes_per_second = (state["bytes_read"] - run["bytes"]) / elapsed
+            if state["status"] == "running" and bytes_per_second > 0:
+                state["eta_seconds"] = round((state["size"] - state["bytes_read"]) / bytes_per_second, 1)
+        if state["status"] == "completed":
+            state["eta_seconds"] = 0
+        return state
+
+    def cancel(self, job_id):
+        """Demande l'annulation d'une tâche ; elle s'arrête avant son prochain paquet. Retourne son état, ou None."""
+        state = self._load(job_id)
+        if state is None:
+            return None
+        if state["status"] not in TERMINAL_STATUSES:
+            open(os.path.join(self.root, job_id, "cancel"), "a").close()
+        return self.status(job_id)
+
+    def _run(self, job_id):
+        directory = os.path.join(self.root, job_id)
+        with open(os.path.join(directory, ".lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Déjà traitée par un autre thread ou processus
+                return
+            state = self._load(job_id)
+            if state is None or state["status"] in TERMINAL_STATUSES:
+                return
+            try:
+                self._process(state, directory)
+            except Exception as e:
+                print(f"Erreur lors de l'import {job_id} : {e}")
+                state["status"] = "failed"
+                state["error"] = str(e)
+                state["finished_at"] = datetime.now().isoformat()
+                self._save(state)
+
+    @staticmethod
+    def _release_payments(state, payments):
+        """Libère les clés réservées par la tâche, y compris lors d'une exécution précédente (arrêt puis reprise)."""
+        payments = payments or payment_check(state.get("period"), f"job-{state['job_id']}")
+        if payments is not None:
+            payments.release()
+
+    def _process(self, state, directory):
+        upload_path = os.path.join(directory, "upload.csv")
+        cancel_path = os.path.join(directory, "cancel")
+        sink = payments = None
+        try:
+            if not os.path.exists(cancel_path):
+                sink = _DbJobSink(state, self._save) if state["sink"] == "db" else _StoreJobSink(state, directory)
+                state["status"] = "running"
+                state["started_at"] = state["started_at"] or datetime.now().isoformat()
+                state["run"] = {"started": time.time(), "rows": state["rows_processed"],
+                                "bytes": state["bytes_read"], "updated": None}
+                self._save(state)
+
+                with open(upload_path, "rb") as upload:
+                    if state["csv_format"] is None:
+                        state["csv_format"] = detect_csv_format(upload.read(SNIFF_SIZE))
+                        upload.seek(0)
+                    stats = {"total": 0, "valid": 0, "refused": 0}
+                    # Les paquets sautés sont aussi contrôlés ; la réservation des clés, au nom de la tâche,
+                    # survit à un arrêt : la tâche reprise ne voit pas ses propres lignes comme déjà payées
+                    payments = payment_check(state.get("period"), f"job-{state['job_id']}")
+                    chunks = iter_participant_chunks(upload, stats, state["csv_format"], state["chunks_committed"],
+                                                     payments)
+                    try:
+                        for participants in chunks:
+                            if os.path.exists(cancel_path):
+                                break
+                            sink.write(participants)
+                            valid = sum(1 for participant in participants if participant["status"] == "valide")
+                            state["chunks_committed"] += 1
+                            state["rows_processed"] += len(participants)
+                            state["rows_valid"] += valid
+                            state["rows_refused"] += len(participants) - valid
+                            # Position approximative : pandas lit le fichier par blocs d'avance
+                            state["bytes_read"] = min(upload.tell(), state["size"])
+                            self._save(state)
+                    finally:
+                        chunks.close()
+
+            if os.path.exists(cancel_path):
+                if sink is not None:
+                    sink.discard()
+                self._release_payments(state, payments)
+                state["status"] = "cancelled"
+            elif state["rows_processed"] == 0:
+                raise ValueError("CSV vide")
+            else:
+                state["result"] = sink.finish()
+                if payments is not None:
+                    # Avant l'état final : rejouée après un arrêt, l'inscription est ignorée si déjà faite.
+                    # Le lot est enregistré : une erreur d'inscription ne le remet pas en cause.
+                    try:
+                        payments.commit(state["result"]["batchId"], state["sink"])
+                    except Exception as e:
+                        print(f"Erreur lors de l'inscription de l'import {state['job_id']} dans l'index des bénéficiaires : {e}")
+                state["bytes_read"] = state["size"]
+                state["status"] = "completed"
+        except Exception:
+            if sink is not None:
+                try:
+                    sink.discard()
+                except Exception as e:
+                    print(f"Erreur lors de l'abandon de l'import {state['job_id']} : {e}")
+            try:
+                self._release_payments(state, payments)
+            except Exception as e:
+                print(f"Erreur lors de la libération des clés réservées par l'import {state['job_id']} : {e}")
+            raise
+
+        state["finished_at"] = datetime.now().isoformat()
+        self._save(state)
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_ingestion_jobs():
+    """Retourne le gestionnaire de tâches d'import du processus, créé (avec reprise des tâches interrompues) à la première demande."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            jobs = IngestionJobs(Config.INGESTION_JOBS_DIR, Config.INGESTION_WORKERS)
+            jobs.resume()
+            _jobs = jobs
+        return _jobs
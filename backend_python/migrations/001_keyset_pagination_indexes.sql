@@ -0,0 +1,11 @@
+-- Index composites pour la pagination par curseur sur (created_at, id)
+-- utilisée par Pensioner.get_all et Batch.get_all, avec ou sans filtre.
+
+ALTER TABLE `batches`
+  ADD KEY `idx_batches_created` (`created_at`,`id`),
+  ADD KEY `idx_batches_status_created` (`status`,`created_at`,`id`);
+
+ALTER TABLE `pensioners`
+  ADD KEY `idx_pensioners_created` (`created_at`,`id`),
+  ADD KEY `idx_pensioners_status_created` (`status`,`created_at`,`id`),
+  ADD KEY `idx_pensioners_batch_created` (`batch_id`,`created_at`,`id`);
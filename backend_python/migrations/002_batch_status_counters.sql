@@ -0,0 +1,39 @@
+-- Compteurs par statut maintenus par le serveur dans la même transaction
+-- que les écritures sur pensioners (voir Batch.apply_deltas).
+
+ALTER TABLE `batches`
+  ADD COLUMN `pending_count` int(11) NOT NULL DEFAULT 0 AFTER `initiated_by`,
+  ADD COLUMN `validated_count` int(11) NOT NULL DEFAULT 0 AFTER `pending_count`,
+  ADD COLUMN `processing_count` int(11) NOT NULL DEFAULT 0 AFTER `validated_count`,
+  ADD COLUMN `success_count` int(11) NOT NULL DEFAULT 0 AFTER `processing_count`,
+  ADD COLUMN `failed_count` int(11) NOT NULL DEFAULT 0 AFTER `success_count`;
+
+-- Initialisation depuis les pensionnés existants
+UPDATE `batches` b
+LEFT JOIN (
+  SELECT batch_id,
+         COUNT(*) AS total_payments,
+         SUM(amount) AS total_amount,
+         SUM(status = 'pending') AS pending_count,
+         SUM(status = 'validated') AS validated_count,
+         SUM(status = 'processing') AS processing_count,
+         SUM(status = 'success') AS success_count,
+         SUM(status = 'failed') AS failed_count
+  FROM pensioners
+  GROUP BY batch_id
+) p ON p.batch_id = b.id
+SET b.total_payments = COALESCE(p.total_payments, 0),
+    b.total_amount = COALESCE(p.total_amount, 0),
+    b.pending_count = COALESCE(p.pending_count, 0),
+    b.validated_count = COALESCE(p.validated_count, 0),
+    b.processing_count = COALESCE(p.processing_count, 0),
+    b.success_count = COALESCE(p.success_count, 0),
+    b.failed_count = COALESCE(p.failed_count, 0);
+
+UPDATE `batches` SET
+  success_rate = IF(total_payments > 0, ROUND(success_count * 100 / total_payments, 2), 0),
+  status = CASE
+    WHEN total_payments = 0 OR pending_count + validated_count + processing_count > 0 THEN 'pending'
+    WHEN failed_count = 0 THEN 'completed'
+    ELSE 'partial'
+  END;
@@ -0,0 +1,28 @@
+# migrations/003_data_json_to_batch_store.py
+"""
+Migre l'ancien fichier data.json (tableau JSON de lots) vers le magasin de lots
+(un segment JSONL par lot + index, voir batch_store.py).
+
+L'application fait la même migration au premier accès si le magasin est vide ;
+ce script permet de la lancer explicitement (ou sur un autre fichier) :
+    python migrations/003_data_json_to_batch_store.py [data.json] [répertoire du magasin]
+
+Les lots déjà présents dans le magasin (même batchId) sont ignorés. Le fichier
+d'origine n'est pas modifié.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_store import BatchStore
+from config import Config
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else Config.DATA_FILE
+    root = sys.argv[2] if len(sys.argv) > 2 else Config.BATCH_STORE_DIR
+
+    store = BatchStore(root)
+    migrated = store.migrate_from_json(source)
+    print(f"{migrated} lot(s) migré(s) depuis {source} vers {root} ({len(store.batches())} lot(s) au total)")
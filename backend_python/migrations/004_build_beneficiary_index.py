@@ -0,0 +1,28 @@
+# migrations/004_build_beneficiary_index.py
+"""
+Construit l'index des bénéficiaires déjà payés (beneficiary_index.py) depuis
+la table pensioners : à lancer une fois avant d'activer le contrôle des
+doubles paiements, puis si l'index est perdu ou désynchronisé (lots supprimés).
+
+    python migrations/004_build_beneficiary_index.py [répertoire de l'index]
+
+Même opération que POST /beneficiaries/index/rebuild. Les lots inscrits
+depuis le magasin de lots (destination "json") sont conservés.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from beneficiary_index import BeneficiaryIndex
+from config import Config
+
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else Config.BENEFICIARY_INDEX_DIR
+
+    index = BeneficiaryIndex(root)
+    rebuilt = index.rebuild_from_db()
+    stats = index.stats()
+    print(f"{rebuilt['batches']} lot(s) et {rebuilt['keys']} clé(s) inscrits dans {root} "
+          f"(table : {stats['table_bytes'] / 1024 / 1024:.0f} Mo, filtre de Bloom : {stats['bloom_bytes'] / 1024 / 1024:.0f} Mo)")
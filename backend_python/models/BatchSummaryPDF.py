@@ -0,0 +1,112 @@
+from fpdf import FPDF
+
+from models.ReceiptPDF import ReceiptPDF
+
+
+class BatchSummaryPDF(ReceiptPDF):
+    """
+    Récapitulatif d'un lot importé, dans le style des reçus (bandeaux,
+    titres de section, lignes d'information) : une page de totaux et des
+    pages de tableau des participants.
+
+    Chaque page est mise en page seule (add_totals_page, add_table_page) :
+    batch_summary.py assemble le document page par page sans garder les
+    pages déjà écrites.
+    """
+    TITLE = "RÉCAPITULATIF DE LOT"
+    FOOTER_LINES = ("Récapitulatif des paiements du lot", "Paiement sécurisé via Mojaloop")
+
+    # Colonnes du tableau des participants : (titre, largeur en mm), 190 mm au total
+    COLUMNS = (("N°", 12), ("Nom complet", 46), ("Type", 16), ("Identifiant", 28), ("Montant", 22), ("Devise", 12),
+               ("Statut", 14), ("Erreurs", 40))
+    # Colonnes de la répartition par FSP (page de totaux)
+    FSP_COLUMNS = (("FSP", 70), ("Participants", 30), ("Valides", 30), ("Refusés", 30), ("Montant valide", 30))
+    TABLE_FONT_SIZE = 8
+    ROW_HEIGHT = 6
+    HEADER_ROW_HEIGHT = 7
+    # Haut du bandeau de pied de page (voir ReceiptPDF.footer), moins une marge
+    CONTENT_BOTTOM = 272 - 3
+
+    def __init__(self):
+        # Pas de données de transaction : seule la mise en page de ReceiptPDF est reprise
+        FPDF.__init__(self)
+        self.set_auto_page_break(auto=False)
+
+    def rows_left(self):
+        """Nombre de lignes de tableau qui tiennent encore sur la page (en-tête de tableau compris)."""
+        return int((self.CONTENT_BOTTOM - self.get_y() - self.HEADER_ROW_HEIGHT) // self.ROW_HEIGHT)
+
+    def add_table(self, columns, rows):
+        """Tableau : ligne d'en-tête sur fond de titre de section, puis une ligne par élément de `rows` (textes)."""
+        self.set_fill_color(220, 230, 255)
+        self.set_text_color(30, 65, 135)
+        self.set_font("Helvetica", "B", self.TABLE_FONT_SIZE + 1)
+        for title, width in columns:
+            self.cell(width, self.HEADER_ROW_HEIGHT, title, fill=True)
+        self.ln(self.HEADER_ROW_HEIGHT)
+        self.set_text_color(0, 0, 0)
+        self.set_font("Helvetica", "", self.TABLE_FONT_SIZE)
+        for row in rows:
+            for (_, width), text in zip(columns, row):
+                self.cell(width, self.ROW_HEIGHT, text)
+            self.ln(self.ROW_HEIGHT)
+
+    def add_table_page(self, batch_id, page, rows):
+        """Page du tableau des participants. Retourne le nombre de lignes que la page peut contenir."""
+        self.add_page()
+        self.add_section_title("Participants")
+        self.add_info_line("Lot :", batch_id)
+        self.add_info_line("Page :", str(page))
+        self.ln(2)
+        capacity = self.rows_left()
+        self.add_table(self.COLUMNS, rows[:capacity])
+        return capacity
+
+    @staticmethod
+    def format_amount(value):
+        """Montant avec les milliers séparés par des espaces (1 234 567.50)."""
+        return f"{value:,}".replace(",", " ")
+
+    @staticmethod
+    def format_amounts(amounts):
+        """Montants par devise ({devise: montant}) sur une ligne."""
+        return " / ".join(f"{BatchSummaryPDF.format_amount(amount)} {currency}"
+                          for currency, amount in sorted(amounts.items())) or "0"
+
+    def add_totals_page(self, batch, totals):
+        """Page des totaux du lot (`totals` : voir batch_summary.SummaryTotals.report)."""
+        self.add_page()
+        self.add_section_title("Lot")
+        self.add_info_line("Lot :", batch["batchId"])
+        self.add_info_line("Date d'import :", str(batch.get("date") or "N/A"))
+        self.add_info_line("Généré le :", totals["generated_at"])
+        self.ln(4)
+
+        self.add_section_title("Totaux")
+        self.add_info_line("Participants :", str(totals["participants"]))
+        self.add_info_line("Valides :", str(totals["valid"]))
+        self.add_info_line("Refusés :", str(totals["refused"]))
+        self.add_info_line("Montant valide :", self.format_amounts(totals["amounts"]))
+        self.add_info_line("Pages de participants :", str(totals["pages"]))
+        self.ln(4)
+
+        if totals["errors"]:
+            self.add_section_title("Motifs de refus")
+            for code, count in sorted(totals["errors"].items()):
+                self.add_info_line(f"{code} :", str(count))
+            self.ln(4)
+
+        self.add_section_title("Répartition par FSP")
+        fsps = totals["fsps"]
+        capacity = self.rows_left()
+        if len(fsps) > capacity:
+            # Les FSP qui ne tiennent pas sur la page sont regroupés sur la dernière ligne
+            others = fsps[capacity - 1:]
+            amounts = {}
+            for *_, fsp_amounts in others:
+                for currency, amount in fsp_amounts.items():
+                    amounts[currency] = amounts.get(currency, 0) + amount
+            fsps = fsps[:capacity - 1] + [(f"Autres ({len(others)} FSP)", sum(fsp[1] for fsp in others),
+                                           sum(fsp[2] for fsp in others), sum(fsp[3] for fsp in others), amounts)]
+        self.add_table(self.FSP_COLUMNS, [(name, str(participants), str(valid), str(refused), self.format_amounts(amounts))
+                                          for name, participants, valid, refused, amounts in fsps])
@@ -1,7 +1,28 @@
+import hashlib
+import re
+import threading
+import zlib
+from datetime import datetime, timezone
+
+import fpdf
 from fpdf import FPDF, XPos, YPos
-from datetime import datetime
+try:
+    from fpdf.util import escape_parens
+except ImportError:
+    # Autre version de fpdf2 : pas de modèle précompilé, tous les reçus passent par ReceiptPDF
+    escape_parens = None
+
+# Version de la mise en page des reçus : à incrémenter à chaque changement de
+# ReceiptPDF, elle invalide les reçus déjà rendus (receipt_cache.py)
+RECEIPT_TEMPLATE_VERSION = 1
 
 class ReceiptPDF(FPDF):
+    # Titre du bandeau d'en-tête et lignes du bandeau de pied de page
+    TITLE = "REÇU DE PAIEMENT"
+    FOOTER_LINES = ("Merci pour votre confiance !", "Paiement sécurisé via Mojaloop")
+    # Largeur (mm) de la cellule centrée du montant, reprise par ReceiptTemplate
+    AMOUNT_CELL_WIDTH = 130
+
     def __init__(self, data):
         super().__init__()
         self.data = data
@@ -10,17 +31,20 @@ class ReceiptPDF(FPDF):
         self.transaction_id = data.get("homeTransactionId", "N/A")
         self.status = data.get("currentState", "N/A")
         self.note = data.get("note") or "Aucune note"
-        self.receiver_name = self._get_receiver_name()
+        self.receiver_name = self._get_receiver_name(data)
         self.date_payment = self._format_date_fr(data.get("completedTimestamp", data.get("initiatedTimestamp")))
 
-    def _get_receiver_name(self):
-        to_data = self.data.get('to', {})
+    @staticmethod
+    def _get_receiver_name(data):
+        to_data = data.get('to', {})
         first = to_data.get('firstName', '')
         middle = to_data.get('middleName', '').strip()
         last = to_data.get('lastName', '')
-        return f"{first} {middle} {last}".strip()
+        # Sans deuxième prénom (participants d'un lot importé), pas de double espace
+        return " ".join(part for part in (first, middle, last) if part).strip()
 
-    def _format_date_fr(self, iso_str):
+    @staticmethod
+    def _format_date_fr(iso_str):
         if not iso_str:
             return "N/A"
         try:
@@ -35,7 +59,7 @@ class ReceiptPDF(FPDF):
         self.set_text_color(255, 255, 255)
         self.set_font("Helvetica", "B", 24)
         self.ln(5)
-        self.cell(0, 8, "REÇU DE PAIEMENT", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+        self.cell(0, 8, self.TITLE, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
         self.set_font("Helvetica", "", 12)
         self.ln(5)
 
@@ -45,8 +69,8 @@ class ReceiptPDF(FPDF):
         self.rect(0, 272, 210, 25, 'F')
         self.set_text_color(255, 255, 255)
         self.set_font("Helvetica", "I", 10)
-        self.cell(0, 8, "Merci pour votre confiance !", 0, 1, "C")
-        self.cell(0, 8, "Paiement sécurisé via Mojaloop", 0, 1, "C")
+        for line in self.FOOTER_LINES:
+            self.cell(0, 8, line, 0, 1, "C")
 
     def add_section_title(self, title):
         self.set_fill_color(220, 230, 255)
@@ -76,7 +100,7 @@ class ReceiptPDF(FPDF):
         self.set_font("Helvetica", "B", 32)
         self.set_text_color(22, 101, 52)
         self.ln(8)
-        self.cell(130, 12, f"{self.amount} {self.currency}", align="C")
+        self.cell(self.AMOUNT_CELL_WIDTH, 12, f"{self.amount} {self.currency}", align="C")
         self.ln(15)
 
     def generate(self):
@@ -111,4 +135,195 @@ class ReceiptPDF(FPDF):
             self.add_section_title("Note")
             self.add_info_line("Message :", self.note)
 
-        return self.output(dest='S').encode('latin1')  # <-- à remplacer
+        # fpdf2 renvoie directement les octets du document (bytearray)
+        return bytes(self.output())
+
+
+class ReceiptTemplate:
+    """
+    Reçu précompilé : la mise en page fixe de ReceiptPDF (bandeaux, titres,
+    libellés, couleurs) est calculée une seule fois par processus, puis chaque
+    reçu ne fait qu'inscrire ses champs variables (montant, références, dates,
+    noms, identifiants, note) aux positions relevées.
+
+    Le modèle est obtenu en rendant ReceiptPDF avec des marqueurs à la place des
+    champs : le flux de contenu produit est découpé en lignes fixes et en lignes
+    à remplir, et les objets fixes du document (pages, polices, ressources) sont
+    gardés tels quels. Le document rendu est celui de ReceiptPDF octet pour
+    octet, à la date de création et à l'identifiant près.
+
+    Les valeurs que ce découpage ne sait pas reproduire (valeur absente ou qui
+    n'est pas une chaîne, caractère de contrôle ou hors latin-1, alias {nb}) passent par
+    ReceiptPDF : voir render_receipt.
+
+    Le découpage suppose la sortie de fpdf2 2.8 (version fixée dans
+    requirements.txt). À la compilation, un reçu d'essai est rendu des deux
+    façons : si la compilation échoue ou si les octets diffèrent (autre
+    version de fpdf2), get rend None et tous les reçus passent par ReceiptPDF.
+    """
+    _templates = {}
+    _lock = threading.Lock()
+    _CHECK_DATE = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+    # Ordre des champs variables (voir fields)
+    _SLOTS = ("amount", "transaction_id", "status", "date_payment", "payer_name", "payer_id",
+              "receiver_name", "receiver_id", "note")
+    # Caractères de contrôle, et alias du nombre de pages que fpdf2 remplace dans les textes
+    _UNSAFE_CHARS = re.compile(r"[\x00-\x1f\x7f-\x9f]|\{nb\}")
+
+    def __init__(self, with_note):
+        markers = {slot: f"@@{i}@@" for i, slot in enumerate(self._SLOTS)}
+        data = {
+            "amount": markers["amount"],
+            "currency": "@@@@",
+            "homeTransactionId": markers["transaction_id"],
+            "currentState": markers["status"],
+            "completedTimestamp": markers["date_payment"],
+            "note": markers["note"] if with_note else None,
+            "from": {"name": markers["payer_name"], "idValue": markers["payer_id"]},
+            "to": {"firstName": markers["receiver_name"], "lastName": "", "idValue": markers["receiver_id"]},
+        }
+        pdf = ReceiptPDF(data)
+        pdf.set_compression(False)
+        document = pdf.generate()
+
+        # Largeur des textes du montant : même police que add_amount_block
+        self._measure = FPDF()
+        self._measure.set_font("Helvetica", "B", 32)
+        self._amount_left = pdf.l_margin
+        self._k = pdf.k
+
+        # Objets 1 à 3 (avant le contenu), 5 et suivants (après), décalages d'origine
+        start = document.index(b"4 0 obj\n")
+        content_start = document.index(b"stream\n", start) + len(b"stream\n")
+        content_end = document.index(b"\nendstream", content_start)
+        after = document.index(b"endobj\n", content_end) + len(b"endobj\n")
+        info = document.index(b"9 0 obj\n")
+        xref = document.index(b"\nxref\n") + 1
+        offsets = [int(line[:10]) for line in document[xref:].split(b"\n")[3:12]]
+        self._head = document[:start]
+        self._objects = document[after:info]
+        self._offsets = offsets[:3]
+        self._moved = [offset - offsets[4] for offset in offsets[4:8]]
+
+        # Lignes du flux : texte fixe, ou (champ, début de ligne, fin de ligne)
+        self._lines = []
+        for line in document[content_start:content_end].decode("latin-1").split("\n"):
+            slot = next((slot for slot, marker in markers.items() if marker in line), None)
+            if slot == "amount":
+                match = re.fullmatch(r"(q BT )[\d.]+( .* Td .*\()@@0@@ @@@@(\) Tj ET Q)", line)
+                self._lines.append((slot, match.group(1), match.group(2), match.group(3)))
+            elif slot:
+                before, after_marker = line.split(markers[slot])
+                self._lines.append((slot, before, after_marker))
+            else:
+                self._lines.append(line)
+
+    @classmethod
+    def get(cls, with_note):
+        """Modèle du processus courant (compilé et vérifié au premier appel), ou None s'il est indisponible."""
+        try:
+            return cls._templates[with_note]
+        except KeyError:
+            pass
+        with cls._lock:
+            if with_note not in cls._templates:
+                cls._templates[with_note] = cls._compile(with_note)
+            return cls._templates[with_note]
+
+    @classmethod
+    def _compile(cls, with_note):
+        """Compile le modèle puis compare un reçu d'essai à celui de ReceiptPDF. Retourne None en cas d'écart."""
+        sample = {
+            "amount": "1 234 (essai)",
+            "currency": "XOF",
+            "homeTransactionId": "ESSAI-0001",
+            "currentState": "COMPLETED",
+            "completedTimestamp": "2000-01-01T00:00:00Z",
+            "note": "Note d'essai" if with_note else None,
+            "from": {"name": "Payeur Essai", "idValue": "22900000000"},
+            "to": {"firstName": "Bénéficiaire", "lastName": "Essai", "idValue": "22900000001"},
+        }
+        try:
+            if escape_parens is None:
+                raise ImportError("fpdf.util.escape_parens introuvable")
+            template = cls(with_note)
+            expected = ReceiptPDF(sample)
+            expected.set_creation_date(cls._CHECK_DATE)
+            if template.render(cls.fields(sample), cls._CHECK_DATE) != expected.generate():
+                raise ValueError("reçu d'essai différent de celui de ReceiptPDF")
+        except Exception as e:
+            print(f"Modèle de reçu précompilé indisponible (fpdf2 {fpdf.__version__}), rendu par ReceiptPDF : {e}")
+            return None
+        return template
+
+    @staticmethod
+    def values(data):
+        """Champs variables d'un reçu, tels qu'affichés par ReceiptPDF."""
+        return {
+            "amount": f"{data.get('amount', 'N/A')} {data.get('currency', 'XOF')}",
+            "transaction_id": data.get("homeTransactionId", "N/A"),
+            "status": data.get("currentState", "N/A"),
+            "date_payment": ReceiptPDF._format_date_fr(data.get("completedTimestamp", data.get("initiatedTimestamp"))),
+            "payer_name": data["from"]["name"],
+            "payer_id": data["from"]["idValue"],
+            "receiver_name": ReceiptPDF._get_receiver_name(data),
+            "receiver_id": data["to"]["idValue"],
+            "note": data.get("note") or "Aucune note",
+        }
+
+    @classmethod
+    def fields(cls, data):
+        """Champs variables d'un reçu, ou None si l'un d'eux doit passer par ReceiptPDF."""
+        values = cls.values(data)
+        for value in values.values():
+            if not isinstance(value, str) or not value or cls._UNSAFE_CHARS.search(value):
+                return None
+            try:
+                value.encode("latin-1")
+            except UnicodeEncodeError:
+                return None
+        return values
+
+    def _amount_x(self, text):
+        """Abscisse (pt) du montant centré dans sa cellule, calculée comme fpdf2 (Align.C)."""
+        dx = (ReceiptPDF.AMOUNT_CELL_WIDTH - self._measure.get_string_width(text)) / 2
+        return f"{(self._amount_left + dx) * self._k:.2f}"
+
+    def render(self, values, creation_date=None):
+        """Octets du reçu pour les champs `values` (voir fields)."""
+        lines = []
+        for line in self._lines:
+            if isinstance(line, str):
+                lines.append(line)
+            elif line[0] == "amount":
+                text = values["amount"]
+                lines.append(f"{line[1]}{self._amount_x(text)}{line[2]}{escape_parens(text)}{line[3]}")
+            else:
+                lines.append(f"{line[1]}{escape_parens(values[line[0]])}{line[2]}")
+        content = zlib.compress("\n".join(lines).encode("latin-1"), 6)
+
+        creation_date = creation_date or datetime.now(timezone.utc)
+        stream = (b"4 0 obj\n<<\n/Filter /FlateDecode\n/Length %d\n>>\nstream\n" % len(content)
+                  + content + b"\nendstream\nendobj\n")
+        moved = len(self._head) + len(stream)
+        info = f"9 0 obj\n<<\n/CreationDate (D:{creation_date:%Y%m%d%H%M%S}Z)\n>>\nendobj\n".encode("latin-1")
+        buffer = self._head + stream + self._objects + info
+        offsets = self._offsets + [len(self._head)] + [moved + offset for offset in self._moved]
+        offsets.append(moved + len(self._objects))
+        file_id = hashlib.md5(buffer + f"{creation_date:%Y%m%d%H%M%S}".encode("latin-1"), usedforsecurity=False)
+        file_id = file_id.hexdigest().upper()
+        trailer = ["xref", "0 10", "0000000000 65535 f "]
+        trailer += [f"{offset:010} 00000 n " for offset in offsets]
+        trailer += ["trailer", "<<", "/Size 10", "/Root 2 0 R", "/Info 9 0 R",
+                    f"/ID [<{file_id}><{file_id}>]", ">>", "startxref", str(len(buffer)), "%%EOF"]
+        return buffer + "\n".join(trailer).encode("latin-1") + b"\n"
+
+
+def render_receipt(data):
+    """Octets PDF du reçu de `data` : modèle précompilé, ou ReceiptPDF pour les valeurs qu'il ne couvre pas."""
+    values = ReceiptTemplate.fields(data)
+    template = ReceiptTemplate.get(values["note"] != "Aucune note") if values is not None else None
+    if template is None:
+        return ReceiptPDF(data).generate()
+    return template.render(values)
@@ -1,9 +1,29 @@
 from config import Config
 from http import HTTPStatus
 from datetime import datetime
+from decimal import Decimal
+from models.pagination import encode_cursor, keyset_clause
+from cache import get_cache
+from models import statements
+
+# Compteurs par statut de pensionné maintenus dans la table batches
+COUNTER_COLUMNS = {
+    'pending': 'pending_count',
+    'validated': 'validated_count',
+    'processing': 'processing_count',
+    'success': 'success_count',
+    'failed': 'failed_count',
+}
+
+_cache = get_cache('batch')
 
 class Batch:
-    def __init__(self, id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at=None, updated_at=None):
+    FIELDS = ('id', 'batch_code', 'total_amount', 'total_payments', 'success_rate', 'status', 'initiated_by', 'created_at', 'updated_at',
+              'pending_count', 'validated_count', 'processing_count', 'success_count', 'failed_count')
+    __slots__ = FIELDS
+
+    def __init__(self, id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at=None, updated_at=None,
+                 pending_count=0, validated_count=0, processing_count=0, success_count=0, failed_count=0):
         self.id = id
         self.batch_code = batch_code
         self.total_amount = total_amount
@@ -13,6 +33,15 @@ class Batch:
         self.initiated_by = initiated_by
         self.created_at = created_at
         self.updated_at = updated_at
+        self.pending_count = pending_count
+        self.validated_count = validated_count
+        self.processing_count = processing_count
+        self.success_count = success_count
+        self.failed_count = failed_count
+
+    def to_dict(self):
+        """Retourne le lot sous forme de dict (colonnes de FIELDS)."""
+        return {field: getattr(self, field) for field in Batch.FIELDS}
 
     @staticmethod
     def create(batch_code, total_amount, total_payments, initiated_by, status='pending', success_rate=0.00):
@@ -21,25 +50,19 @@ class Batch:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
             if status not in ['pending', 'completed', 'partial']:
                 raise Exception("Statut invalide. Doit être 'pending', 'completed' ou 'partial'")
 
-            query = """
-                INSERT INTO batches (batch_code, total_amount, total_payments, success_rate, status, initiated_by)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """
             values = (batch_code, total_amount, total_payments, success_rate, status, initiated_by)
-            cursor.execute(query, values)
+            batch_id = statements.insert(db, 'batch.insert', values)
             db.commit()
-            return cursor.lastrowid
+            return batch_id
         except Exception as e:
             print(f"Erreur lors de la création du lot : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la création du lot : {e}")
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
@@ -49,7 +72,6 @@ class Batch:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
             updates = {}
             if batch_code is not None:
@@ -68,12 +90,12 @@ class Batch:
                 updates['initiated_by'] = initiated_by
 
             if updates:
-                set_clause = ", ".join(f"{key} = %s" for key in updates.keys())
-                query = f"UPDATE batches SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
-                values = list(updates.values()) + [id]
-                cursor.execute(query, values)
+                # Forme fixe : les colonnes absentes de `updates` sont passées à NULL et restent inchangées
+                values = [updates.get(column) for column in statements.BATCH_UPDATE_COLUMNS] + [id]
+                updated = statements.execute(db, 'batch.update', values) > 0
                 db.commit()
-                return cursor.rowcount > 0
+                Batch.invalidate_cache(id)
+                return updated
             else:
                 return False
         except Exception as e:
@@ -81,52 +103,80 @@ class Batch:
             db.rollback()
             raise Exception(f"Erreur lors de la mise à jour du lot : {e}")
         finally:
-            cursor.close()
             db.close()
 
+    @staticmethod
+    def _cache_keys(batch):
+        return (f"id:{batch.id}", f"code:{batch.batch_code}")
+
+    @staticmethod
+    def invalidate_cache(*ids):
+        """Retire du cache les lots donnés (dans tous les workers)."""
+        _cache.invalidate(*(f"id:{id}" for id in ids))
+
     @staticmethod
     def get_by_id(id):
-        """Récupère un lot par son ID."""
+        """Récupère un lot par son ID (lecture traversante du cache)."""
+        return _cache.fetch(f"id:{id}", lambda: Batch._load_by_id(id), Batch._cache_keys)
+
+    @staticmethod
+    def _load_by_id(id):
+        """Récupère un lot par son ID depuis la base."""
         db = Config.get_db_connection()
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
         try:
-            query = """
-                SELECT id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at, updated_at
-                FROM batches WHERE id = %s
-            """
-            cursor.execute(query, (id,))
-            result = cursor.fetchone()
+            result = statements.fetch_one(db, 'batch.get_by_id', (id,))
             if result:
-                return Batch(**result)
+                return Batch(*result)
             return None
         except Exception as e:
             print(f"Erreur lors de la récupération du lot : {e}")
             return None
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
-    def get_all(limit=50, offset=0):
-        """Récupère tous les lots, triés par date de création descendante."""
+    def get_all(limit=50, after=None, status=None):
+        """Récupère une page de lots, triés par date de création descendante.
+
+        La pagination se fait par curseur sur (created_at, id) : passer dans `after`
+        le `next_cursor` de la page précédente pour obtenir la suivante.
+        Retourne (liste de lots, next_cursor ou None).
+        """
+        conditions = []
+        values = []
+        if status is not None:
+            conditions.append("status = %s")
+            values.append(status)
+        if after:
+            clause, cursor_values = keyset_clause(after)
+            conditions.append(clause)
+            values.extend(cursor_values)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
         db = Config.get_db_connection()
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
+        cursor = db.cursor()
         try:
-            query = """
-                SELECT id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at, updated_at
+            query = f"""
+                SELECT id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at, updated_at,
+                       pending_count, validated_count, processing_count, success_count, failed_count
                 FROM batches
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
             """
-            cursor.execute(query, (limit, offset))
-            results = cursor.fetchall()
-            return [Batch(**result) for result in results] if results else []
+            cursor.execute(query, values + [limit + 1])
+            batches = [Batch(*result) for result in cursor.fetchall()]
+            next_cursor = None
+            if len(batches) > limit:
+                del batches[limit:]
+                next_cursor = encode_cursor(batches[-1].created_at, batches[-1].id)
+            return batches, next_cursor
         except Exception as e:
             print(f"Erreur lors de la récupération des lots : {e}")
             return None
@@ -136,27 +186,25 @@ class Batch:
 
     @staticmethod
     def get_by_batch_code(batch_code):
-        """Récupère un lot par son code unique."""
+        """Récupère un lot par son code unique (lecture traversante du cache)."""
+        return _cache.fetch(f"code:{batch_code}", lambda: Batch._load_by_batch_code(batch_code), Batch._cache_keys)
+
+    @staticmethod
+    def _load_by_batch_code(batch_code):
+        """Récupère un lot par son code unique depuis la base."""
         db = Config.get_db_connection()
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
         try:
-            query = """
-                SELECT id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at, updated_at
-                FROM batches WHERE batch_code = %s
-            """
-            cursor.execute(query, (batch_code,))
-            result = cursor.fetchone()
+            result = statements.fetch_one(db, 'batch.get_by_code', (batch_code,))
             if result:
-                return Batch(**result)
+                return Batch(*result)
             return None
         except Exception as e:
             print(f"Erreur lors de la récupération du lot par code : {e}")
             return None
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
@@ -166,21 +214,19 @@ class Batch:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
             if status not in ['pending', 'completed', 'partial']:
                 raise Exception("Statut invalide. Doit être 'pending', 'completed' ou 'partial'")
 
-            query = "UPDATE batches SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
-            cursor.execute(query, (status, id))
+            updated = statements.execute(db, 'batch.update_status', (status, id)) > 0
             db.commit()
-            return cursor.rowcount > 0
+            Batch.invalidate_cache(id)
+            return updated
         except Exception as e:
             print(f"Erreur lors de la mise à jour du statut du lot : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la mise à jour du statut du lot : {e}")
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
@@ -190,18 +236,16 @@ class Batch:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
-            query = "UPDATE batches SET success_rate = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
-            cursor.execute(query, (success_rate, id))
+            updated = statements.execute(db, 'batch.update_success_rate', (success_rate, id)) > 0
             db.commit()
-            return cursor.rowcount > 0
+            Batch.invalidate_cache(id)
+            return updated
         except Exception as e:
             print(f"Erreur lors de la mise à jour du taux de réussite : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la mise à jour du taux de réussite : {e}")
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
@@ -211,42 +255,239 @@ class Batch:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
-            query = "DELETE FROM batches WHERE id = %s"
-            cursor.execute(query, (id,))
-            if cursor.rowcount == 0:
+            if statements.execute(db, 'batch.delete', (id,)) == 0:
                 raise Exception("Lot non trouvé")
             db.commit()
+            Batch.invalidate_cache(id)
+            # Les pensionnés du lot sont supprimés en cascade
+            get_cache('pensioner').invalidate(f"batch:{id}")
             return True
         except Exception as e:
             print(f"Erreur lors de la suppression du lot : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la suppression du lot : {e}")
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
-    def get_batch_with_pensioners():
-        """Récupère un lot avec tous les pensionnaires qui y sont associés."""
+    def count_delta(deltas, batch_id, status, count, amount):
+        """Cumule dans `deltas` l'effet de `count` pensionnés (négatif pour un retrait) d'un statut donné."""
+        if batch_id is None:
+            return
+        delta = deltas.setdefault(batch_id, dict.fromkeys(list(COUNTER_COLUMNS) + ['total_payments'], 0))
+        delta.setdefault('total_amount', Decimal('0'))
+        delta[status] += count
+        delta['total_payments'] += count
+        delta['total_amount'] += Decimal(str(amount or 0))
+
+    @staticmethod
+    def apply_deltas(db, deltas):
+        """Applique les deltas de compteurs dans la transaction de l'appelant.
+
+        Recalcule ensuite success_rate et le statut du lot : 'completed' ou
+        'partial' dès qu'aucun pensionné n'est plus en attente de traitement,
+        'pending' sinon.
+        """
+        touched = []
+        for batch_id, delta in deltas.items():
+            if not any(delta.values()):
+                continue
+            values = [delta[status] for status in COUNTER_COLUMNS] + [delta['total_payments'], delta['total_amount'], batch_id]
+            statements.execute(db, 'batch.apply_counters', values)
+            touched.append(batch_id)
+
+        if touched:
+            Batch._refresh_derived(db, touched)
+
+    @staticmethod
+    def recount(db, batch_id):
+        """Recalcule en SQL les agrégats d'un lot depuis ses pensionnés, dans la transaction de l'appelant."""
+        counters = ", ".join(f"b.{column} = p.{column}" for column in COUNTER_COLUMNS.values())
+        actual_counts = ", ".join(f"COALESCE(SUM(status = '{status}'), 0) AS {column}" for status, column in COUNTER_COLUMNS.items())
+        cursor = db.cursor()
+        try:
+            cursor.execute(f"""
+                UPDATE batches b
+                JOIN (
+                    SELECT COUNT(*) AS total_payments, COALESCE(SUM(amount), 0) AS total_amount, {actual_counts}
+                    FROM pensioners WHERE batch_id = %s
+                ) p
+                SET b.total_payments = p.total_payments, b.total_amount = p.total_amount, {counters},
+                    b.updated_at = CURRENT_TIMESTAMP
+                WHERE b.id = %s
+            """, (batch_id, batch_id))
+        finally:
+            cursor.close()
+        Batch._refresh_derived(db, [batch_id])
+
+    @staticmethod
+    def _refresh_derived(db, batch_ids):
+        """Recalcule success_rate et status à partir des compteurs des lots donnés."""
+        for batch_id in batch_ids:
+            statements.execute(db, 'batch.refresh_derived', (batch_id,))
+
+    @staticmethod
+    def check_consistency(batch_id=None, repair=False):
+        """Recalcule les agrégats depuis la table pensioners et signale les écarts.
+
+        Retourne la liste des lots en écart : [{"batch_id", "stored", "actual"}].
+        Si `repair` est vrai, les valeurs recalculées sont réécrites.
+        """
         db = Config.get_db_connection()
         if not db:
-            return None
+            raise Exception("Erreur de connexion à la base de données")
+
+        counters = list(COUNTER_COLUMNS.values())
+        actual_counts = ", ".join(f"COALESCE(SUM(status = '{status}'), 0) AS {column}" for status, column in COUNTER_COLUMNS.items())
+        filter_pensioners = "WHERE batch_id = %s" if batch_id is not None else ""
+        filter_batches = "WHERE b.id = %s" if batch_id is not None else ""
+        values = [batch_id, batch_id] if batch_id is not None else []
 
         cursor = db.cursor(dictionary=True)
         try:
-            query = """
-                SELECT p.*, b.* 
-                FROM pensioners p
-                INNER JOIN batches b ON p.batch_id = b.id
+            query = f"""
+                SELECT b.id, b.total_payments, b.total_amount, {", ".join(f"b.{column}" for column in counters)},
+                       COALESCE(p.total_payments, 0) AS actual_total_payments,
+                       COALESCE(p.total_amount, 0) AS actual_total_amount,
+                       {", ".join(f"COALESCE(p.{column}, 0) AS actual_{column}" for column in counters)}
+                FROM batches b
+                LEFT JOIN (
+                    SELECT batch_id, COUNT(*) AS total_payments, SUM(amount) AS total_amount, {actual_counts}
+                    FROM pensioners {filter_pensioners}
+                    GROUP BY batch_id
+                ) p ON p.batch_id = b.id
+                {filter_batches}
             """
-            cursor.execute(query)
-            results = cursor.fetchall()
-            return results if results else []
+            cursor.execute(query, values)
+            drifts = []
+            for row in cursor.fetchall():
+                fields = ['total_payments', 'total_amount'] + counters
+                stored = {field: row[field] for field in fields}
+                actual = {field: row[f"actual_{field}"] for field in fields}
+                if any(Decimal(str(stored[field] or 0)) != Decimal(str(actual[field])) for field in fields):
+                    drifts.append({"batch_id": row['id'], "stored": stored, "actual": actual})
+
+            if repair and drifts:
+                set_clause = ", ".join(f"{field} = %s" for field in ['total_payments', 'total_amount'] + counters)
+                for drift in drifts:
+                    actual = drift['actual']
+                    cursor.execute(
+                        f"UPDATE batches SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                        [actual['total_payments'], actual['total_amount']] + [actual[column] for column in counters] + [drift['batch_id']]
+                    )
+                Batch._refresh_derived(db, [drift['batch_id'] for drift in drifts])
+                db.commit()
+                Batch.invalidate_cache(*(drift['batch_id'] for drift in drifts))
+            return drifts
         except Exception as e:
-            print(f"Erreur lors de la récupération du lot avec les pensionnaires : {e}")
-            return None
+            print(f"Erreur lors de la vérification des agrégats des lots : {e}")
+            db.rollback()
+            raise Exception(f"Erreur lors de la vérification des agrégats des lots : {e}")
         finally:
             cursor.close()
-            db.close()
\ No newline at end of file
+            db.close()
+
+    @staticmethod
+    def get_batch_with_pensioners(batch_id=None, batch_code=None, status=None, fetch_size=1000):
+        """Générateur : produit l'en-tête du lot, puis ses pensionnés un par un.
+
+        Le lot est désigné par `batch_id` ou `batch_code` ; `status` filtre
+        les pensionnés. Les pensionnés sont lus avec un curseur non bufferisé
+        sur une connexion dédiée, par paquets de `fetch_size`, de sorte que la
+        mémoire reste constante quelle que soit la taille du lot.
+        Produit un Batch puis des Pensioner ; rien si le lot n'existe pas.
+        """
+        from models.pensioner_model import Pensioner
+
+        if batch_id is None and batch_code is None:
+            raise Exception("ID ou code du lot requis")
+
+        db = Config.get_db_connection(dedicated=True)
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+
+        streaming = False
+        cursor = None
+        try:
+            if batch_id is not None:
+                result = statements.fetch_one(db, 'batch.get_by_id', (batch_id,))
+            else:
+                result = statements.fetch_one(db, 'batch.get_by_code', (batch_code,))
+            if not result:
+                return
+            batch = Batch(*result)
+            yield batch
+
+            query = """
+                SELECT id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at, updated_at
+                FROM pensioners WHERE batch_id = %s
+            """
+            values = [batch.id]
+            if status is not None:
+                query += " AND status = %s"
+                values.append(status)
+            query += " ORDER BY id"
+
+            # Curseur non bufferisé : les lignes restent côté serveur jusqu'à leur lecture
+            cursor = db.cursor()
+            cursor.execute(query, values)
+            streaming = True
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from (Pensioner(*row) for row in rows)
+            streaming = False
+        finally:
+            if streaming:
+                # Lecture interrompue (client déconnecté) : la connexion a un résultat
+                # non lu et ne peut pas être rendue au pool
+                Config.discard_db_connection(db)
+            else:
+                if cursor is not None:
+                    cursor.close()
+                db.close()
+
+    @staticmethod
+    def iter_transfers(batch_id, fetch_size=1000, after_id=0):
+        """Générateur : virements (table transfer) des pensionnés payés du lot, avec le pensionné correspondant.
+
+        Produit des dicts (colonnes de transfer, plus pensioner_id, first_name,
+        last_name et msisdn du pensionné) par id de pensionné croissant, à
+        partir du pensionné suivant `after_id`, lus comme
+        get_batch_with_pensioners avec un curseur non bufferisé sur une
+        connexion dédiée.
+        """
+        db = Config.get_db_connection(dedicated=True)
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+
+        streaming = False
+        cursor = None
+        try:
+            cursor = db.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT t.transfer_id, t.home_transaction_id, t.payer_name, t.payer_id_type, t.payer_id_value,
+                       t.payee_id_type, t.payee_id_value, t.payee_fsp_id, t.payee_first_name, t.payee_last_name,
+                       t.amount, t.currency, t.note, t.status, t.initiated_at, t.completed_at,
+                       p.id AS pensioner_id, p.first_name, p.last_name, p.msisdn
+                FROM pensioners p
+                JOIN transfer t ON t.home_transaction_id = p.home_transaction_id
+                WHERE p.batch_id = %s AND p.status = 'success' AND p.id > %s
+                ORDER BY p.id
+            """, (batch_id, after_id))
+            streaming = True
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield from rows
+            streaming = False
+        finally:
+            if streaming:
+                Config.discard_db_connection(db)
+            else:
+                if cursor is not None:
+                    cursor.close()
+                db.close()
@@ -0,0 +1,26 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(created_at, id):
+    """Encode la position (created_at, id) du dernier élément d'une page en jeton opaque."""
+    created = created_at.isoformat() if isinstance(created_at, datetime) else created_at
+    payload = json.dumps([created, id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Décode un jeton produit par encode_cursor. Lève ValueError s'il est invalide."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created, id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created), int(id)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Curseur de pagination invalide")
+
+
+def keyset_clause(cursor):
+    """Retourne (condition SQL, paramètres) pour reprendre après `cursor` en ordre décroissant."""
+    created_at, id = decode_cursor(cursor)
+    return "(created_at < %s OR (created_at = %s AND id < %s))", [created_at, created_at, id]
@@ -1,8 +1,57 @@
+import os
+import re
 from config import Config
 from http import HTTPStatus
 from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+from mysql.connector import Error
+from models.pagination import encode_cursor, keyset_clause
+from models.batch_model import Batch
+from models import statements
+from cache import get_cache
+
+# Colonnes réécrites par upsert_many quand une ligne existe déjà (le statut est conservé)
+UPSERT_COLUMNS = ('first_name', 'last_name', 'type_id', 'msisdn', 'amount', 'currency', 'comment', 'home_transaction_id', 'batch_id')
+
+# Transitions autorisées : statut cible -> statuts de départ acceptés
+STATUS_TRANSITIONS = {
+    'pending': ['failed'],
+    'validated': ['pending'],
+    'processing': ['validated'],
+    'success': ['processing'],
+    'failed': ['pending', 'validated', 'processing'],
+}
+
+# Colonnes du fichier chargé par Pensioner.bulk_load (après l'index de ligne) et longueurs maximales en base
+LOAD_COLUMNS = ('unique_id', 'first_name', 'last_name', 'type_id', 'msisdn', 'amount', 'currency', 'comment')
+LOAD_LIMITS = {'unique_id': 20, 'first_name': 100, 'last_name': 100, 'type_id': 20, 'msisdn': 20, 'currency': 10, 'comment': 255}
+# LOAD DATA LOCAL INFILE refusé : commande interdite (MariaDB, ou local_infile=OFF), désactivé côté client ou serveur (MySQL 8)
+_LOCAL_INFILE_ERRORS = (1148, 2068, 3948, 3950)
+_LOAD_ESCAPE = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"}
+_LOAD_UNESCAPE = {escaped: char for char, escaped in _LOAD_ESCAPE.items()}
+_LOAD_SPECIAL = re.compile(r"[\\\t\n\r\0]")
+_LOAD_ESCAPED = re.compile(r"\\[\\tnr0]")
+
+_cache = get_cache('pensioner')
+
+
+class LocalInfileUnavailable(Exception):
+    """LOAD DATA LOCAL INFILE refusé par le client ou le serveur : passer par les INSERT par paquets."""
+
+
+def _load_field(value):
+    """Valeur d'une colonne au format de LOAD DATA : \\N pour NULL, \\, tabulation et fins de ligne échappés."""
+    if value is None:
+        return "\\N"
+    return _LOAD_SPECIAL.sub(lambda match: _LOAD_ESCAPE[match.group(0)], str(value))
+
 
 class Pensioner:
+    FIELDS = ('id', 'unique_id', 'first_name', 'last_name', 'type_id', 'msisdn', 'amount', 'currency', 'comment', 'status',
+              'home_transaction_id', 'batch_id', 'created_at', 'updated_at')
+    __slots__ = FIELDS
+
     def __init__(self, id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at=None, updated_at=None):
         self.id = id
         self.unique_id = unique_id
@@ -19,6 +68,10 @@ class Pensioner:
         self.created_at = created_at
         self.updated_at = updated_at
 
+    def to_dict(self):
+        """Retourne le pensionné sous forme de dict (colonnes de FIELDS)."""
+        return {field: getattr(self, field) for field in Pensioner.FIELDS}
+
     @staticmethod
     def create(unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment=None, status='pending', home_transaction_id=None, batch_id=None):
         """Crée un nouveau pensionné dans la table pensioners."""
@@ -26,23 +79,369 @@ class Pensioner:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
             if status not in ['pending', 'validated', 'processing', 'success', 'failed']:
                 raise Exception("Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'")
 
-            query = """
-                INSERT INTO pensioners (unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
             values = (unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id)
-            cursor.execute(query, values)
+            pensioner_id = statements.insert(db, 'pensioner.insert', values)
+
+            deltas = {}
+            Batch.count_delta(deltas, batch_id, status, 1, amount)
+            Batch.apply_deltas(db, deltas)
             db.commit()
-            return cursor.lastrowid
+            Batch.invalidate_cache(*deltas)
+            return pensioner_id
         except Exception as e:
             print(f"Erreur lors de la création du pensionné : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la création du pensionné : {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _validate_row(row):
+        """Retourne un message d'erreur si la ligne ne peut pas être insérée, sinon None."""
+        for field in ('unique_id', 'type_id', 'msisdn', 'amount'):
+            if row.get(field) in (None, ''):
+                return f"Champ obligatoire manquant : {field}"
+        try:
+            if not Decimal(str(row['amount'])).is_finite():
+                return "Montant invalide"
+        except ArithmeticError:
+            return "Montant invalide"
+        if row.get('status', 'pending') not in ['pending', 'validated', 'processing', 'success', 'failed']:
+            return "Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'"
+        return None
+
+    @staticmethod
+    def _prepare_chunk(chunk, start_index, batch_id, seen, failed):
+        """Valide un paquet de lignes et retourne [(index, tuple de valeurs INSERT)].
+
+        Les lignes invalides ou dont l'unique_id figure déjà dans `seen` sont
+        ajoutées à `failed`.
+        """
+        prepared = []
+        for index, row in enumerate(chunk, start_index):
+            error = Pensioner._validate_row(row)
+            unique_id = row.get('unique_id')
+            if not error and unique_id in seen:
+                error = "unique_id en double dans le fichier"
+            if error:
+                failed.append({"index": index, "unique_id": unique_id, "error": error})
+                continue
+            seen.add(unique_id)
+            prepared.append((index, (
+                unique_id, row.get('first_name'), row.get('last_name'), row.get('type_id'),
+                row.get('msisdn'), row.get('amount'), row.get('currency', 'XOF'), row.get('comment'),
+                row.get('status', 'pending'), row.get('home_transaction_id'), row.get('batch_id', batch_id)
+            )))
+        return prepared
+
+    @staticmethod
+    def create_many(rows, batch_id=None, chunk_size=1000, resume=False):
+        """Insère des pensionnés en masse, une transaction par paquet de `chunk_size` lignes.
+
+        `rows` est un itérable de dicts (mêmes clés que create). Une ligne en
+        erreur (champ manquant, unique_id en double dans le fichier ou déjà en
+        base) est signalée dans `failed` sans interrompre le chargement.
+        Avec `resume` (paquet rejoué après un arrêt), une ligne dont l'unique_id
+        est déjà dans le lot `batch_id` est sautée et comptée dans `skipped` ;
+        déjà dans un autre lot, elle reste en erreur et n'est pas déplacée.
+        Retourne {"inserted": int, "failed": [{"index", "unique_id", "error"}]}
+        (plus "skipped" avec `resume`).
+        """
+        db = Config.get_db_connection()
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+
+        # executemany réécrit l'INSERT en multi-lignes : requête texte, non préparée
+        query = statements.STATEMENTS['pensioner.insert']
+        inserted = skipped = 0
+        failed = []
+        seen = set()
+        rows = iter(rows)
+        index = 0
+
+        cursor = db.cursor()
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+
+                pending = Pensioner._prepare_chunk(chunk, index, batch_id, seen, failed)
+                index += len(chunk)
+
+                if not pending:
+                    continue
+
+                # Écarter d'un coup les unique_id déjà présents en base
+                placeholders = ", ".join(["%s"] * len(pending))
+                cursor.execute(f"SELECT unique_id, batch_id FROM pensioners WHERE unique_id IN ({placeholders})",
+                               [values[0] for _, values in pending])
+                existing = dict(cursor.fetchall())
+                if existing:
+                    for row_index, values in pending:
+                        if values[0] not in existing:
+                            continue
+                        if resume and batch_id is not None and existing[values[0]] == batch_id:
+                            skipped += 1
+                        else:
+                            failed.append({"index": row_index, "unique_id": values[0], "error": "unique_id déjà existant"})
+                    pending = [item for item in pending if item[1][0] not in existing]
+                    if not pending:
+                        continue
+
+                try:
+                    cursor.executemany(query, [values for _, values in pending])
+                    written = [values for _, values in pending]
+                except Error:
+                    # Repli ligne par ligne pour isoler les lignes fautives du paquet
+                    db.rollback()
+                    written = []
+                    for row_index, values in pending:
+                        try:
+                            cursor.execute(query, values)
+                            written.append(values)
+                        except Error as e:
+                            failed.append({"index": row_index, "unique_id": values[0], "error": str(e)})
+
+                # Agrégats des lots mis à jour dans la même transaction que le paquet
+                deltas = {}
+                for values in written:
+                    Batch.count_delta(deltas, values[10], values[8], 1, values[5])
+                Batch.apply_deltas(db, deltas)
+                db.commit()
+                Batch.invalidate_cache(*deltas)
+                inserted += len(written)
+
+            result = {"inserted": inserted, "failed": failed}
+            if resume:
+                result["skipped"] = skipped
+            return result
+        except Exception as e:
+            print(f"Erreur lors de l'insertion en masse des pensionnés : {e}")
+            db.rollback()
+            raise Exception(f"Erreur lors de l'insertion en masse des pensionnés : {e}")
+        finally:
+            cursor.close()
+            db.close()
+
+    @staticmethod
+    def write_load_file(rows, f):
+        """Écrit dans `f` (texte, newline='') les lignes valides de `rows` au format de LOAD DATA, une par ligne.
+
+        Mêmes contrôles que create_many, plus la longueur des colonnes (une
+        seule valeur trop longue ferait échouer tout le chargement). Chaque
+        ligne commence par son index dans `rows`. Retourne (lignes écrites, échecs).
+        """
+        written = 0
+        failed = []
+        seen = set()
+        rows = iter(rows)
+        index = 0
+        while True:
+            chunk = list(islice(rows, 10000))
+            if not chunk:
+                break
+            prepared = Pensioner._prepare_chunk(chunk, index, None, seen, failed)
+            index += len(chunk)
+            lines = []
+            for row_index, values in prepared:
+                fields = dict(zip(LOAD_COLUMNS, values))
+                error = next((f"Valeur trop longue : {column}" for column, limit in LOAD_LIMITS.items()
+                              if fields[column] is not None and len(str(fields[column])) > limit), None)
+                if error is None and abs(Decimal(str(fields['amount']))) >= 10 ** 10:
+                    error = "Montant invalide"
+                if error:
+                    failed.append({"index": row_index, "unique_id": fields['unique_id'], "error": error})
+                    continue
+                lines.append("\t".join([str(row_index)] + [_load_field(fields[column]) for column in LOAD_COLUMNS]) + "\n")
+            f.write("".join(lines))
+            written += len(lines)
+        return written, failed
+
+    @staticmethod
+    def read_load_file(f):
+        """Relit un fichier écrit par write_load_file : produit (index, dict de ligne)."""
+        for line in f:
+            values = [None if value == "\\N" else _LOAD_ESCAPED.sub(lambda m: _LOAD_UNESCAPE[m.group(0)], value)
+                      for value in line.rstrip("\n").split("\t")]
+            yield int(values[0]), dict(zip(LOAD_COLUMNS, values[1:]))
+
+    @staticmethod
+    def bulk_load(path, batch_code, initiated_by='admin'):
+        """Crée le lot `batch_code` et y charge le fichier `path` (write_load_file) par LOAD DATA LOCAL INFILE.
+
+        Le fichier est chargé dans une table temporaire, puis fusionné dans
+        pensioners et batches en une seule transaction : les agrégats du lot
+        sont calculés en SQL, et rien n'est écrit en cas d'erreur. Les
+        unique_id déjà en base sont écartés et signalés dans `failed`.
+        Lève LocalInfileUnavailable si le client ou le serveur refuse LOCAL
+        INFILE (Config.DB_LOCAL_INFILE, variable serveur local_infile).
+        Retourne {"batch_id", "inserted", "failed"}.
+        """
+        if not Config.DB_LOCAL_INFILE:
+            raise LocalInfileUnavailable("désactivé (DB_LOCAL_INFILE=0)")
+        try:
+            # Connexion propre au chargement : LOCAL INFILE n'est pas autorisé sur celles du pool
+            db = Config.connect(allow_local_infile=True)
+        except Error as e:
+            print(f"Erreur de connexion MySQL : {e}")
+            raise Exception("Erreur de connexion à la base de données")
+
+        columns = ", ".join(LOAD_COLUMNS)
+        cursor = db.cursor()
+        try:
+            cursor.execute("""
+                CREATE TEMPORARY TABLE pensioners_load (
+                    line INT UNSIGNED NOT NULL PRIMARY KEY,
+                    unique_id VARCHAR(20) NOT NULL, first_name VARCHAR(100), last_name VARCHAR(100),
+                    type_id VARCHAR(20) NOT NULL, msisdn VARCHAR(20) NOT NULL, amount DECIMAL(12,2) NOT NULL,
+                    currency VARCHAR(10), comment VARCHAR(255), KEY (unique_id)
+                ) DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+            """)
+            try:
+                cursor.execute(f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE pensioners_load CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'
+                    (line, {columns})
+                """, (os.path.abspath(path),))
+            except Error as e:
+                if e.errno in _LOCAL_INFILE_ERRORS:
+                    raise LocalInfileUnavailable(str(e))
+                raise
+
+            batch_id = statements.insert(db, 'batch.insert', (batch_code, 0, 0, 0.00, 'pending', initiated_by))
+            cursor.execute("""
+                SELECT l.line, l.unique_id FROM pensioners_load l
+                JOIN pensioners p ON p.unique_id = l.unique_id
+                ORDER BY l.line
+            """)
+            failed = [{"index": line, "unique_id": unique_id, "error": "unique_id déjà existant"}
+                      for line, unique_id in cursor.fetchall()]
+            cursor.execute(f"""
+                INSERT INTO pensioners ({columns}, status, batch_id)
+                SELECT {", ".join(f"l.{column}" for column in LOAD_COLUMNS)}, 'pending', %s
+                FROM pensioners_load l
+                LEFT JOIN pensioners p ON p.unique_id = l.unique_id
+                WHERE p.id IS NULL
+                ORDER BY l.line
+            """, (batch_id,))
+            inserted = cursor.rowcount
+            Batch.recount(db, batch_id)
+            db.commit()
+            Batch.invalidate_cache(batch_id)
+            _cache.invalidate(f"batch:{batch_id}")
+            return {"batch_id": batch_id, "inserted": inserted, "failed": failed}
+        except LocalInfileUnavailable:
+            db.rollback()
+            raise
+        except Exception as e:
+            print(f"Erreur lors du chargement en masse des pensionnés : {e}")
+            db.rollback()
+            raise Exception(f"Erreur lors du chargement en masse des pensionnés : {e}")
+        finally:
+            cursor.close()
+            db.close()
+
+    @staticmethod
+    def _normalize(values):
+        """Forme comparable d'un tuple (colonnes de UPSERT_COLUMNS, dans l'ordre)."""
+        normalized = []
+        for column, value in zip(UPSERT_COLUMNS, values):
+            if column == 'amount':
+                normalized.append(Decimal(str(value)).quantize(Decimal('0.01')))
+            elif column == 'batch_id':
+                normalized.append(int(value) if value not in (None, '') else None)
+            else:
+                normalized.append('' if value is None else str(value))
+        return tuple(normalized)
+
+    @staticmethod
+    def upsert_many(rows, batch_id=None, chunk_size=1000):
+        """Insère ou met à jour des pensionnés d'après leur unique_id (réimport d'un fichier corrigé).
+
+        Pour chaque paquet, les lignes existantes sont lues en une requête et
+        comparées à celles du fichier : seules les lignes nouvelles ou
+        modifiées sont écrites, via un INSERT ... ON DUPLICATE KEY UPDATE
+        multi-lignes. Le statut d'un pensionné existant n'est pas modifié.
+        Retourne {"inserted", "updated", "unchanged", "failed"}.
+        """
+        db = Config.get_db_connection()
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+
+        columns = ", ".join(UPSERT_COLUMNS)
+        query = (
+            statements.STATEMENTS['pensioner.insert'] +
+            " ON DUPLICATE KEY UPDATE " + ", ".join(f"{column} = VALUES({column})" for column in UPSERT_COLUMNS)
+            + ", updated_at = CURRENT_TIMESTAMP"
+        )
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        failed = []
+        seen = set()
+        rows = iter(rows)
+        index = 0
+
+        cursor = db.cursor()
+        try:
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+
+                pending = Pensioner._prepare_chunk(chunk, index, batch_id, seen, failed)
+                index += len(chunk)
+                if not pending:
+                    continue
+
+                placeholders = ", ".join(["%s"] * len(pending))
+                cursor.execute(
+                    f"SELECT id, unique_id, status, {columns} FROM pensioners WHERE unique_id IN ({placeholders}) FOR UPDATE",
+                    [values[0] for _, values in pending]
+                )
+                existing = {found[1]: found for found in cursor.fetchall()}
+
+                writes = []
+                deltas = {}
+                updated_ids = []
+                for _, values in pending:
+                    current = existing.get(values[0])
+                    new_columns = values[1:8] + values[9:11]
+                    if current is None:
+                        writes.append(values)
+                        counts["inserted"] += 1
+                        Batch.count_delta(deltas, values[10], values[8], 1, values[5])
+                        continue
+
+                    current_id, _, current_status = current[:3]
+                    old_columns = current[3:]
+                    if Pensioner._normalize(old_columns) == Pensioner._normalize(new_columns):
+                        counts["unchanged"] += 1
+                        continue
+
+                    writes.append(values)
+                    counts["updated"] += 1
+                    updated_ids.append(current_id)
+                    old = dict(zip(UPSERT_COLUMNS, old_columns))
+                    Batch.count_delta(deltas, old['batch_id'], current_status, -1, -old['amount'])
+                    Batch.count_delta(deltas, values[10], current_status, 1, values[5])
+
+                if writes:
+                    cursor.executemany(query, writes)
+                    Batch.apply_deltas(db, deltas)
+                db.commit()
+                Pensioner.invalidate_cache(*updated_ids)
+                Batch.invalidate_cache(*deltas)
+
+            counts["failed"] = failed
+            return counts
+        except Exception as e:
+            print(f"Erreur lors de l'import (upsert) des pensionnés : {e}")
+            db.rollback()
+            raise Exception(f"Erreur lors de l'import (upsert) des pensionnés : {e}")
         finally:
             cursor.close()
             db.close()
@@ -54,7 +453,6 @@ class Pensioner:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
             updates = {}
             if unique_id is not None:
@@ -83,12 +481,26 @@ class Pensioner:
                 updates['batch_id'] = batch_id
 
             if updates:
-                set_clause = ", ".join(f"{key} = %s" for key in updates.keys())
-                query = f"UPDATE pensioners SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
-                values = list(updates.values()) + [id]
-                cursor.execute(query, values)
+                # Ancienne ligne verrouillée si le changement touche les agrégats du lot
+                previous = None
+                if {'status', 'amount', 'batch_id'} & updates.keys():
+                    previous = Pensioner._lock_counted(db, id)
+
+                # Forme fixe : les colonnes absentes de `updates` sont passées à NULL et restent inchangées
+                values = [updates.get(column) for column in statements.PENSIONER_UPDATE_COLUMNS] + [id]
+                updated = statements.execute(db, 'pensioner.update', values) > 0
+
+                deltas = {}
+                if previous:
+                    old_batch_id, old_status, old_amount = previous
+                    Batch.count_delta(deltas, old_batch_id, old_status, -1, -old_amount)
+                    Batch.count_delta(deltas, updates.get('batch_id', old_batch_id), updates.get('status', old_status),
+                                      1, updates.get('amount', old_amount))
+                    Batch.apply_deltas(db, deltas)
                 db.commit()
-                return cursor.rowcount > 0
+                Pensioner.invalidate_cache(id)
+                Batch.invalidate_cache(*deltas)
+                return updated
             else:
                 return False
         except Exception as e:
@@ -96,52 +508,86 @@ class Pensioner:
             db.rollback()
             raise Exception(f"Erreur lors de la mise à jour du pensionné : {e}")
         finally:
-            cursor.close()
             db.close()
 
+    @staticmethod
+    def _cache_keys(pensioner):
+        return (f"id:{pensioner.id}", f"uid:{pensioner.unique_id}")
+
+    @staticmethod
+    def _cache_tags(pensioner):
+        return (f"batch:{pensioner.batch_id}",)
+
+    @staticmethod
+    def invalidate_cache(*ids):
+        """Retire du cache les pensionnés donnés (dans tous les workers)."""
+        _cache.invalidate(*(f"id:{id}" for id in ids))
+
     @staticmethod
     def get_by_id(id):
-        """Récupère un pensionné par son ID."""
+        """Récupère un pensionné par son ID (lecture traversante du cache)."""
+        return _cache.fetch(f"id:{id}", lambda: Pensioner._load_by_id(id), Pensioner._cache_keys, Pensioner._cache_tags)
+
+    @staticmethod
+    def _load_by_id(id):
+        """Récupère un pensionné par son ID depuis la base."""
         db = Config.get_db_connection()
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
         try:
-            query = """
-                SELECT id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at, updated_at
-                FROM pensioners WHERE id = %s
-            """
-            cursor.execute(query, (id,))
-            result = cursor.fetchone()
+            result = statements.fetch_one(db, 'pensioner.get_by_id', (id,))
             if result:
-                return Pensioner(**result)
+                return Pensioner(*result)
             return None
         except Exception as e:
             print(f"Erreur lors de la récupération du pensionné : {e}")
             return None
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
-    def get_all(limit=50, offset=0):
-        """Récupère tous les pensionnés, triés par date de création descendante."""
+    def get_all(limit=50, after=None, status=None, batch_id=None):
+        """Récupère une page de pensionnés, triés par date de création descendante.
+
+        La pagination se fait par curseur sur (created_at, id) : passer dans `after` le
+        `next_cursor` de la page précédente pour obtenir la suivante.
+        Retourne (liste de pensionnés, next_cursor ou None).
+        """
+        conditions = []
+        values = []
+        if status is not None:
+            conditions.append("status = %s")
+            values.append(status)
+        if batch_id is not None:
+            conditions.append("batch_id = %s")
+            values.append(batch_id)
+        if after:
+            clause, cursor_values = keyset_clause(after)
+            conditions.append(clause)
+            values.extend(cursor_values)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
         db = Config.get_db_connection()
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
+        cursor = db.cursor()
         try:
-            query = """
+            query = f"""
                 SELECT id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at, updated_at
                 FROM pensioners
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s
             """
-            cursor.execute(query, (limit, offset))
-            results = cursor.fetchall()
-            return [Pensioner(**result) for result in results] if results else []
+            cursor.execute(query, values + [limit + 1])
+            pensioners = [Pensioner(*result) for result in cursor.fetchall()]
+            next_cursor = None
+            if len(pensioners) > limit:
+                del pensioners[limit:]
+                next_cursor = encode_cursor(pensioners[-1].created_at, pensioners[-1].id)
+            return pensioners, next_cursor
         except Exception as e:
             print(f"Erreur lors de la récupération des pensionnés : {e}")
             return None
@@ -151,27 +597,25 @@ class Pensioner:
 
     @staticmethod
     def get_by_unique_id(unique_id):
-        """Récupère un pensionné par son unique_id."""
+        """Récupère un pensionné par son unique_id (lecture traversante du cache)."""
+        return _cache.fetch(f"uid:{unique_id}", lambda: Pensioner._load_by_unique_id(unique_id), Pensioner._cache_keys, Pensioner._cache_tags)
+
+    @staticmethod
+    def _load_by_unique_id(unique_id):
+        """Récupère un pensionné par son unique_id depuis la base."""
         db = Config.get_db_connection()
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
         try:
-            query = """
-                SELECT id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at, updated_at
-                FROM pensioners WHERE unique_id = %s
-            """
-            cursor.execute(query, (unique_id,))
-            result = cursor.fetchone()
+            result = statements.fetch_one(db, 'pensioner.get_by_unique_id', (unique_id,))
             if result:
-                return Pensioner(**result)
+                return Pensioner(*result)
             return None
         except Exception as e:
             print(f"Erreur lors de la récupération du pensionné par unique_id : {e}")
             return None
         finally:
-            cursor.close()
             db.close()
 
     @staticmethod
@@ -181,7 +625,7 @@ class Pensioner:
         if not db:
             return None
 
-        cursor = db.cursor(dictionary=True)
+        cursor = db.cursor()
         try:
             query = """
                 SELECT id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id, created_at, updated_at
@@ -190,7 +634,7 @@ class Pensioner:
             """
             cursor.execute(query, (batch_id,))
             results = cursor.fetchall()
-            return [Pensioner(**result) for result in results] if results else []
+            return [Pensioner(*result) for result in results] if results else []
         except Exception as e:
             print(f"Erreur lors de la récupération des pensionnés par batch_id : {e}")
             return None
@@ -205,19 +649,153 @@ class Pensioner:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
             if status not in ['pending', 'validated', 'processing', 'success', 'failed']:
                 raise Exception("Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'")
 
-            query = "UPDATE pensioners SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
-            cursor.execute(query, (status, id))
+            previous = Pensioner._lock_counted(db, id)
+            updated = statements.execute(db, 'pensioner.update_status', (status, id)) > 0
+
+            deltas = {}
+            if previous:
+                old_batch_id, old_status, old_amount = previous
+                Batch.count_delta(deltas, old_batch_id, old_status, -1, -old_amount)
+                Batch.count_delta(deltas, old_batch_id, status, 1, old_amount)
+                Batch.apply_deltas(db, deltas)
             db.commit()
-            return cursor.rowcount > 0
+            Pensioner.invalidate_cache(id)
+            Batch.invalidate_cache(*deltas)
+            return updated
         except Exception as e:
             print(f"Erreur lors de la mise à jour du statut du pensionné : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la mise à jour du statut du pensionné : {e}")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _lock_counted(db, id):
+        """Verrouille un pensionné et retourne (batch_id, status, amount), ou None s'il n'existe pas."""
+        return statements.fetch_one(db, 'pensioner.lock_counted', (id,))
+
+    @staticmethod
+    def _check_transition(status):
+        """Retourne les statuts de départ autorisés vers `status`, ou lève une exception."""
+        if status not in STATUS_TRANSITIONS:
+            raise Exception("Statut invalide. Doit être 'pending', 'validated', 'processing', 'success' ou 'failed'")
+        return STATUS_TRANSITIONS[status]
+
+    @staticmethod
+    def _transition_ids(cursor, ids, status, chunk_size, deltas):
+        """Applique la transition à une liste d'ids, un UPDATE par paquet. Retourne le nombre de lignes modifiées.
+
+        Les effets sur les compteurs des lots sont cumulés dans `deltas`.
+        """
+        from_statuses = Pensioner._check_transition(status)
+        from_placeholders = ", ".join(["%s"] * len(from_statuses))
+        updated = 0
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            id_placeholders = ", ".join(["%s"] * len(chunk))
+            cursor.execute(f"""
+                SELECT batch_id, status, COUNT(*), SUM(amount) FROM pensioners
+                WHERE id IN ({id_placeholders}) AND status IN ({from_placeholders})
+                GROUP BY batch_id, status
+                FOR UPDATE
+            """, list(chunk) + from_statuses)
+            for batch_id, old_status, count, amount in cursor.fetchall():
+                Batch.count_delta(deltas, batch_id, old_status, -count, -amount)
+                Batch.count_delta(deltas, batch_id, status, count, amount)
+
+            query = f"""
+                UPDATE pensioners SET status = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({id_placeholders}) AND status IN ({from_placeholders})
+            """
+            cursor.execute(query, [status] + list(chunk) + from_statuses)
+            updated += cursor.rowcount
+        return updated
+
+    @staticmethod
+    def update_status_many(ids, status, chunk_size=5000):
+        """Fait passer une liste de pensionnés au statut `status` (transitions contrôlées en SQL).
+
+        Les ids inexistants ou dont le statut actuel n'autorise pas la
+        transition sont comptés dans `unchanged`.
+        Retourne {status: nb_modifiés, "unchanged": nb_ignorés}.
+        """
+        return Pensioner.update_status_map({id: status for id in ids}, chunk_size)
+
+    @staticmethod
+    def update_status_map(statuses, chunk_size=5000):
+        """Applique un dict {id: nouveau_statut} en un UPDATE par statut cible et par paquet.
+
+        Tout est fait dans une seule transaction.
+        Retourne {statut: nb_modifiés, ..., "unchanged": nb_ignorés}.
+        """
+        by_status = {}
+        for id, status in statuses.items():
+            Pensioner._check_transition(status)
+            by_status.setdefault(status, []).append(id)
+
+        db = Config.get_db_connection()
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+
+        cursor = db.cursor()
+        try:
+            counts = {}
+            deltas = {}
+            for status, ids in by_status.items():
+                counts[status] = Pensioner._transition_ids(cursor, ids, status, chunk_size, deltas)
+            Batch.apply_deltas(db, deltas)
+            db.commit()
+            Pensioner.invalidate_cache(*statuses)
+            Batch.invalidate_cache(*deltas)
+            counts["unchanged"] = len(statuses) - sum(counts.values())
+            return counts
+        except Exception as e:
+            print(f"Erreur lors de la mise à jour groupée des statuts : {e}")
+            db.rollback()
+            raise Exception(f"Erreur lors de la mise à jour groupée des statuts : {e}")
+        finally:
+            cursor.close()
+            db.close()
+
+    @staticmethod
+    def update_status_by_batch(batch_id, current_status, status):
+        """Fait passer au statut `status` tous les pensionnés d'un lot actuellement en `current_status`.
+
+        Une seule instruction UPDATE, quel que soit le nombre de pensionnés.
+        Retourne {status: nb_modifiés}.
+        """
+        if current_status not in Pensioner._check_transition(status):
+            raise Exception(f"Transition interdite : '{current_status}' -> '{status}'")
+
+        db = Config.get_db_connection()
+        if not db:
+            raise Exception("Erreur de connexion à la base de données")
+
+        cursor = db.cursor()
+        try:
+            query = """
+                UPDATE pensioners SET status = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE batch_id = %s AND status = %s
+            """
+            cursor.execute(query, (status, batch_id, current_status))
+            updated = cursor.rowcount
+
+            deltas = {}
+            Batch.count_delta(deltas, batch_id, current_status, -updated, 0)
+            Batch.count_delta(deltas, batch_id, status, updated, 0)
+            Batch.apply_deltas(db, deltas)
+            db.commit()
+            _cache.invalidate(f"batch:{batch_id}")
+            Batch.invalidate_cache(batch_id)
+            return {status: updated}
+        except Exception as e:
+            print(f"Erreur lors de la mise à jour des statuts du lot : {e}")
+            db.rollback()
+            raise Exception(f"Erreur lors de la mise à jour des statuts du lot : {e}")
         finally:
             cursor.close()
             db.close()
@@ -229,18 +807,24 @@ class Pensioner:
         if not db:
             raise Exception("Erreur de connexion à la base de données")
 
-        cursor = db.cursor()
         try:
-            query = "DELETE FROM pensioners WHERE id = %s"
-            cursor.execute(query, (id,))
-            if cursor.rowcount == 0:
+            previous = Pensioner._lock_counted(db, id)
+
+            if statements.execute(db, 'pensioner.delete', (id,)) == 0:
                 raise Exception("Pensionné non trouvé")
+
+            deltas = {}
+            if previous:
+                old_batch_id, old_status, old_amount = previous
+                Batch.count_delta(deltas, old_batch_id, old_status, -1, -old_amount)
+                Batch.apply_deltas(db, deltas)
             db.commit()
+            Pensioner.invalidate_cache(id)
+            Batch.invalidate_cache(*deltas)
             return True
         except Exception as e:
             print(f"Erreur lors de la suppression du pensionné : {e}")
             db.rollback()
             raise Exception(f"Erreur lors de la suppression du pensionné : {e}")
         finally:
-            cursor.close()
             db.close()
\ No newline at end of file
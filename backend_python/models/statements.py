@@ -0,0 +1,113 @@
+# models/statements.py
+"""
+Registre des requêtes nommées des modèles (pensionnés, lots, transferts).
+
+Les requêtes sont exécutées en requêtes préparées côté serveur : chacune est
+préparée une seule fois par connexion physique du pool, puis seuls les
+paramètres sont envoyés à chaque appel. Les mises à jour partielles utilisent
+une forme fixe (`colonne = COALESCE(%s, colonne)`) au lieu d'une clause SET
+construite à chaque appel.
+
+Hors pool (DB_POOL_SIZE=0) ou si DB_PREPARED_STATEMENTS=0, la même requête
+est exécutée avec un curseur classique.
+"""
+from config import Config
+from db_pool import PooledConnection
+
+PENSIONER_COLUMNS = ("id, unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, "
+                     "home_transaction_id, batch_id, created_at, updated_at")
+BATCH_COLUMNS = ("id, batch_code, total_amount, total_payments, success_rate, status, initiated_by, created_at, updated_at, "
+                 "pending_count, validated_count, processing_count, success_count, failed_count")
+TRANSFER_COLUMNS = ("transfer_id, home_transaction_id, payer_name, payee_first_name, payee_last_name, payee_id_type, "
+                    "payee_id_value, payee_fsp_id, amount, currency, note, status, initiated_at")
+
+# Colonnes modifiables par Pensioner.update / Batch.update, dans l'ordre des paramètres
+PENSIONER_UPDATE_COLUMNS = ('unique_id', 'first_name', 'last_name', 'type_id', 'msisdn', 'amount', 'currency', 'comment',
+                            'status', 'home_transaction_id', 'batch_id')
+BATCH_UPDATE_COLUMNS = ('batch_code', 'total_amount', 'total_payments', 'success_rate', 'status', 'initiated_by')
+
+
+def _update_shape(table, columns):
+    """UPDATE de forme fixe : un paramètre NULL laisse la colonne inchangée."""
+    set_clause = ", ".join(f"{column} = COALESCE(%s, {column})" for column in columns)
+    return f"UPDATE {table} SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE id = %s"
+
+
+STATEMENTS = {
+    'pensioner.get_by_id': f"SELECT {PENSIONER_COLUMNS} FROM pensioners WHERE id = %s",
+    'pensioner.get_by_unique_id': f"SELECT {PENSIONER_COLUMNS} FROM pensioners WHERE unique_id = %s",
+    'pensioner.insert': (
+        "INSERT INTO pensioners (unique_id, first_name, last_name, type_id, msisdn, amount, currency, comment, status, home_transaction_id, batch_id) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+    ),
+    'pensioner.update': _update_shape('pensioners', PENSIONER_UPDATE_COLUMNS),
+    'pensioner.update_status': "UPDATE pensioners SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+    'pensioner.lock_counted': "SELECT batch_id, status, amount FROM pensioners WHERE id = %s FOR UPDATE",
+    'pensioner.delete': "DELETE FROM pensioners WHERE id = %s",
+
+    'batch.get_by_id': f"SELECT {BATCH_COLUMNS} FROM batches WHERE id = %s",
+    'batch.get_by_code': f"SELECT {BATCH_COLUMNS} FROM batches WHERE batch_code = %s",
+    'batch.insert': (
+        "INSERT INTO batches (batch_code, total_amount, total_payments, success_rate, status, initiated_by) "
+        "VALUES (%s, %s, %s, %s, %s, %s)"
+    ),
+    'batch.update': _update_shape('batches', BATCH_UPDATE_COLUMNS),
+    'batch.update_status': "UPDATE batches SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+    'batch.update_success_rate': "UPDATE batches SET success_rate = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+    'batch.delete': "DELETE FROM batches WHERE id = %s",
+    'batch.apply_counters': """
+        UPDATE batches SET pending_count = pending_count + %s, validated_count = validated_count + %s,
+            processing_count = processing_count + %s, success_count = success_count + %s, failed_count = failed_count + %s,
+            total_payments = total_payments + %s,
+            total_amount = total_amount + %s,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    """,
+    'batch.refresh_derived': """
+        UPDATE batches SET
+            success_rate = IF(total_payments > 0, ROUND(success_count * 100 / total_payments, 2), 0),
+            status = CASE
+                WHEN total_payments = 0 OR pending_count + validated_count + processing_count > 0 THEN 'pending'
+                WHEN failed_count = 0 THEN 'completed'
+                ELSE 'partial'
+            END
+        WHERE id = %s
+    """,
+
+    'transfer.get_by_transfer_id': f"SELECT {TRANSFER_COLUMNS} FROM transfer WHERE transfer_id = %s",
+    'transfer.get_by_home_transaction_id': f"SELECT {TRANSFER_COLUMNS} FROM transfer WHERE home_transaction_id = %s",
+}
+
+
+def _run(db, name, params, read):
+    sql = STATEMENTS[name]
+    prepared = Config.DB_PREPARED_STATEMENTS and isinstance(db, PooledConnection)
+    cursor = db.prepared_cursor(name) if prepared else db.cursor()
+    try:
+        # Le texte SQL est toujours le même objet : le curseur préparé ne le ré-analyse pas
+        cursor.execute(sql, params)
+        return read(cursor)
+    finally:
+        if not prepared:
+            cursor.close()
+
+
+def fetch_one(db, name, params=()):
+    """Exécute la requête `name` et retourne la première ligne, ou None."""
+    rows = _run(db, name, params, lambda cursor: cursor.fetchall())
+    return rows[0] if rows else None
+
+
+def fetch_all(db, name, params=()):
+    """Exécute la requête `name` et retourne toutes les lignes."""
+    return _run(db, name, params, lambda cursor: cursor.fetchall())
+
+
+def execute(db, name, params=()):
+    """Exécute l'instruction `name` et retourne le nombre de lignes touchées."""
+    return _run(db, name, params, lambda cursor: cursor.rowcount)
+
+
+def insert(db, name, params=()):
+    """Exécute l'INSERT `name` et retourne l'id généré."""
+    return _run(db, name, params, lambda cursor: cursor.lastrowid)
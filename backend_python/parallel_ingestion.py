@@ -0,0 +1,269 @@
+# parallel_ingestion.py
+"""
+Traitement d'un gros fichier CSV sur plusieurs cœurs.
+
+Le fichier, sur disque, est découpé en plages d'octets d'environ
+Config.PARALLEL_CHUNK_BYTES, coupées sur des fins de ligne. Chaque plage est
+analysée, validée et écrite en JSONL par un processus d'un ProcessPoolExecutor
+(Config.PARALLEL_WORKERS). Le processus principal fusionne les plages dans
+l'ordre du fichier : il détecte les doublons d'unique_id d'une plage à l'autre
+(avec les empreintes rendues par chaque plage, validation.DuplicateIndex) et
+ne réécrit que les lignes concernées en concaténant les morceaux. Les clés de
+paiement sont aussi calculées par les processus ; leur recherche dans l'index
+des bénéficiaires (beneficiary_index.PaymentCheck) est faite au moment de la fusion.
+
+Une coupure n'est faite qu'après un nombre pair de guillemets : une valeur
+entre guillemets contenant un saut de ligne n'est jamais séparée. Les
+fichiers UTF-16 (sauts de ligne sur deux octets) sont lus séquentiellement.
+"""
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from beneficiary_index import payment_keys
+from config import Config
+from ingestion import READ_CHUNK_SIZE, SNIFF_SIZE, build_participants, detect_csv_format, iter_participants, \
+    read_csv_options
+from validation import DUPLICATE_UNIQUE_ID, ERROR_CODES, CsvValidator, DuplicateIndex, decode
+
+_DUPLICATE_BIT = 1 << ERROR_CODES.index(DUPLICATE_UNIQUE_ID)
+
+
+def can_split(csv_format):
+    """Vrai si le fichier peut être coupé sur les octets de fin de ligne."""
+    return not csv_format["encoding"].startswith("utf-16")
+
+
+def _next_boundary(f, quote, quotes):
+    """Avance `f` jusqu'à la première fin de ligne hors guillemets ; `quotes` = guillemets déjà vus depuis le début de la plage.
+
+    Retourne la position atteinte (fin de fichier comprise).
+    """
+    while True:
+        line = f.readline()
+        if not line:
+            return f.tell()
+        quotes += line.count(quote)
+        if quotes % 2 == 0:
+            return f.tell()
+
+
+def split_ranges(path, csv_format, chunk_bytes):
+    """Découpe `path` en (en-tête, [(début, fin), ...]) : plages d'environ `chunk_bytes` octets."""
+    quote = csv_format["quotechar"].encode("latin-1")
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        # En-tête : première ligne non vide (pandas ignore les lignes vides qui la précèdent)
+        header_end = 0
+        while header_end < size:
+            line_start = header_end
+            header_end = _next_boundary(f, quote, 0)
+            f.seek(line_start)
+            if f.read(header_end - line_start).strip():
+                break
+        f.seek(0)
+        header = f.read(header_end)
+
+        start = header_end
+        while start < size:
+            target = min(start + chunk_bytes, size)
+            # Guillemets de la plage jusqu'à la cible, lus par blocs
+            quotes = 0
+            f.seek(start)
+            remaining = target - start
+            while remaining > 0:
+                block = f.read(min(remaining, READ_CHUNK_SIZE * 16))
+                quotes += block.count(quote)
+                remaining -= len(block)
+            # La cible tombe en milieu de ligne : finir cette ligne, puis aller à une fin hors guillemets
+            f.seek(target - 1)
+            if f.read(1) != b"\n":
+                quotes += f.readline().count(quote)
+            end = f.tell() if quotes % 2 == 0 else _next_boundary(f, quote, quotes)
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def _process_range(path, start, end, header, csv_format, part_path, period=None):
+    """Processus de calcul : analyse, valide et écrit en JSONL les lignes de la plage [start, end).
+
+    Avec `period`, rend aussi les clés de paiement des lignes (beneficiary_index.payment_keys).
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    frame = pd.read_csv(io.BytesIO(header + data), dtype=str, keep_default_na=False, index_col=False,
+                        **read_csv_options(csv_format)).fillna("")
+    masks, hashes, present = CsvValidator().validate_with_keys(frame)
+    with open(part_path, "w", encoding="utf-8") as part:
+        for participant in build_participants(frame, masks.tolist()):
+            part.write(json.dumps(participant, ensure_ascii=False) + "\n")
+    return {"columns": [str(column) for column in frame.columns], "masks": masks, "hashes": hashes,
+            "present": present, "payment_keys": payment_keys(frame, period) if period else None}
+
+
+def _copy_part(part_path, out, changed, masks):
+    """Recopie un morceau JSONL dans `out`, en réécrivant les lignes devenues doublons."""
+    if not len(changed):
+        with open(part_path, "rb") as part:
+            shutil.copyfileobj(part, out, READ_CHUNK_SIZE * 16)
+        return
+    changed = set(changed.tolist())
+    with open(part_path, "rb") as part:
+        for position, line in enumerate(part):
+            if position in changed:
+                participant = json.loads(line)
+                participant["status"] = "refusé"
+                participant["errors"] = decode(int(masks[position]))
+                line = (json.dumps(participant, ensure_ascii=False) + "\n").encode("utf-8")
+            out.write(line)
+
+
+def process_file(path, csv_format, output_path, executor=None, chunk_bytes=None, payments=None):
+    """Analyse, valide et écrit en JSONL dans `output_path` les participants du CSV `path`, sur plusieurs processus.
+
+    Retourne {"total", "valid", "refused", "columns", "chunks"}. Les lignes
+    sont écrites dans l'ordre du fichier, comme le ferait iter_participants
+    (avec le même contrôle `payments`).
+    """
+    executor = executor or get_process_pool()
+    header, ranges = split_ranges(path, csv_format, chunk_bytes or Config.PARALLEL_CHUNK_BYTES)
+    stats = {"total": 0, "valid": 0, "refused": 0, "columns": [], "chunks": len(ranges)}
+    work_dir = tempfile.mkdtemp(prefix=".parallel-", dir=os.path.dirname(os.path.abspath(output_path)))
+    parts = [os.path.join(work_dir, f"{position}.jsonl") for position in range(len(ranges))]
+    period = payments.period if payments is not None else None
+    futures = [executor.submit(_process_range, path, start, end, header, csv_format, part, period)
+               for (start, end), part in zip(ranges, parts)]
+    duplicates = DuplicateIndex()
+    try:
+        with open(output_path, "wb") as out:
+            for future, part in zip(futures, parts):
+                result = future.result()
+                masks = result["masks"].copy()
+                if result["hashes"] is not None:
+                    # Doublons avec les plages précédentes (ceux de la plage elle-même sont déjà marqués)
+                    masks[duplicates.add(result["hashes"], result["present"])] |= _DUPLICATE_BIT
+                if payments is not None:
+                    masks = payments.apply(masks, *result["payment_keys"])
+                _copy_part(part, out, np.flatnonzero(masks != result["masks"]), masks)
+                os.remove(part)
+
+                refused = int(np.count_nonzero(masks))
+                stats["total"] += len(masks)
+                stats["valid"] += len(masks) - refused
+                stats["refused"] += refused
+                stats["columns"] = stats["columns"] or result["columns"]
+            out.flush()
+            os.fsync(out.fileno())
+    except Exception as e:
+        for future in futures:
+            future.cancel()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        if isinstance(e, BrokenProcessPool):
+            # Processus tué (mémoire...) : le pool est inutilisable, en recréer un à la prochaine demande
+            discard_process_pool(executor)
+        raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return stats
+
+
+def read_bytes(content, csv_format, work_dir=None, payments=None):
+    """Traite en parallèle un CSV déjà en mémoire. Retourne (participants, colonnes)."""
+    directory = tempfile.mkdtemp(prefix=".read-", dir=work_dir)
+    try:
+        path = os.path.join(directory, "upload.csv")
+        with open(path, "wb") as f:
+            f.write(content)
+        output_path = os.path.join(directory, "participants.jsonl")
+        stats = process_file(path, csv_format, output_path, payments=payments)
+        with open(output_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f], stats["columns"]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def ingest_upload(stream, sink, work_dir=None, payments=None):
+    """Enregistre le CSV binaire `stream` sur disque, le traite en parallèle et l'écrit dans `sink`.
+
+    Retourne (format détecté, statistiques, résultat du puits) ; résultat None
+    si le fichier n'a aucune ligne. Les fichiers qui ne peuvent pas être
+    découpés sont lus séquentiellement.
+    """
+    directory = tempfile.mkdtemp(prefix=".upload-", dir=work_dir)
+    try:
+        upload_path = os.path.join(directory, "upload.csv")
+        with open(upload_path, "wb") as f:
+            shutil.copyfileobj(stream, f, READ_CHUNK_SIZE)
+        with open(upload_path, "rb") as f:
+            csv_format = detect_csv_format(f.read(SNIFF_SIZE))
+
+        if not can_split(csv_format):
+            stats = {"total": 0, "valid": 0, "refused": 0}
+            with open(upload_path, "rb") as f:
+                participants = iter_participants(f, stats, csv_format, payments)
+                try:
+                    first = next(participants, None)
+                    if first is None:
+                        return csv_format, stats, None
+                    return csv_format, stats, sink.write_batch(chain([first], participants))
+                finally:
+                    participants.close()
+
+        output_path = os.path.join(directory, "participants.jsonl")
+        stats = process_file(upload_path, csv_format, output_path, payments=payments)
+        if stats["total"] == 0:
+            return csv_format, stats, None
+        return csv_format, stats, sink.write_segment(output_path, stats["total"], stats["valid"])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Retourne le pool de processus de calcul (Config.PARALLEL_WORKERS), créé à la première demande.
+
+    Le pool sert aussi à la génération des reçus par lot (receipts.py). Les
+    processus sont créés par un serveur "forkserver" qui a déjà importé ces
+    modules : pas de fork du serveur web (multi-thread), pas de réimport de
+    pandas ou de fpdf à chaque processus.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["parallel_ingestion", "receipts"])
+            _pool = ProcessPoolExecutor(max_workers=Config.PARALLEL_WORKERS, mp_context=context)
+        return _pool
+
+
+def discard_process_pool(executor):
+    """Abandonne un pool devenu inutilisable (processus tué) : un nouveau sera créé à la prochaine demande."""
+    global _pool
+    with _pool_lock:
+        if _pool is executor:
+            _pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def use_parallel(option, size):
+    """Décide du mode parallèle : option explicite ("1"/"0") ou, sinon, taille du fichier."""
+    if option is not None:
+        return str(option).lower() in ("1", "true", "oui")
+    return Config.PARALLEL_WORKERS > 1 and size is not None and size >= Config.PARALLEL_MIN_BYTES
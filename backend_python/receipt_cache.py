@@ -0,0 +1,206 @@
+# receipt_cache.py
+"""
+Cache des reçus PDF rendus par /pdf/generate_receipt.
+
+Un reçu est rangé sous une clé de contenu : empreinte SHA-256 de la version de
+mise en page (RECEIPT_TEMPLATE_VERSION et version de fpdf2), de l'identifiant
+du transfert (transferId, sinon homeTransactionId) et des champs affichés
+(ReceiptTemplate.values). Les mêmes données donnent la même clé, qui sert aussi
+d'ETag : un If-None-Match qui la cite est servi sans même lire le reçu.
+
+Deux niveaux :
+- une LRU en mémoire, bornée en octets (Config.RECEIPT_CACHE_MEMORY) ;
+- un répertoire (Config.RECEIPT_CACHE_DIR), un fichier par reçu, borné à
+  Config.RECEIPT_CACHE_DISK octets : les reçus servis le moins récemment sont
+  supprimés (ordre repris de la date de modification des fichiers au démarrage).
+Chaque version de mise en page a son sous-répertoire ; ceux des autres
+versions sont supprimés à la première utilisation du cache. Plusieurs
+processus peuvent partager le répertoire : chacun ne compte que les fichiers
+qu'il a vus, un fichier supprimé par un autre est un simple défaut de cache.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import fpdf
+
+from config import Config
+from models.ReceiptPDF import RECEIPT_TEMPLATE_VERSION, ReceiptTemplate, render_receipt
+
+
+def template_version():
+    """Étiquette de la mise en page courante des reçus (nom du sous-répertoire du cache)."""
+    return f"v{RECEIPT_TEMPLATE_VERSION}-fpdf{fpdf.__version__}"
+
+
+class ReceiptCache:
+    """Cache à deux niveaux (mémoire puis disque) des reçus rendus, thread-safe."""
+
+    def __init__(self, directory, memory_bytes, disk_bytes, version=None):
+        self.version = version or template_version()
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = os.path.join(directory, self.version) if directory and disk_bytes > 0 else None
+        self._memory = OrderedDict()  # clé -> octets du reçu
+        self._memory_size = 0
+        self._disk = None  # clé -> taille du fichier, du moins au plus récemment servi
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def key(self, data):
+        """Clé (et ETag) du reçu de `data`."""
+        transfer_id = data.get("transferId") or data.get("homeTransactionId")
+        payload = json.dumps([self.version, transfer_id, ReceiptTemplate.values(data)],
+                             ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.pdf")
+
+    def _load_disk(self):
+        """Relève les reçus déjà sur disque et supprime ceux des autres versions (au premier accès)."""
+        if self._disk is not None:
+            return
+        parent = os.path.dirname(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        for entry in os.scandir(parent):
+            if entry.is_dir() and entry.name != self.version:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        files = []
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".pdf"):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._disk = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._disk_size = sum(self._disk.values())
+
+    def _remember(self, key, pdf):
+        """Range `pdf` dans la LRU en mémoire (appelé sous le verrou)."""
+        if len(pdf) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = pdf
+        self._memory_size += len(pdf)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def get(self, key):
+        """Octets du reçu rangé sous `key`, ou None."""
+        with self._lock:
+            pdf = self._memory.get(key)
+            if pdf is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return pdf
+            if self.directory is not None:
+                self._load_disk()
+        if self.directory is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                pdf = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        with self._lock:
+            if key not in self._disk:
+                self._disk_size += len(pdf)
+            self._disk[key] = len(pdf)
+            self._disk.move_to_end(key)
+            self._remember(key, pdf)
+            self._stats["disk_hits"] += 1
+        return pdf
+
+    def put(self, key, pdf):
+        """Range le reçu `pdf` sous `key`, en mémoire et sur disque."""
+        with self._lock:
+            self._remember(key, pdf)
+            if self.directory is None:
+                return
+            self._load_disk()
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._disk_size += len(pdf) - self._disk.pop(key, 0)
+            self._disk[key] = len(pdf)
+            while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_size -= size
+                evicted.append(old_key)
+            self._stats["evictions"] += len(evicted)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def fetch(self, data, key=None):
+        """Octets du reçu de `data` : depuis le cache, sinon rendu puis rangé."""
+        key = key or self.key(data)
+        pdf = self.get(key)
+        if pdf is None:
+            pdf = render_receipt(data)
+            self.put(key, pdf)
+        return pdf
+
+    def clear(self):
+        """Vide le cache (mémoire et disque)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+            if self.directory is not None:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self._disk = None
+                self._disk_size = 0
+
+    def stats(self):
+        """Compteurs (succès en mémoire et sur disque, défauts, évictions du disque) et tailles."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "version": self.version,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk) if self._disk is not None else None,
+                "disk_bytes": self._disk_size if self._disk is not None else None,
+            })
+        lookups = snapshot["memory_hits"] + snapshot["disk_hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = round((lookups - snapshot["misses"]) / lookups, 4) if lookups else 0.0
+        return snapshot
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_receipt_cache():
+    """Retourne le cache des reçus du processus, créé à la première demande."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReceiptCache(Config.RECEIPT_CACHE_DIR, Config.RECEIPT_CACHE_MEMORY, Config.RECEIPT_CACHE_DISK)
+    return _cache
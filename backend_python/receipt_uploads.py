@@ -0,0 +1,587 @@
+# receipt_uploads.py
+"""
+Envoi en tâche de fond des reçus et du récapitulatif d'un lot vers Cloudinary.
+
+POST /api/pensioners/<batchId>/uploads programme l'envoi et rend aussitôt un
+identifiant de tâche. Les tâches sont traitées une à une par un thread de
+coordination qui lit le lot : segment d'un lot du magasin (source "json",
+par défaut), ou pensionnés payés d'un lot de la table batches (source "db",
+batchId = batch_code). Les envois eux-mêmes passent par un pool borné de
+threads (Config.UPLOAD_WORKERS), propre à ce module : ni les threads des
+requêtes ni ceux des imports ne sont occupés. Ils ont leur propre
+pool de connexions HTTP (une par thread) : le client global du SDK Cloudinary
+n'est pas modifié.
+
+Un reçu atteste un paiement :
+- lot de la base : les paiements sont ceux enregistrés par l'application
+  (pensionné au statut 'success' et son virement dans la table transfer),
+  lus comme par POST /pdf/receipts (Batch.iter_transfers,
+  receipts.transfer_payload). Un virement qui n'est pas à l'état COMPLETED
+  (ou success) n'a pas de reçu ;
+- lot du magasin : aucun paiement n'y est enregistré par l'import ; seuls les
+  participants valides dont le segment porte le virement (champ transfer,
+  mêmes données que POST /pdf/generate_receipt) à l'état COMPLETED en ont un.
+Les autres (refusés, non encore payés) sont comptés dans receipts_skipped.
+Pour chaque participant payé :
+- la clé du reçu est celle du cache des reçus (ReceiptCache.key : empreinte
+  du contenu, aussi utilisée comme ETag). Un reçu dont la clé est déjà dans
+  l'index des envois reprend son URL, sans rendu ni envoi ;
+- sinon le reçu est rendu (render_receipt) puis envoyé par un thread du pool,
+  sous la clé comme public_id. Une panne passagère (erreur réseau, 5xx, 408,
+  429) est retentée Config.UPLOAD_RETRIES fois, avec une attente de
+  Config.UPLOAD_BACKOFF secondes doublée à chaque essai (plus ou moins la
+  moitié, pour ne pas relancer tous les envois en même temps) ; un refus ne
+  l'est pas. Après MAX_CONSECUTIVE_FAILURES reçus en échec d'affilée, la
+  tâche échoue (Cloudinary injoignable).
+Au plus 4 × Config.UPLOAD_WORKERS reçus sont en cours ; les résultats sont
+repris dans l'ordre du lot.
+
+Les URL sont écrites par paquets de Config.UPLOAD_WRITEBACK lignes dans le
+journal de la tâche et dans l'index des envois, puis l'état de la tâche est
+enregistré. À la fin, pour un lot du magasin, le segment est réécrit une
+seule fois avec le champ receipt de chaque participant
+(BatchStore.replace_segment), et le récapitulatif est généré s'il manque,
+puis envoyé ; son URL est enregistrée dans summary_pdf_url. Pour un lot de la
+base, qui n'a ni segment ni récapitulatif, le journal est gardé
+(receipts_file) : une ligne par reçu, "line" y étant l'id du pensionné.
+
+Répertoire (Config.UPLOADS_DIR) :
+- index.jsonl : index des envois en ajout seul, une ligne {"hash", "url"} par reçu envoyé ;
+- .lock : verrou (fcntl.flock) pris pour chaque écriture dans l'index ;
+- jobs/<job_id>/job.json : état de la tâche, réécrit atomiquement après chaque paquet ;
+- jobs/<job_id>/receipts.jsonl : URL déjà obtenues, une ligne {"line", "hash", "url"} par reçu
+  (ligne du segment, ou id du pensionné pour un lot de la base) ;
+- jobs/<job_id>/.lock : verrou tenu par le thread qui traite la tâche.
+
+Reprise : au démarrage de l'application, les tâches en attente ou en cours
+sont relancées. Les lignes déjà traitées sont sautées (les lines_done
+premières lignes du segment, ou les pensionnés jusqu'à last_line) et le
+journal est ramené à sa taille enregistrée. Les reçus envoyés après le
+dernier paquet enregistré sont renvoyés sous le même public_id, sans créer
+de doublon chez Cloudinary (overwrite=False).
+"""
+import fcntl
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import cloudinary
+import cloudinary.utils
+import urllib3
+
+from batch_store import get_store
+from batch_summary import generate_summary
+from config import Config
+from models.ReceiptPDF import render_receipt
+from models.batch_model import Batch
+from receipt_cache import get_receipt_cache
+from receipts import transfer_payload
+
+TERMINAL_STATUSES = ("completed", "failed")
+SOURCES = ("json", "db")
+# États d'un virement abouti (Mojaloop, ou statut de la table transfer)
+_COMPLETED_STATES = ("COMPLETED", "SUCCESS")
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+# Échecs consécutifs (après nouveaux essais) au-delà desquels Cloudinary est jugé injoignable
+MAX_CONSECUTIVE_FAILURES = 20
+
+
+class UploadError(Exception):
+    """Envoi vers Cloudinary refusé, ou abandonné après le dernier essai."""
+
+
+class _Retry(Exception):
+    """Panne passagère d'un envoi (erreur réseau, 5xx, 408, 429) : l'envoi sera retenté."""
+
+
+def _post_pdf(http, pdf, public_id):
+    """Une requête d'envoi signée (API d'envoi de Cloudinary, comme uploader.upload) par le pool `http`.
+
+    Retourne l'URL du PDF. Lève _Retry pour une panne passagère, UploadError pour un refus.
+    """
+    options = {"public_id": f"{public_id}.pdf", "folder": Config.CLOUDINARY_FOLDER,
+               "resource_type": "raw", "overwrite": False}
+    params = cloudinary.utils.sign_request(cloudinary.utils.build_upload_params(**options), options)
+    fields = [(key, value) for key, value in params.items() if value]
+    fields.append(("file", (f"{public_id}.pdf", pdf)))
+    try:
+        response = http.request("POST", cloudinary.utils.cloudinary_api_url("upload", resource_type="raw"),
+                                fields=fields, headers={"User-Agent": cloudinary.get_user_agent()},
+                                timeout=Config.UPLOAD_TIMEOUT, retries=False)
+    except (urllib3.exceptions.HTTPError, OSError) as e:
+        raise _Retry(f"erreur réseau : {e!r}")
+    try:
+        result = json.loads(response.data.decode("utf-8"))
+    except ValueError:
+        raise _Retry(f"réponse illisible ({response.status})")
+    error = result.get("error") if isinstance(result, dict) else {"message": "réponse inattendue"}
+    if error is None and "secure_url" in result:
+        return result["secure_url"]
+    message = f"{response.status} {(error or {}).get('message', 'secure_url absent')}"
+    if response.status >= 500 or response.status in (408, 429):
+        raise _Retry(message)
+    raise UploadError(f"Envoi de {public_id} refusé : {message}")
+
+
+def upload_pdf(http, pdf, public_id, retries=None, backoff=None):
+    """Envoie le PDF `pdf` (octets) vers Cloudinary sous `public_id` par le pool `http`. Retourne son URL.
+
+    Les pannes passagères (erreur réseau, 5xx, 408, 429) sont retentées ; un
+    refus (autre 4xx) ne l'est pas. Lève UploadError après le dernier essai.
+    """
+    retries = Config.UPLOAD_RETRIES if retries is None else retries
+    backoff = Config.UPLOAD_BACKOFF if backoff is None else backoff
+    error = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        try:
+            return _post_pdf(http, pdf, public_id)
+        except _Retry as e:
+            error = e
+    raise UploadError(f"Envoi de {public_id} abandonné après {retries + 1} essai(s) : {error}")
+
+
+def completed_transfer(participant):
+    """Données de reçu (format de transaction.json) du virement d'un participant, ou None s'il n'a pas été payé.
+
+    Seul un participant valide dont le virement enregistré (champ transfer,
+    mêmes données que POST /pdf/generate_receipt) est à l'état COMPLETED a un reçu.
+    """
+    transfer = participant.get("transfer")
+    if participant.get("status") != "valide" or not isinstance(transfer, dict):
+        return None
+    if transfer.get("currentState") != "COMPLETED":
+        return None
+    if not (transfer.get("transferId") or transfer.get("homeTransactionId")):
+        return None
+    return transfer
+
+
+def paid_transfer(row):
+    """Données de reçu d'une ligne de Batch.iter_transfers (pensionné payé), ou None si le virement n'a pas abouti."""
+    payload = transfer_payload(row)
+    if str(payload["currentState"] or "").upper() not in _COMPLETED_STATES:
+        return None
+    return payload
+
+
+class UploadIndex:
+    """Index des envois (empreinte du contenu -> URL), journal en ajout seul partagé entre processus."""
+
+    def __init__(self, root):
+        self.path = os.path.join(root, "index.jsonl")
+        self._lock_path = os.path.join(root, ".lock")
+        self._urls = {}
+        self._inode = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Relit les lignes ajoutées à l'index depuis la dernière lecture."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._urls, self._inode, self._offset = {}, None, 0
+                return
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                self._urls, self._inode, self._offset = {}, stat.st_ino, 0
+            if stat.st_size == self._offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read(stat.st_size - self._offset)
+            complete = data.rfind(b"\n") + 1
+            for line in data[:complete].splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    self._urls[entry["hash"]] = entry["url"]
+            self._offset += complete
+
+    def get(self, key):
+        """URL du contenu d'empreinte `key` déjà envoyé, ou None (index en mémoire, voir refresh)."""
+        return self._urls.get(key)
+
+    def __len__(self):
+        return len(self._urls)
+
+    def add_many(self, entries):
+        """Inscrit des envois ({"hash", "url"}) en une écriture."""
+        if not entries:
+            return
+        data = "".join(json.dumps({"hash": entry["hash"], "url": entry["url"]}) + "\n" for entry in entries)
+        with self._locked():
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data.encode("utf-8"))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.refresh()
+
+
+class UploadJobs:
+    """Tâches d'envoi des reçus d'un lot : coordination une tâche à la fois, envois par un pool borné de threads."""
+
+    def __init__(self, root, workers):
+        self.root = root
+        self.jobs_dir = os.path.join(root, "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.workers = workers
+        self.window = 4 * workers
+        self.index = UploadIndex(root)
+        self._coordinator = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-job")
+        self._uploads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload")
+        # Pool de connexions propre aux envois (celui du SDK n'en garde qu'une par hôte) : une par thread d'envoi
+        self._http = cloudinary.utils.get_http_connector(
+            cloudinary.config(), dict(cloudinary.CERT_KWARGS, maxsize=workers))
+
+    def _directory(self, job_id):
+        if not _JOB_ID.fullmatch(job_id or ""):
+            return None
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _load(self, job_id):
+        directory = self._directory(job_id)
+        if directory is None:
+            return None
+        try:
+            with open(os.path.join(directory, "job.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self, state):
+        """Réécrit job.json d'un coup (fichier temporaire puis renommage)."""
+        state["updated_at"] = datetime.now().isoformat()
+        state["run"]["updated"] = time.time()
+        path = os.path.join(self.jobs_dir, state["job_id"], "job.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+    def submit(self, batch_id, store=None, source="json"):
+        """Programme l'envoi des reçus (et du récapitulatif) d'un lot. Retourne l'état de la tâche.
+
+        `source` : "json" (batchId du magasin) ou "db" (batch_code de la table
+        batches). Lève LookupError si le lot n'existe pas.
+        """
+        if source == "db":
+            batch = Batch.get_by_batch_code(batch_id)
+            if batch is None:
+                raise LookupError(f"Lot non trouvé : {batch_id}")
+            segment, lines_total = None, batch.success_count
+        else:
+            batch = (store or get_store()).get(batch_id)
+            if batch is None:
+                raise LookupError(f"Lot non trouvé : {batch_id}")
+            segment, lines_total = batch["segment"], batch.get("participants")
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.jobs_dir, job_id))
+        state = {
+            "job_id": job_id,
+            "status": "queued",
+            "batchId": batch_id,
+            "source": source,
+            # Lot de la base : son id, les pensionnés payés sont relus à chaque reprise
+            "batch_db_id": batch.id if source == "db" else None,
+            # Segment lu par la tâche : les numéros de ligne du journal s'y rapportent
+            "segment": segment,
+            "lines_total": lines_total,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "lines_done": 0,
+            "last_line": None,
+            "journal_bytes": 0,
+            "receipts_done": 0,
+            "receipts_uploaded": 0,
+            "receipts_deduplicated": 0,
+            "receipts_failed": 0,
+            "receipts_skipped": 0,
+            "summary_pdf_url": None,
+            "receipts_file": None,
+            "errors": [],
+            "error": None,
+            "run": {"started": None, "receipts": 0, "lines": 0, "updated": None}
+        }
+        self._save(state)
+        self._coordinator.submit(self._run, job_id)
+        return self.status(job_id)
+
+    def resume(self):
+        """Relance les tâches interrompues (en attente ou en cours). Retourne leur nombre."""
+        resumed = 0
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            state = self._load(job_id)
+            if state is not None and state["status"] not in TERMINAL_STATUSES:
+                self._coordinator.submit(self._run, job_id)
+                resumed += 1
+        return resumed
+
+    def status(self, job_id):
+        """État d'une tâche avec progression (lignes du lot lues), débit (reçus/s) et temps restant estimé, ou None."""
+        state = self._load(job_id)
+        if state is None:
+            return None
+        run = state.pop("run")
+        lines_done = state.pop("lines_done")
+        for private in ("segment", "journal_bytes", "batch_db_id", "last_line"):
+            state.pop(private, None)
+        total = state["lines_total"]
+        state["progress"] = round(min(lines_done / total, 1.0), 4) if total else 1.0
+
+        state["receipts_per_second"] = None
+        state["eta_seconds"] = None
+        if run["started"] and run["updated"] and run["updated"] > run["started"]:
+            elapsed = run["updated"] - run["started"]
+            state["receipts_per_second"] = round((state["receipts_done"] - run["receipts"]) / elapsed, 1)
+            lines_rate = (lines_done - run["lines"]) / elapsed
+            if state["status"] == "running" and lines_rate > 0 and total:
+                state["eta_seconds"] = round(max(total - lines_done, 0) / lines_rate, 1)
+        if state["status"] == "completed":
+            state["progress"] = 1.0
+            state["eta_seconds"] = 0
+        return state
+
+    def _run(self, job_id):
+        directory = os.path.join(self.jobs_dir, job_id)
+        with open(os.path.join(directory, ".lock"), "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Déjà traitée par un autre thread ou processus
+                return
+            state = self._load(job_id)
+            if state is None or state["status"] in TERMINAL_STATUSES:
+                return
+            try:
+                self._process(state, directory)
+            except Exception as e:
+                print(f"Erreur lors de l'envoi des reçus {job_id} : {e}")
+                state["status"] = "failed"
+                state["error"] = str(e)
+                state["finished_at"] = datetime.now().isoformat()
+                self._save(state)
+
+    def _upload_receipt(self, payload, key):
+        """Rend puis envoie un reçu (thread du pool d'envoi). Retourne son URL."""
+        return upload_pdf(self._http, render_receipt(payload), key)
+
+    def _process(self, state, directory):
+        store = get_store()
+        from_db = state.get("source") == "db"
+        if not from_db:
+            batch = store.get(state["batchId"])
+            if batch is None:
+                raise LookupError(f"Lot non trouvé : {state['batchId']}")
+            if batch["segment"] != state["segment"]:
+                raise RuntimeError(f"Le segment du lot {state['batchId']} a changé pendant l'envoi")
+
+        state["status"] = "running"
+        state["started_at"] = state["started_at"] or datetime.now().isoformat()
+        state["run"] = {"started": time.time(), "receipts": state["receipts_done"], "lines": state["lines_done"],
+                        "updated": None}
+        self._save(state)
+
+        journal_path = os.path.join(directory, "receipts.jsonl")
+        # Reprise : retirer ce qui a été écrit après le dernier paquet enregistré
+        with open(journal_path, "ab") as f:
+            f.truncate(state["journal_bytes"])
+        self.index.refresh()
+        if from_db:
+            lines = self._transfer_lines(state["batch_db_id"], state.get("last_line") or 0)
+        else:
+            lines = self._segment_lines(os.path.join(store.segments_dir, state["segment"]), state["lines_done"])
+        with open(journal_path, "ab") as journal:
+            self._upload_receipts(state, lines, journal)
+
+        if from_db:
+            # Ni segment ni récapitulatif : le journal est le résultat de la tâche
+            state["receipts_file"] = journal_path
+        else:
+            if state["receipts_done"]:
+                with open(journal_path, "r", encoding="utf-8") as journal:
+                    self._write_back(store, state, journal)
+            self._upload_summary(store, state)
+
+        state["status"] = "completed"
+        state["finished_at"] = datetime.now().isoformat()
+        self._save(state)
+        if not from_db:
+            os.remove(journal_path)
+
+    @staticmethod
+    def _segment_lines(segment_path, lines_done):
+        """Générateur : (numéro de ligne, données de reçu ou None, participant) des lignes du segment après `lines_done`."""
+        with open(segment_path, "r", encoding="utf-8") as segment:
+            lines = (line for line in segment if line.strip())
+            for line_number, line in enumerate(lines):
+                if line_number < lines_done:
+                    continue
+                participant = json.loads(line)
+                yield line_number, completed_transfer(participant), participant
+
+    @staticmethod
+    def _transfer_lines(batch_id, after_id):
+        """Générateur : (id du pensionné, données de reçu ou None, None) des pensionnés payés du lot après `after_id`."""
+        for row in Batch.iter_transfers(batch_id, after_id=after_id):
+            yield row["pensioner_id"], paid_transfer(row), None
+
+    def _upload_receipts(self, state, lines, journal):
+        """Envoie les reçus des participants payés de `lines` (voir _segment_lines), résultats repris dans l'ordre."""
+        cache = get_receipt_cache()
+        pending = deque()  # (ligne, clé, URL connue, Future ou None pour un participant sans reçu)
+        done = []
+        consecutive_failures = resolved = 0
+
+        def resolve():
+            nonlocal consecutive_failures, resolved
+            line, key, result = pending.popleft()
+            if result is None:
+                # Participant refusé ou non payé : pas de reçu
+                state["receipts_skipped"] += 1
+            else:
+                try:
+                    url = result if isinstance(result, str) else result.result()
+                except UploadError as e:
+                    state["receipts_failed"] += 1
+                    if len(state["errors"]) < 100:
+                        state["errors"].append({"line": line, "error": str(e)})
+                    consecutive_failures += 1
+                    if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                        raise RuntimeError(f"Cloudinary injoignable : {consecutive_failures} échecs consécutifs ({e})")
+                else:
+                    consecutive_failures = 0
+                    done.append({"line": line, "hash": key, "url": url, "new": not isinstance(result, str)})
+            state["lines_done"] += 1
+            state["last_line"] = line
+            resolved += 1
+            if resolved >= Config.UPLOAD_WRITEBACK:
+                self._flush(state, journal, done)
+                resolved = 0
+
+        try:
+            for line, payload, participant in lines:
+                if payload is None:
+                    pending.append((line, None, None))
+                else:
+                    key = cache.key(payload)
+                    url = self.index.get(key)
+                    if url is None and participant is not None and participant.get("receipt_hash") == key:
+                        # Déjà envoyé par une tâche précédente (index des envois effacé depuis)
+                        url = participant.get("receipt")
+                    pending.append((line, key, url or self._uploads.submit(self._upload_receipt, payload, key)))
+                # Fenêtre bornée : attendre le plus ancien reçu si elle est pleine, reprendre ceux déjà prêts
+                while pending and (len(pending) >= self.window or not isinstance(pending[0][2], Future)
+                                   or pending[0][2].done()):
+                    resolve()
+            while pending:
+                resolve()
+        finally:
+            lines.close()
+            for _, _, result in pending:
+                if isinstance(result, Future):
+                    result.cancel()
+        self._flush(state, journal, done)
+
+    def _flush(self, state, journal, done):
+        """Écrit un paquet d'URL dans le journal de la tâche et dans l'index, puis enregistre l'état."""
+        if done:
+            data = "".join(json.dumps({"line": entry["line"], "hash": entry["hash"], "url": entry["url"]}) + "\n"
+                           for entry in done)
+            journal.write(data.encode("utf-8"))
+            journal.flush()
+            os.fsync(journal.fileno())
+            self.index.add_many([entry for entry in done if entry["new"]])
+            uploaded = sum(1 for entry in done if entry["new"])
+            state["receipts_uploaded"] += uploaded
+            state["receipts_deduplicated"] += len(done) - uploaded
+        state["journal_bytes"] = journal.tell()
+        state["receipts_done"] = state["receipts_uploaded"] + state["receipts_deduplicated"] + state["receipts_failed"]
+        done.clear()
+        self._save(state)
+
+    @staticmethod
+    def _write_back(store, state, journal):
+        """Réécrit le segment du lot une fois, avec receipt (URL) et receipt_hash des participants du journal."""
+        segments_dir = store.segments_dir
+        tmp_path = os.path.join(segments_dir, f".tmp-{uuid.uuid4().hex}")
+        entries = (json.loads(line) for line in journal if line.strip())
+        entry = next(entries, None)
+        changed = 0
+        try:
+            with open(os.path.join(segments_dir, state["segment"]), "r", encoding="utf-8") as segment, \
+                    open(tmp_path, "w", encoding="utf-8") as out:
+                lines = (line for line in segment if line.strip())
+                for line_number, line in enumerate(lines):
+                    if entry is not None and entry["line"] == line_number:
+                        participant = json.loads(line)
+                        if participant.get("receipt") != entry["url"]:
+                            participant["receipt"] = entry["url"]
+                            participant["receipt_hash"] = entry["hash"]
+                            line = json.dumps(participant, ensure_ascii=False) + "\n"
+                            changed += 1
+                        entry = next(entries, None)
+                    out.write(line if line.endswith("\n") else line + "\n")
+                out.flush()
+                os.fsync(out.fileno())
+            if changed:
+                state["segment"] = store.replace_segment(state["batchId"], tmp_path, state["segment"])
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _upload_summary(self, store, state):
+        """Envoie le récapitulatif du lot (généré s'il manque) et enregistre son URL dans summary_pdf_url."""
+        batch = store.get(state["batchId"])
+        path = batch.get("summary_pdf")
+        if not path or not os.path.isfile(path):
+            path = generate_summary(state["batchId"], store)["summary_pdf"]
+        with open(path, "rb") as f:
+            pdf = f.read()
+        key = hashlib.sha256(pdf).hexdigest()
+        url = self.index.get(key)
+        if url is None:
+            url = self._uploads.submit(upload_pdf, self._http, pdf, key).result()
+            self.index.add_many([{"hash": key, "url": url}])
+        if batch.get("summary_pdf_url") != url:
+            store.update(state["batchId"], summary_pdf_url=url)
+        state["summary_pdf_url"] = url
+
+
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def get_upload_jobs():
+    """Retourne le gestionnaire d'envois vers Cloudinary du processus, créé (avec reprise des tâches interrompues) à la première demande."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            jobs = UploadJobs(Config.UPLOADS_DIR, Config.UPLOAD_WORKERS)
+            jobs.resume()
+            _jobs = jobs
+        return _jobs
@@ -0,0 +1,189 @@
+# receipts.py
+"""
+Génération des reçus PDF par lot.
+
+Les reçus sont rendus par paquets de Config.RECEIPT_CHUNK dans le pool de
+processus de calcul (parallel_ingestion.get_process_pool), avec au plus deux
+paquets en cours par processus : les données sont lues au fur et à mesure
+(lot de la base lu en continu) et les reçus rendus dans l'ordre.
+
+Les reçus sont soit renvoyés dans une archive ZIP construite au fil de l'eau
+(stream_zip : chaque reçu est écrit puis envoyé, l'archive n'est jamais
+entière en mémoire), soit écrits dans un répertoire (write_directory). Un
+reçu qui ne peut pas être rendu (données incomplètes) est signalé sans
+interrompre le lot : dans erreurs.json à la fin de l'archive, ou dans le
+résumé rendu par write_directory.
+"""
+import json
+import os
+import re
+import zipfile
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from itertools import islice
+
+from config import Config
+from models.ReceiptPDF import render_receipt
+from parallel_ingestion import discard_process_pool, get_process_pool
+
+ERRORS_NAME = "erreurs.json"
+_UNSAFE_NAME_CHARS = re.compile(r"[^\w.-]")
+
+
+def transfer_payload(row):
+    """Données d'un reçu (forme du champ "data" de /pdf/generate_receipt) à partir d'une ligne de Batch.iter_transfers."""
+    def timestamp(value):
+        return value.isoformat() if value is not None else None
+
+    return {
+        "from": {
+            "name": row["payer_name"] or "",
+            "idType": row["payer_id_type"],
+            "idValue": row["payer_id_value"] or "",
+        },
+        "to": {
+            "idType": row["payee_id_type"],
+            "idValue": row["payee_id_value"] or row["msisdn"] or "",
+            "fspId": row["payee_fsp_id"],
+            "firstName": row["payee_first_name"] or row["first_name"] or "",
+            "middleName": "",
+            "lastName": row["payee_last_name"] or row["last_name"] or "",
+        },
+        "amount": str(row["amount"]) if row["amount"] is not None else "N/A",
+        "currency": row["currency"] or "XOF",
+        "note": row["note"],
+        "homeTransactionId": row["home_transaction_id"],
+        "transferId": row["transfer_id"],
+        "currentState": row["status"],
+        "initiatedTimestamp": timestamp(row["initiated_at"]),
+        "completedTimestamp": timestamp(row["completed_at"]),
+    }
+
+
+def receipt_name(data, position):
+    """Nom de fichier d'un reçu, comme /pdf/generate_receipt (position dans le lot si la transaction n'a pas d'id)."""
+    transaction_id = data.get("homeTransactionId") if isinstance(data, dict) else None
+    transaction_id = str(transaction_id or f"sans-id-{position + 1}")
+    return f"Reçu_Paiement_{_UNSAFE_NAME_CHARS.sub('_', transaction_id)}.pdf"
+
+
+def _render_chunk(payloads):
+    """Processus de calcul : rend les reçus d'un paquet. Retourne [(pdf, None) ou (None, erreur)]."""
+    results = []
+    for data in payloads:
+        try:
+            results.append((render_receipt(data), None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def render_receipts(payloads, executor=None, chunk_size=None, window=None):
+    """Générateur : rend les reçus de `payloads` (itérable de données de transfert) dans le pool de processus.
+
+    Produit (position, données, pdf, erreur) dans l'ordre de `payloads` ;
+    pdf vaut None et erreur décrit le problème pour un reçu non rendu.
+    `window` : paquets en cours au plus (par défaut deux par processus du pool).
+    """
+    executor = executor or get_process_pool()
+    chunk_size = chunk_size or Config.RECEIPT_CHUNK
+    window = window or 2 * max(Config.PARALLEL_WORKERS, 1)
+    payloads = iter(payloads)
+    pending = deque()
+    position = 0
+
+    def submit():
+        nonlocal position
+        chunk = list(islice(payloads, chunk_size))
+        if chunk:
+            pending.append((position, chunk, executor.submit(_render_chunk, chunk)))
+            position += len(chunk)
+        return bool(chunk)
+
+    try:
+        while len(pending) < window and submit():
+            pass
+        while pending:
+            start, chunk, future = pending.popleft()
+            results = future.result()
+            submit()
+            for offset, (data, (pdf, error)) in enumerate(zip(chunk, results)):
+                yield start + offset, data, pdf, error
+    except BrokenProcessPool:
+        discard_process_pool(executor)
+        raise
+    finally:
+        for _, _, future in pending:
+            future.cancel()
+
+
+class _ZipStream:
+    """Flux en écriture seule pour zipfile : les octets écrits sont repris par take()."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def _unique_name(name, used):
+    """`name`, suffixé si une autre entrée porte déjà ce nom."""
+    candidate, counter = name, 1
+    while candidate in used:
+        counter += 1
+        candidate = f"{name[:-4]}-{counter}.pdf"
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(results):
+    """Générateur : archive ZIP des reçus produits par render_receipts, rendue morceau par morceau.
+
+    Les PDF, déjà compressés, sont stockés sans recompression. Les reçus en
+    erreur sont listés dans erreurs.json, en dernière entrée.
+    """
+    stream = _ZipStream()
+    errors = []
+    used = set()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+        for position, data, pdf, error in results:
+            name = receipt_name(data, position)
+            if pdf is None:
+                errors.append({"index": position, "name": name, "error": error})
+                continue
+            info = zipfile.ZipInfo(_unique_name(name, used), datetime.now().timetuple()[:6])
+            archive.writestr(info, pdf)
+            yield stream.take()
+        if errors:
+            archive.writestr(ERRORS_NAME, json.dumps(errors, ensure_ascii=False, indent=2))
+    yield stream.take()
+
+
+def write_directory(results, directory):
+    """Écrit dans `directory` les reçus produits par render_receipts. Retourne le résumé de l'écriture."""
+    os.makedirs(directory, exist_ok=True)
+    written = 0
+    errors = []
+    used = set()
+    for position, data, pdf, error in results:
+        name = receipt_name(data, position)
+        if pdf is None:
+            errors.append({"index": position, "name": name, "error": error})
+            continue
+        path = os.path.join(directory, _unique_name(name, used))
+        with open(path + ".tmp", "wb") as f:
+            f.write(pdf)
+        os.replace(path + ".tmp", path)
+        written += 1
+    return {"directory": directory, "written": written, "failed": len(errors), "errors": errors[:100]}
@@ -1,8 +1,11 @@
 from flask import Blueprint,jsonify
-import os
-import json
 from controllers.generatePdf import PdfController
 from controllers.csv_to_json_controller import CsvToJsonController
+from controllers.pensioner_controller import PensionerController
+from controllers.batch_controller import BatchController
+from config import Config
+from cache import get_cache_stats
+from receipt_cache import get_receipt_cache
 
 routes = Blueprint("routes", __name__)
 
@@ -10,23 +13,86 @@ routes = Blueprint("routes", __name__)
 def generate_pdf_receipt():
     return PdfController.generate_receipt()
 
-DATA_FILE = "data.json"
+@routes.route('/pdf/receipts', methods=['POST'])
+def generate_pdf_receipts():
+    return PdfController.generate_receipts()
+
+@routes.route('/pdf/receipts/cache', methods=['GET'])
+def get_receipt_cache_statistics():
+    return jsonify(get_receipt_cache().stats()), 200
+
+@routes.route('/db/pool', methods=['GET'])
+def get_db_pool_metrics():
+    return jsonify(Config.get_pool_metrics()), 200
+
+@routes.route('/cache/stats', methods=['GET'])
+def get_cache_statistics():
+    return jsonify(get_cache_stats()), 200
+
+@routes.route('/pensioners/bulk', methods=['POST'])
+def create_pensioners_bulk():
+    return PensionerController.create_pensioners_bulk()
+
+@routes.route('/pensioners/upsert', methods=['POST'])
+def upsert_pensioners():
+    return PensionerController.upsert_pensioners()
+
+@routes.route('/pensioners/status/bulk', methods=['POST'])
+def update_pensioners_status_bulk():
+    return PensionerController.update_pensioners_status_bulk()
+
+@routes.route('/batches/consistency', methods=['GET'])
+def check_batches_consistency():
+    return BatchController.check_batches_consistency()
+
+@routes.route('/beneficiaries/index', methods=['GET'])
+def get_beneficiary_index_stats():
+    return BatchController.get_beneficiary_index_stats()
+
+@routes.route('/beneficiaries/index/unregister', methods=['POST'])
+def unregister_beneficiary_batch():
+    return BatchController.unregister_beneficiary_batch()
+
+@routes.route('/beneficiaries/index/rebuild', methods=['POST'])
+def rebuild_beneficiary_index():
+    return BatchController.rebuild_beneficiary_index()
+
+@routes.route('/batches/pensioners', methods=['GET'])
+def get_batch_with_pensioners():
+    return BatchController.get_batch_with_pensioners()
 
 @routes.route('/csv/upload', methods=['POST'])
 def upload_csv():
     return CsvToJsonController.upload_and_convert()
 
+@routes.route('/csv/jobs', methods=['POST'])
+def create_csv_job():
+    return CsvToJsonController.create_job()
+
+@routes.route('/csv/jobs/<job_id>', methods=['GET'])
+def get_csv_job(job_id):
+    return CsvToJsonController.get_job(job_id)
+
+@routes.route('/csv/jobs/<job_id>', methods=['DELETE'])
+def cancel_csv_job(job_id):
+    return CsvToJsonController.cancel_job(job_id)
+
 @routes.route("/api/pensioners", methods=["GET"])
 def get_pensioners():
-    if not os.path.exists(DATA_FILE):
-        return jsonify({"error": "Aucun fichier data.json trouvé"}), 404
+    return CsvToJsonController.get_pensioners()
+
+@routes.route("/api/pensioners/<batch_id>/summary", methods=["POST"])
+def generate_batch_summary(batch_id):
+    return CsvToJsonController.generate_summary(batch_id)
 
-    try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
+@routes.route("/api/pensioners/<batch_id>/summary", methods=["GET"])
+def get_batch_summary(batch_id):
+    return CsvToJsonController.get_summary(batch_id)
 
-        # Renvoie toujours via jsonify pour garantir du JSON correct
-        return jsonify(data), 200
+@routes.route("/api/pensioners/<batch_id>/uploads", methods=["POST"])
+def upload_batch_receipts(batch_id):
+    return CsvToJsonController.upload_receipts(batch_id)
 
-    except json.JSONDecodeError:
-        return jsonify({"error": "Fichier JSON corrompu"}), 500
\ No newline at end of file
+@routes.route("/uploads/jobs/<job_id>", methods=["GET"])
+def get_upload_job(job_id):
+    return CsvToJsonController.get_upload_job(job_id)
@@ -0,0 +1,84 @@
+# serializer.py
+"""
+Sérialisation JSON en une seule passe des lignes Pensioner/Batch.
+
+Les objets modèles exposent leurs colonnes dans `FIELDS` ; ils sont écrits
+directement en JSON sans passer par un dict intermédiaire.
+- Decimal est écrit comme nombre JSON exact (pas de passage par float) ;
+- datetime/date sont écrits au format ISO 8601.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from operator import attrgetter
+from flask import Response
+
+_encode_str = json.encoder.encode_basestring_ascii
+_row_encoders = {}
+
+
+def _encode_decimal(value):
+    return str(value) if value.is_finite() else "null"
+
+
+def _encode_datetime(value):
+    return '"' + value.isoformat() + '"'
+
+
+_encoders = {
+    str: _encode_str,
+    int: int.__repr__,
+    float: float.__repr__,
+    bool: lambda value: "true" if value else "false",
+    Decimal: _encode_decimal,
+    datetime: _encode_datetime,
+    date: _encode_datetime,
+    type(None): lambda value: "null",
+}
+
+
+def encode_value(value):
+    """Encode une valeur scalaire, un dict, une liste ou une ligne modèle en JSON."""
+    encoder = _encoders.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    if hasattr(value, 'FIELDS'):
+        return encode_row(value)
+    if isinstance(value, dict):
+        return "{" + ",".join(_encode_str(str(key)) + ":" + encode_value(item) for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(map(encode_value, value)) + "]"
+    if isinstance(value, Decimal):
+        return _encode_decimal(value)
+    if isinstance(value, (datetime, date)):
+        return _encode_datetime(value)
+    raise TypeError(f"Type non sérialisable en JSON : {type(value).__name__}")
+
+
+def _row_encoder(cls):
+    """Construit (une fois par classe) l'encodeur d'une ligne à partir de ses FIELDS."""
+    encoder = _row_encoders.get(cls)
+    if encoder is None:
+        keys = [_encode_str(field) + ":" for field in cls.FIELDS]
+        getter = attrgetter(*cls.FIELDS)
+        get = _encoders.get
+
+        def encoder(row):
+            parts = []
+            for key, value in zip(keys, getter(row)):
+                encode = get(type(value))
+                parts.append(key + (encode(value) if encode is not None else encode_value(value)))
+            return "{" + ",".join(parts) + "}"
+
+        _row_encoders[cls] = encoder
+    return encoder
+
+
+def encode_row(row):
+    """Encode une ligne modèle (objet à FIELDS) en objet JSON."""
+    return _row_encoder(type(row))(row)
+
+
+def json_response(payload, status=200):
+    """Réponse Flask dont le corps est `payload` sérialisé en une seule passe."""
+    return Response(encode_value(payload), status=status, mimetype='application/json')
@@ -0,0 +1,57 @@
+# tests/test_batch_diff.py
+"""
+Import différentiel contre un lot de la table pensioners (batch_diff.ingest_diff) :
+comparaison seulement (dry_run), l'écriture est refusée avant toute lecture
+de la base. Batch est remplacé par une doublure.
+"""
+import io
+from types import SimpleNamespace
+
+import pytest
+
+import batch_diff
+from batch_diff import DiffSinkError, ingest_diff
+from models.pensioner_model import Pensioner
+
+CSV = (b"type_id,valeur_id,devise,montant,nom_complet\n"
+       b"MSISDN,22997000001,XOF,1000,Awa Kone\n"
+       b"MSISDN,22997000002,XOF,2500,Ali Diallo\n"
+       b"MSISDN,22997000004,XOF,4000,Ada Ba\n")
+
+
+def pensioner(msisdn, amount, first_name, last_name, status):
+    return Pensioner(1, f"MSISDN-{msisdn}", first_name, last_name, "MSISDN", msisdn, amount, "XOF", "",
+                     status, "TX-1" if status == "paid" else None, 7)
+
+
+@pytest.fixture
+def reference(monkeypatch):
+    """Lot LOT-09 de la base : trois pensionnés, dont deux déjà payés."""
+    batch = SimpleNamespace(id=7, batch_code="LOT-09")
+    rows = [pensioner("22997000001", 1000.0, "Awa", "Kone", "paid"),
+            pensioner("22997000002", 2000.0, "Ali", "Diallo", "paid"),
+            pensioner("22997000003", 3000.0, "Eva", "Sow", "pending")]
+    reads = []
+
+    def get_by_batch_code(batch_code):
+        reads.append(batch_code)
+        return batch if batch_code == batch.batch_code else None
+
+    monkeypatch.setattr(batch_diff.Batch, "get_by_batch_code", staticmethod(get_by_batch_code))
+    monkeypatch.setattr(batch_diff.Batch, "get_batch_with_pensioners",
+                        staticmethod(lambda batch_id=None, **kwargs: iter([batch] + rows)))
+    return reads
+
+
+def test_db_reference_compared_in_dry_run(reference):
+    _, diff, stats, result = ingest_diff(io.BytesIO(CSV), "db", "LOT-09", dry_run=True)
+
+    assert result is None
+    assert stats == {"total": 3, "valid": 3, "refused": 0}
+    assert (diff["added"], diff["changed"], diff["unchanged"], diff["removed"]) == (1, 1, 1, 1)
+
+
+def test_db_write_refused(reference):
+    with pytest.raises(DiffSinkError):
+        ingest_diff(io.BytesIO(CSV), "db", "LOT-09")
+    assert reference == []
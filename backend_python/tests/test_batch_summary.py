@@ -0,0 +1,50 @@
+# tests/test_batch_summary.py
+"""
+Récapitulatif PDF d'un lot (batch_summary.py) : modèle précompilé vérifié au
+démarrage, et document construit par fpdf2 quand la vérification échoue.
+Magasin de lots dans un répertoire temporaire.
+"""
+import pytest
+
+import batch_summary
+from batch_store import BatchStore
+from batch_summary import SummaryTemplate, _check_document, generate_summary
+from benchmarks.bench_batch_summary import make_participants
+
+
+@pytest.fixture
+def template(monkeypatch):
+    """Modèle recompilé pour le test (compilation et vérification comprises)."""
+    monkeypatch.setattr(SummaryTemplate, "_template", None)
+    monkeypatch.setattr(SummaryTemplate, "_compiled", False)
+    return monkeypatch
+
+
+def summary(tmp_path, count):
+    store = BatchStore(str(tmp_path / "batches"))
+    batch_id = store.append_batch(make_participants(count))["batchId"]
+    result = generate_summary(batch_id, store)
+    with open(result["summary_pdf"], "rb") as f:
+        return result, f.read()
+
+
+def test_checked_template_writes_summary(template, tmp_path):
+    capacity = SummaryTemplate.get().capacity
+    result, document = summary(tmp_path, 2 * capacity + 1)
+
+    assert result["pages"] == 4
+    assert result["participants"] == 2 * capacity + 1
+    _check_document(document, pages=4)
+
+
+def test_unrecognized_fpdf_output_falls_back(template, tmp_path):
+    # Sortie de fpdf2 que le découpage ne reconnaît plus : page d'essai différente
+    render = SummaryTemplate.render
+    template.setattr(SummaryTemplate, "render", lambda self, *args: render(self, *args).replace(b" Tj", b" TJ"))
+    assert SummaryTemplate.get() is None
+
+    capacity = batch_summary.BatchSummaryPDF().add_table_page("", "", [])
+    result, document = summary(tmp_path, 2 * capacity + 1)
+    assert document.startswith(b"%PDF-")
+    assert result["pages"] == 4
+    assert result["valid"] + result["refused"] == 2 * capacity + 1
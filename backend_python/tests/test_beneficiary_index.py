@@ -0,0 +1,88 @@
+# tests/test_beneficiary_index.py
+"""
+Contrôle des doubles paiements (beneficiary_index.py) : réservation des clés
+au contrôle, rattachement au lot, libération et retrait d'un lot. Index dans
+un répertoire temporaire.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from beneficiary_index import BeneficiaryIndex, PaymentCheck
+from config import Config
+
+PERIOD = "2026-10"
+
+
+def upload(first, count):
+    return pd.DataFrame({"type_id": ["MSISDN"] * count,
+                         "valeur_id": [f"229{first + i:08d}" for i in range(count)]})
+
+
+def duplicates(check, frame):
+    """Lignes de `frame` refusées par `check` comme déjà payées."""
+    return int(np.count_nonzero(check.flag(frame, np.zeros(len(frame), dtype=np.uint8))))
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BeneficiaryIndex(str(tmp_path / "index"))
+
+
+def test_concurrent_uploads_cannot_both_pass(index):
+    first, second = PaymentCheck(index, PERIOD), PaymentCheck(index, PERIOD)
+    assert duplicates(first, upload(0, 100)) == 0
+    # Premier import pas encore enregistré : ses lignes sont déjà réservées
+    assert duplicates(second, upload(50, 100)) == 50
+    assert first.commit("LOT-1", "json") == 200
+    second.release()
+    assert duplicates(PaymentCheck(index, PERIOD), upload(100, 50)) == 0
+
+
+def test_released_reservation_frees_keys(index):
+    check = PaymentCheck(index, PERIOD)
+    duplicates(check, upload(0, 100))
+    assert check.release() == 200
+    assert duplicates(PaymentCheck(index, PERIOD), upload(0, 100)) == 0
+    assert index.stats()["batches"] == 0
+
+
+def test_unregistered_batch_can_be_paid_again(index):
+    check = PaymentCheck(index, PERIOD)
+    duplicates(check, upload(0, 100))
+    check.commit("LOT-1", "json")
+    assert duplicates(PaymentCheck(index, PERIOD, reserve=False), upload(0, 100)) == 100
+
+    # Fichier corrigé du même mois : l'ancien lot est retiré puis le nouveau inscrit
+    assert index.unregister("LOT-1", "json") == 200
+    assert ("json", "LOT-1") not in index.registered()
+    corrected = PaymentCheck(index, PERIOD)
+    assert duplicates(corrected, upload(0, 100)) == 0
+    corrected.commit("LOT-2", "json")
+    assert duplicates(PaymentCheck(index, PERIOD, reserve=False), upload(0, 100)) == 100
+    assert index.registered() == {("json", "LOT-2")}
+
+    # Vu de même par un autre processus (relecture complète du journal)
+    other = BeneficiaryIndex(index.root)
+    assert duplicates(PaymentCheck(other, PERIOD, reserve=False), upload(0, 100)) == 100
+    assert other.registered() == {("json", "LOT-2")}
+
+
+def test_resumed_import_keeps_its_reservation(index):
+    duplicates(PaymentCheck(index, PERIOD, "job-1"), upload(0, 100))
+    # Reprise après un arrêt : même réservation, ses lignes ne sont pas vues comme payées
+    resumed = PaymentCheck(index, PERIOD, "job-1")
+    assert duplicates(resumed, upload(0, 100)) == 0
+    assert duplicates(PaymentCheck(index, PERIOD, reserve=False), upload(0, 100)) == 100
+    assert resumed.commit("LOT-1", "db") == 200
+    assert index.registered() == {("db", "LOT-1")}
+
+
+def test_abandoned_reservation_expires(index, monkeypatch):
+    duplicates(PaymentCheck(index, PERIOD), upload(0, 100))
+    monkeypatch.setattr(Config, "BENEFICIARY_RESERVATION_TTL", -1)
+    check = PaymentCheck(index, PERIOD)
+    assert duplicates(check, upload(0, 100)) == 0
+    check.commit("LOT-1", "json")
+    monkeypatch.setattr(Config, "BENEFICIARY_RESERVATION_TTL", 3600)
+    assert duplicates(PaymentCheck(index, PERIOD, reserve=False), upload(0, 100)) == 100
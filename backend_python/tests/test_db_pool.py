@@ -0,0 +1,87 @@
+# tests/test_db_pool.py
+"""
+Attente dans db_pool.ConnectionPool avec de fausses connexions : un appelant
+qui attend doit être réveillé dès qu'une connexion est rendue ou qu'une place
+se libère, et non au bout du délai.
+"""
+import threading
+import time
+
+import pytest
+from mysql.connector import Error
+
+from db_pool import ConnectionPool
+
+
+class FakeConnection:
+    in_transaction = False
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def waiting_acquire(pool):
+    """Lance acquire() dans un thread ; retourne le thread et la liste où il range (connexion, durée)."""
+    result = []
+
+    def run():
+        started = time.monotonic()
+        result.append((pool.acquire(), time.monotonic() - started))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    # Laisser le thread se mettre en attente
+    time.sleep(0.1)
+    return thread, result
+
+
+def test_waiter_woken_by_released_connection():
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=5)
+    raw = pool.acquire()
+    thread, result = waiting_acquire(pool)
+    pool.release(raw)
+    thread.join(2)
+
+    assert result and result[0][0] is raw and result[0][1] < 1
+    assert pool.metrics()["waits"] == 1
+
+
+def test_waiter_woken_by_discarded_overflow_connection():
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=1, timeout=5)
+    kept, overflow = pool.acquire(), pool.acquire()
+    thread, result = waiting_acquire(pool)
+    # Connexion en débordement : fermée à son retour, sa place libérée
+    pool.release(overflow)
+    thread.join(2)
+
+    assert overflow.closed
+    assert result and result[0][0] not in (kept, overflow) and result[0][1] < 1
+    assert pool.metrics()["opened"] == 2
+
+
+def test_waiter_woken_by_discarded_connection():
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=5)
+    raw = pool.acquire()
+    thread, result = waiting_acquire(pool)
+    pool.discard(raw)
+    thread.join(2)
+
+    assert result and result[0][1] < 1
+    assert pool.metrics()["opened"] == 1
+
+
+def test_saturated_pool_times_out():
+    pool = ConnectionPool(FakeConnection, size=1, max_overflow=0, timeout=0.2)
+    pool.acquire()
+    with pytest.raises(Error):
+        pool.acquire()
+    assert pool.metrics()["timeouts"] == 1
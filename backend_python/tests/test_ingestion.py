@@ -0,0 +1,56 @@
+# tests/test_ingestion.py
+"""
+Import d'un fichier de paiement dans la base (ingestion.PensionerDbSink) :
+Batch et Pensioner sont remplacés par des doublures, la lecture et la
+validation du CSV sont les vraies.
+"""
+import io
+
+import pytest
+
+import ingestion
+from ingestion import PensionerDbSink, iter_participants
+from models.pensioner_model import LocalInfileUnavailable, Pensioner
+
+CSV = (b"type_id,valeur_id,devise,montant,nom_complet\n"
+       b"MSISDN,22997000001,XOF,1000,Awa Kone\n"
+       b"MSISDN,abc,XOF,1000,Ligne refusee\n"
+       b"MSISDN,22997000002,XOF,2000,Ali Diallo\n"
+       b"MSISDN,22997000003,XOF,3000,Eva Sow\n")
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Insertion simulée : la ligne de MSISDN 22997000003 est refusée par la base."""
+    inserted = []
+
+    def create_many(rows, batch_id=None, chunk_size=1000):
+        failed = []
+        for index, row in enumerate(rows):
+            if row["msisdn"] == "22997000003":
+                failed.append({"index": index, "unique_id": row["unique_id"], "error": "unique_id déjà existant"})
+            else:
+                inserted.append(row)
+        return {"inserted": len(inserted), "failed": failed}
+
+    def bulk_load(path, batch_code, initiated_by="admin"):
+        raise LocalInfileUnavailable("désactivé")
+
+    monkeypatch.setattr(ingestion.Batch, "create", staticmethod(lambda *args: 1))
+    monkeypatch.setattr(ingestion.Batch, "delete", staticmethod(lambda batch_id: None))
+    monkeypatch.setattr(Pensioner, "create_many", staticmethod(create_many))
+    monkeypatch.setattr(Pensioner, "bulk_load", staticmethod(bulk_load))
+    return inserted
+
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_errors_point_at_file_rows(database, tmp_path, bulk):
+    stats = {"total": 0, "valid": 0, "refused": 0}
+    sink = PensionerDbSink("LOT", bulk=bulk, work_dir=str(tmp_path))
+    summary = sink.write_batch(iter_participants(io.BytesIO(CSV), stats))
+
+    assert stats == {"total": 4, "valid": 3, "refused": 1}
+    assert [row["msisdn"] for row in database] == ["22997000001", "22997000002"]
+    assert summary["participants_failed"] == 1
+    # Quatrième ligne du fichier, et non troisième ligne valide
+    assert summary["errors"] == [{"index": 3, "unique_id": "MSISDN-22997000003", "error": "unique_id déjà existant"}]
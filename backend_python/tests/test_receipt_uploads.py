@@ -0,0 +1,285 @@
+# tests/test_receipt_uploads.py
+"""
+Envoi des reçus d'un lot (receipt_uploads.UploadJobs) contre le serveur local
+du banc d'essai (benchmarks/bench_receipt_uploads.StandInCloudinary), qui tient
+lieu de l'API d'envoi de Cloudinary. Magasin de lots et index des envois dans
+des répertoires temporaires ; pour un lot de la base, Batch et Pensioner sont
+remplacés par des doublures et le lot est importé par la vraie lecture du CSV.
+"""
+import io
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import ThreadingHTTPServer
+from types import SimpleNamespace
+
+import cloudinary
+import cloudinary.uploader
+import pytest
+
+import batch_store
+import ingestion
+import receipt_cache
+import receipt_uploads
+from batch_store import BatchStore
+from benchmarks.bench_receipt_uploads import StandInCloudinary, make_participants
+from config import Config
+from ingestion import PensionerDbSink, iter_participants
+from models.batch_model import Batch
+from models.pensioner_model import Pensioner
+from receipt_cache import ReceiptCache
+from receipt_uploads import MAX_CONSECUTIVE_FAILURES, UploadJobs
+
+
+class Interrupted(BaseException):
+    """Arrêt brutal du processus simulé (n'est pas rattrapé comme une erreur d'envoi)."""
+
+
+@pytest.fixture
+def server():
+    """Serveur d'envoi neuf : compteurs à zéro, sans latence ni 503."""
+    handler = type("Server", (StandInCloudinary,), {"latency": 0, "failure_rate": 0, "requests": 0,
+                                                    "failures": 0, "stored": set()})
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    cloudinary.config(cloud_name="test", api_key="test", api_secret="test", secure=True,
+                      upload_prefix=f"http://127.0.0.1:{http_server.server_port}")
+    yield handler
+    http_server.shutdown()
+    http_server.server_close()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = BatchStore(str(tmp_path / "batches"))
+    monkeypatch.setattr(batch_store, "_store", store)
+    monkeypatch.setattr(receipt_cache, "_cache", ReceiptCache(None, 0, 0))
+    monkeypatch.setattr(Config, "UPLOAD_BACKOFF", 0.001)
+    return store
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    started = []
+
+    def start():
+        manager = UploadJobs(str(tmp_path / "uploads"), 4)
+        started.append(manager)
+        return manager
+
+    yield start
+    for manager in started:
+        manager._coordinator.shutdown(wait=True)
+        manager._uploads.shutdown(wait=True)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """Tables pensioners et transfer en mémoire ; Batch.iter_transfers en fait la jointure."""
+    tables = SimpleNamespace(pensioners=[], transfers={})
+    batch = SimpleNamespace(id=1, batch_code="LOT-DB", success_count=0)
+
+    def create_many(rows, batch_id=None, chunk_size=1000):
+        rows = list(rows)
+        for row in rows:
+            tables.pensioners.append(dict(row, id=len(tables.pensioners) + 1, status="pending",
+                                          home_transaction_id=None, batch_id=batch_id))
+        return {"inserted": len(rows), "failed": []}
+
+    def iter_transfers(batch_id, fetch_size=1000, after_id=0):
+        for pensioner in tables.pensioners:
+            transfer = tables.transfers.get(pensioner["home_transaction_id"])
+            if (pensioner["batch_id"] == batch_id and pensioner["status"] == "success" and transfer
+                    and pensioner["id"] > after_id):
+                yield dict(transfer, pensioner_id=pensioner["id"], first_name=pensioner["first_name"],
+                           last_name=pensioner["last_name"], msisdn=pensioner["msisdn"])
+
+    monkeypatch.setattr(ingestion.Batch, "create", staticmethod(lambda *args: batch.id))
+    monkeypatch.setattr(Pensioner, "create_many", staticmethod(create_many))
+    monkeypatch.setattr(Batch, "get_by_batch_code",
+                        staticmethod(lambda code: batch if code == batch.batch_code else None))
+    monkeypatch.setattr(Batch, "iter_transfers", staticmethod(iter_transfers))
+    tables.batch = batch
+    return tables
+
+
+def pay(database, pensioner_id, state="COMPLETED"):
+    """Paiement enregistré comme par l'application : pensionné en 'success' et son virement dans la table transfer."""
+    pensioner = database.pensioners[pensioner_id - 1]
+    home_transaction_id = f"HT-{pensioner_id:04d}"
+    pensioner.update(status="success", home_transaction_id=home_transaction_id)
+    database.batch.success_count += 1
+    database.transfers[home_transaction_id] = {
+        "transfer_id": f"TR-{pensioner_id:04d}", "home_transaction_id": home_transaction_id,
+        "payer_name": "Caisse de retraite", "payer_id_type": "MSISDN", "payer_id_value": "22990000000",
+        "payee_id_type": pensioner["type_id"], "payee_id_value": pensioner["msisdn"], "payee_fsp_id": "fsp-a",
+        "payee_first_name": None, "payee_last_name": None, "amount": pensioner["amount"],
+        "currency": pensioner["currency"], "note": None, "status": state,
+        "initiated_at": datetime(2026, 10, 1, 9), "completed_at": datetime(2026, 10, 1, 9, 1)}
+
+
+def wait(manager, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = manager.status(job_id)
+        if state["status"] in receipt_uploads.TERMINAL_STATUSES:
+            return state
+        time.sleep(0.01)
+    raise AssertionError(f"tâche {job_id} non terminée après {timeout} s")
+
+
+def paid_lines(count, start=0):
+    return [line for line, participant in enumerate(make_participants(count))
+            if line >= start and "transfer" in participant]
+
+
+def test_receipts_and_summary_written_back(server, store, jobs):
+    store.append_batch(make_participants(30), "LOT")
+    sdk_http = cloudinary.uploader._http
+    state = wait(manager := jobs(), manager.submit("LOT")["job_id"])
+
+    paid = paid_lines(30)
+    # Pool de connexions propre aux envois : le client global du SDK n'est pas remplacé
+    assert cloudinary.uploader._http is sdk_http
+    assert state["status"] == "completed"
+    assert state["progress"] == 1.0
+    assert state["receipts_uploaded"] == len(paid)
+    assert state["receipts_skipped"] == 30 - len(paid)
+    assert server.requests == len(paid) + 1
+
+    participants = list(store.iter_participants("LOT"))
+    for line, participant in enumerate(participants):
+        if line in paid:
+            assert participant["receipt"].endswith(f"/receipts/{participant['receipt_hash']}.pdf")
+        else:
+            assert participant.get("receipt") is None
+    assert len({participant["receipt"] for participant in participants if participant.get("receipt")}) == len(paid)
+    assert state["summary_pdf_url"] is not None
+    assert store.get("LOT")["summary_pdf_url"] == state["summary_pdf_url"]
+
+
+def test_second_run_sends_nothing(server, store, jobs):
+    store.append_batch(make_participants(30), "LOT")
+    manager = jobs()
+    first = wait(manager, manager.submit("LOT")["job_id"])
+    requests = server.requests
+
+    second = wait(manager, manager.submit("LOT")["job_id"])
+    assert server.requests == requests
+    assert second["status"] == "completed"
+    assert second["receipts_uploaded"] == 0
+    assert second["receipts_deduplicated"] == first["receipts_uploaded"]
+    assert second["summary_pdf_url"] == first["summary_pdf_url"]
+
+
+def test_unavailable_responses_are_retried(server, store, jobs, monkeypatch):
+    # Le premier envoi de chaque PDF reçoit un 503
+    refused = set()
+
+    def fails(self, fields):
+        first = fields["public_id"] not in refused
+        refused.add(fields["public_id"])
+        return first
+
+    monkeypatch.setattr(server, "fails", fails)
+    monkeypatch.setattr(Config, "UPLOAD_RETRIES", 2)
+    store.append_batch(make_participants(30), "LOT")
+    state = wait(manager := jobs(), manager.submit("LOT")["job_id"])
+
+    paid = paid_lines(30)
+    assert state["status"] == "completed"
+    assert state["receipts_failed"] == 0
+    assert state["receipts_uploaded"] == len(paid)
+    assert server.failures == len(paid) + 1
+    assert server.requests == 2 * (len(paid) + 1)
+
+
+def test_job_fails_after_consecutive_failures(server, store, jobs, monkeypatch):
+    server.failure_rate = 1
+    monkeypatch.setattr(Config, "UPLOAD_RETRIES", 1)
+    store.append_batch(make_participants(100), "LOT")
+    state = wait(manager := jobs(), manager.submit("LOT")["job_id"])
+
+    assert state["status"] == "failed"
+    assert "injoignable" in state["error"]
+    assert state["receipts_failed"] == MAX_CONSECUTIVE_FAILURES
+    assert server.requests >= 2 * MAX_CONSECUTIVE_FAILURES
+    assert state["summary_pdf_url"] is None
+    assert not any(participant.get("receipt") for participant in store.iter_participants("LOT"))
+
+
+def test_interrupted_job_resumes_from_lines_done(server, store, jobs, monkeypatch):
+    monkeypatch.setattr(Config, "UPLOAD_WRITEBACK", 5)
+    store.append_batch(make_participants(60), "LOT")
+    flush = UploadJobs._flush
+    flushes = []
+
+    def interrupted_flush(self, state, journal, done):
+        flushes.append(state["lines_done"])
+        if len(flushes) == 3:
+            raise Interrupted()
+        flush(self, state, journal, done)
+
+    monkeypatch.setattr(UploadJobs, "_flush", interrupted_flush)
+    manager = jobs()
+    job_id = manager.submit("LOT")["job_id"]
+    # Fin du « processus » : tâche interrompue, envois en vol terminés
+    manager._coordinator.shutdown(wait=True)
+    manager._uploads.shutdown(wait=True)
+    saved = manager._load(job_id)
+    assert saved["status"] == "running"
+    assert 0 < saved["lines_done"] < 60
+    monkeypatch.setattr(UploadJobs, "_flush", flush)
+    requests = server.requests
+
+    restarted = jobs()
+    assert restarted.resume() == 1
+    state = wait(restarted, job_id)
+
+    paid = paid_lines(60)
+    assert state["status"] == "completed"
+    # Seules les lignes après le dernier paquet enregistré sont renvoyées (plus le récapitulatif)
+    assert server.requests - requests == len(paid_lines(60, saved["lines_done"])) + 1
+    assert state["receipts_uploaded"] == len(paid)
+    assert state["receipts_skipped"] == 60 - len(paid)
+    assert sum(1 for participant in store.iter_participants("LOT") if participant.get("receipt")) == len(paid)
+
+
+def test_db_batch_receipts_for_recorded_payments(server, store, jobs, database):
+    csv = "type_id,valeur_id,devise,montant,nom_complet\n" + "".join(
+        f"MSISDN,2299700{i:04d},XOF,{1000 + i},Pensionne {i}\n" for i in range(40))
+    stats = {"total": 0, "valid": 0, "refused": 0}
+    PensionerDbSink("LOT-DB").write_batch(iter_participants(io.BytesIO(csv.encode()), stats))
+    assert len(database.pensioners) == 40
+    for pensioner_id in range(1, 41, 3):
+        pay(database, pensioner_id)
+    # Virement pas encore abouti : pas de reçu
+    pay(database, 2, state="RESERVED")
+
+    manager = jobs()
+    state = wait(manager, manager.submit("LOT-DB", source="db")["job_id"])
+
+    paid = list(range(1, 41, 3))
+    assert state["status"] == "completed"
+    assert state["receipts_uploaded"] == len(paid)
+    assert state["receipts_skipped"] == 1
+    assert server.requests == len(paid)
+    assert state["summary_pdf_url"] is None
+    with open(state["receipts_file"], encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [entry["line"] for entry in entries] == paid
+    assert len({entry["url"] for entry in entries}) == len(paid)
+
+    # Nouveaux paiements : seuls leurs reçus sont envoyés
+    pay(database, 3)
+    second = wait(manager, manager.submit("LOT-DB", source="db")["job_id"])
+    assert second["receipts_uploaded"] == 1
+    assert second["receipts_deduplicated"] == len(paid)
+    assert server.requests == len(paid) + 1
+
+
+def test_unknown_db_batch(store, jobs, database):
+    with pytest.raises(LookupError):
+        jobs().submit("LOT-INCONNU", source="db")
@@ -0,0 +1,180 @@
+# validation.py
+"""
+Validation des lignes des fichiers de paiement, colonne par colonne avec
+pandas/NumPy plutôt que ligne par ligne en Python.
+
+Chaque contrôle produit un masque booléen sur tout le tableau ; les erreurs
+d'une ligne sont cumulées dans un entier (un bit par code d'erreur), puis
+traduites en liste de codes pour les seules lignes refusées.
+
+Contrôles (les colonnes absentes du fichier ne sont pas contrôlées) :
+- EMPTY_FIELD : au moins une cellule vide ;
+- MSISDN_INVALID : msisdn / valeur_id hors du format Config.MSISDN_PATTERN
+  (seulement pour les lignes dont type_id vaut MSISDN, s'il est renseigné) ;
+- AMOUNT_INVALID / AMOUNT_NOT_POSITIVE : amount / montant non numérique ou <= 0 ;
+- CURRENCY_INVALID : currency / devise hors de Config.ALLOWED_CURRENCIES ;
+- DUPLICATE_UNIQUE_ID : unique_id (ou type_id-msisdn) déjà vu dans le fichier ;
+- DUPLICATE_PAYMENT : unique_id ou msisdn déjà payé dans un autre lot de la
+  même période (posé par beneficiary_index.PaymentCheck, pas par CsvValidator).
+
+Utilisé par l'import en continu (ingestion.iter_participants, par paquets de
+lignes), par l'import parallèle (parallel_ingestion.py) et par
+filetojson.SimpleCsvReaderController.
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from config import Config
+
+EMPTY_FIELD = "EMPTY_FIELD"
+MSISDN_INVALID = "MSISDN_INVALID"
+AMOUNT_INVALID = "AMOUNT_INVALID"
+AMOUNT_NOT_POSITIVE = "AMOUNT_NOT_POSITIVE"
+CURRENCY_INVALID = "CURRENCY_INVALID"
+DUPLICATE_UNIQUE_ID = "DUPLICATE_UNIQUE_ID"
+DUPLICATE_PAYMENT = "DUPLICATE_PAYMENT"
+
+# Position du bit de chaque code dans le masque d'erreurs
+ERROR_CODES = (EMPTY_FIELD, MSISDN_INVALID, AMOUNT_INVALID, AMOUNT_NOT_POSITIVE, CURRENCY_INVALID, DUPLICATE_UNIQUE_ID,
+               DUPLICATE_PAYMENT)
+_BITS = {code: np.uint8(1 << position) for position, code in enumerate(ERROR_CODES)}
+
+# Montant décimal, avec point ou virgule
+_AMOUNT_PATTERN = r"[+-]?(\d+([.,]\d*)?|[.,]\d+)"
+
+# Noms de colonnes acceptés : table pensioners ou fichier de paiement
+_ALIASES = {
+    "msisdn": ("msisdn", "valeur_id"),
+    "amount": ("amount", "montant"),
+    "currency": ("currency", "devise"),
+}
+
+
+@lru_cache(maxsize=None)
+def decode(mask):
+    """Codes d'erreur d'un masque, en tuple partagé entre les lignes (0 -> tuple vide)."""
+    return tuple(code for position, code in enumerate(ERROR_CODES) if mask & (1 << position))
+
+
+def _column(frame, name):
+    for alias in _ALIASES.get(name, (name,)):
+        if alias in frame.columns:
+            return frame[alias]
+    return None
+
+
+def identity_columns(text):
+    """(type_id, msisdn, unique_id) d'un tableau de texte (CsvValidator._text) ; None pour une colonne absente.
+
+    Sans colonne unique_id, il vaut type_id-msisdn, comme dans
+    Pensioner.upsert_many (ingestion.to_pensioner_row), et "" si msisdn est vide.
+    """
+    msisdn = _column(text, "msisdn")
+    type_id = _column(text, "type_id")
+    unique_id = _column(text, "unique_id")
+    if unique_id is None and msisdn is not None:
+        unique_id = (type_id if type_id is not None else "None") + "-" + msisdn
+        unique_id = unique_id.where(msisdn != "", "")
+    return type_id, msisdn, unique_id
+
+
+def key_hashes(keys):
+    """Empreintes 64 bits des clés (Series de texte) et masque des clés renseignées."""
+    present = (keys != "").to_numpy()
+    return pd.util.hash_pandas_object(keys, index=False, categorize=False).to_numpy(), present
+
+
+class DuplicateIndex:
+    """Empreintes des clés déjà vues, triées, pour détecter les doublons paquet après paquet.
+
+    Une collision entre deux clés différentes est négligeable (~n²/2^65).
+    """
+
+    def __init__(self):
+        self._seen = np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, hashes, present):
+        """Masque des clés déjà vues (plus haut dans `hashes` ou dans un appel précédent), puis les retient."""
+        duplicated = pd.Series(hashes).duplicated().to_numpy() & present
+        if len(self._seen):
+            # Recherche dichotomique dans les empreintes triées des paquets précédents
+            positions = np.searchsorted(self._seen, hashes).clip(max=len(self._seen) - 1)
+            duplicated |= present & (self._seen[positions] == hashes)
+        new = np.sort(hashes[present & ~duplicated])
+        # Deux suites déjà triées : le tri stable (timsort) les fusionne en temps linéaire
+        self._seen = np.concatenate((self._seen, new))
+        self._seen.sort(kind="stable")
+        return duplicated
+
+
+class CsvValidator:
+    """Moteur de validation d'un fichier, appliqué à un DataFrame ou à ses paquets successifs.
+
+    L'instance garde les empreintes des unique_id déjà vus : un doublon est
+    détecté même s'il est dans un paquet différent. Utiliser une instance par fichier.
+    """
+
+    def __init__(self, allowed_currencies=None, msisdn_pattern=None):
+        self.allowed_currencies = [currency.upper() for currency in (allowed_currencies or Config.ALLOWED_CURRENCIES)]
+        self.msisdn_pattern = msisdn_pattern or Config.MSISDN_PATTERN
+        self.duplicates = DuplicateIndex()
+
+    @staticmethod
+    def _text(frame):
+        """Cellules en texte sans espaces autour ; les valeurs manquantes deviennent ""."""
+        return frame.fillna("").astype(str).apply(lambda column: column.str.strip())
+
+    def validate(self, frame):
+        """Retourne le masque d'erreurs (np.uint8, un par ligne) de `frame`. 0 = ligne valide."""
+        return self.validate_with_keys(frame)[0]
+
+    def validate_with_keys(self, frame):
+        """Comme validate, mais retourne (masques, empreintes des unique_id, masque des unique_id renseignés).
+
+        Les empreintes (None si le fichier n'a pas de quoi former un unique_id)
+        servent à fusionner la détection des doublons de paquets validés à part.
+        """
+        text = self._text(frame)
+        masks = np.zeros(len(text), dtype=np.uint8)
+        if text.empty:
+            return masks, None, None
+
+        masks[(text == "").any(axis=1).to_numpy()] |= _BITS[EMPTY_FIELD]
+
+        type_id, msisdn, unique_id = identity_columns(text)
+        if msisdn is not None:
+            checked = msisdn != ""
+            if type_id is not None:
+                checked &= type_id.str.upper().isin(("MSISDN", ""))
+            invalid = checked & ~msisdn.str.fullmatch(self.msisdn_pattern)
+            masks[invalid.to_numpy()] |= _BITS[MSISDN_INVALID]
+
+        amount = _column(text, "amount")
+        if amount is not None:
+            # Format contrôlé par expression régulière puis conversion en bloc
+            # (bien plus rapide que pd.to_numeric(errors="coerce") sur du texte)
+            present = (amount != "").to_numpy()
+            is_number = amount.str.fullmatch(_AMOUNT_PATTERN).to_numpy(dtype=bool)
+            numbers = amount.where(is_number, "0").str.replace(",", ".", regex=False).astype("float64").to_numpy()
+            masks[present & ~is_number] |= _BITS[AMOUNT_INVALID]
+            masks[is_number & (numbers <= 0)] |= _BITS[AMOUNT_NOT_POSITIVE]
+
+        currency = _column(text, "currency")
+        if currency is not None:
+            invalid = (currency != "") & ~currency.str.upper().isin(self.allowed_currencies)
+            masks[invalid.to_numpy()] |= _BITS[CURRENCY_INVALID]
+
+        if unique_id is None:
+            return masks, None, None
+        hashes, present = key_hashes(unique_id)
+        masks[self.duplicates.add(hashes, present)] |= _BITS[DUPLICATE_UNIQUE_ID]
+        return masks, hashes, present
+
+    def errors(self, frame):
+        """Codes d'erreur de chaque ligne de `frame` (tuple vide si la ligne est valide)."""
+        return [decode(mask) for mask in self.validate(frame).tolist()]